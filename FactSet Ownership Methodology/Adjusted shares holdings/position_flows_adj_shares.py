@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Quarter-to-quarter changes of the adjusted shares holdings (flows)
+
+For every holder-security-quarter I compare the adjusted shares held with
+the previous quarter and classify the change as a new position (NEW), an
+exit (EXIT), an increase (INCREASE) or a decrease (DECREASE). A holder
+that has no position in a quarter after holding the security in the
+previous quarter has exited (zero position).
+
+The holdings are processed by ranges of quarters (FACTSET_PERIOD_SHARDS)
+sorted by holder and security, so the previous quarter of a position is
+the previous row (see factset_ownership/flows.py).
+
+Input:
+    factset_adj_shares_holdings\date_q=*\*.parquet
+
+Output:
+    factset_adj_shares_flows\date_q=*\*.parquet
+"""
+
+
+import os
+import sys
+
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from factset_ownership import write_flows
+
+
+# ~~~~~~~~~~~~~
+# DIRECTORIES 
+# ~~~~~~~~~~~~~
+
+# Current directory
+cd = r'C:\Users\FMCC\Desktop\Ioannis'
+
+# Parquet Factset tables
+factset_dir =  r'C:\FactSet_Downloadfiles\zips\parquet'
+
+
+# ~~~~~~~~~~~~~~~~~~~~
+#   FLOWS AND SAVE
+# ~~~~~~~~~~~~~~~~~~~~
+
+# Flows of every quarter (but the first) streamed into the dataset
+# partitioned by 'date_q'
+flows_count = write_flows(cd)
+
+
+# Number of flows per quarter and type
+flows_count.to_pandas().pivot(index='date_q', columns='FLOW_TYPE', values='len').plot()
@@ -23,6 +23,10 @@ Adjusted shares are used because adjusted positions can be used
 in quarter-to-quarter analysis for the calculation of other variables in
 an apples-to-apples setting.
 
+Input:
+    positions_ledger (build_positions_ledger.py)
+    scheme_securities (build_positions_ledger.py)
+
 Output:
     scheme_4_adj_shares_held.parquet
 
@@ -31,19 +35,28 @@ Output:
 
 
 import os
+import sys
 import polars as pl
-import pandas as pd
-
-def any_duplicates(df, unique_cols):
-    a = df.shape[0]
-    b = df.unique(unique_cols).shape[0]
-    print('Before unique: %d \n' % a )
 
-    print('After unique: %d \n' %  b )
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from factset_ownership import (latest_observation,
+                               acc,
+                               to_storage,
+                               candidate_positions,
+                               resolve_positions,
+                               SOURCE_STAKES,
+                               SOURCE_FUNDS,
+                               POLICY_SCHEME_4,
+                               scan_ledger,
+                               latest_within_window,
+                               window_quarters,
+                               WINDOW_MONTHS_UKSR,
+                               frequency_name,
+                               period_range,
+                               shard_name,
+                               scheme_securities)
 
-    print('Difference: %d' %(a-b))
-    
-main_cols = ['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q']
 
 
 
@@ -53,104 +66,15 @@ cd = r'C:\Users\FMCC\Desktop\Ioannis'
 # Parquet Factset tables
 factset_dir =  r'C:\FactSet_Downloadfiles\zips\parquet'
 
-# 13F filings
-own_inst_13f_dir = os.path.join(factset_dir, 'own_inst_eq_v5_full')
-
-# Stakes based sources including UKSR, RNS, 13D/G's, proxies, etc.
-own_stakes_dir = os.path.join(factset_dir, 'own_stakes_eq_v5_full')
-
-# Sum of Fund holdings
-own_funds_dir = os.path.join(factset_dir, 'own_fund_eq_v5_full')
-
-
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#   APPLY QUARTER SCHEME
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-def apply_quarter_scheme(df, date_col):
-    
-    # Col_names
-    df_col_names = df.columns
-    
-    df = df.with_columns(
-        pl.col(date_col).dt.strftime('%Y%m').alias('yyyymm').cast(pl.Int32),
-        )
-    
-    df =  df.with_columns(
-        (pl.col('yyyymm')% 100).alias('month'),
-        (pl.col('yyyymm')/100).floor().cast(pl.Int32).alias('year')
-        )
-    # Define quarter 'date_q' in integer format
-    df = df.with_columns(
-        pl.when(pl.col('month')<=3)
-        .then(3)
-        .when((pl.col('month')>3) & (pl.col('month')<=6))
-        .then(6)
-        .when((pl.col('month')>6) & (pl.col('month')<=9))
-        .then(9)
-        .otherwise(12)
-        .alias('month_q')
-        )
-    
-    df =  df.with_columns(
-        (pl.col('year')*100 + pl.col('month_q')).alias('date_q')
-        ).select(df_col_names + ['date_q'])   
-   
-    return df
-
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #        IMPORT DATA
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Import own_ent_institutions table
-own_ent_inst = pl.read_parquet(os.path.join(factset_dir, 'own_ent_institutions.parquet'),
-                               use_pyarrow=True)
-
-# Import own_sec_coverage table
-own_sec_cov = pl.read_parquet(os.path.join(factset_dir, 'own_sec_coverage_eq.parquet'),
-                              use_pyarrow=True)
-
-# Import own_ent_funds table 
-own_ent_funds = pl.read_parquet(os.path.join(factset_dir, 'own_ent_funds.parquet'),
-                                use_pyarrow=True)
-# the table is used to match a Fund to the Institution that manages it
-own_ent_funds = ( 
-            own_ent_funds
-            .select(['FACTSET_FUND_ID', 'FACTSET_INST_ENTITY_ID'])
-            .rename({'FACTSET_INST_ENTITY_ID': 'FACTSET_ENTITY_ID'})
-            )
-
-
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#    FORMAT OWN_INST_STAKES TABLE
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-own_inst_stakes = pl.read_parquet(os.path.join(own_inst_13f_dir, 'own_inst_stakes_detail_eq.parquet'),
-                             use_pyarrow=True)
-
-# Define quarter date 'date_q'
-own_inst_stakes = apply_quarter_scheme(own_inst_stakes, 'AS_OF_DATE')
-
-# Keep only positive positions
-own_inst_stakes = own_inst_stakes.filter(pl.col('POSITION')>0)
-
-# Isolate columns for Scheme 4 (UKSR securities)
-own_inst_stakes_uksr =  own_inst_stakes.select(['FSYM_ID',
-                                            'FACTSET_ENTITY_ID',
-                                            'AS_OF_DATE',
-                                            'SOURCE_CODE',
-                                            'POSITION',
-                                            'date_q'])
-
-# Isoalate columns for Scheme 1, 2, 3
-own_inst_stakes =  own_inst_stakes.select(['FSYM_ID',
-                                            'FACTSET_ENTITY_ID',
-                                            'AS_OF_DATE',
-                                            'POSITION',
-                                            'date_q'])
+# 13F, stakes and funds positions come from the positions ledger and the
+# securities of the scheme from the classification table
+# (build_positions_ledger.py)
 
 
 
@@ -163,219 +87,55 @@ own_inst_stakes =  own_inst_stakes.select(['FSYM_ID',
 print('UKSR securities - SCHEME 4 (ADJ SHARES HELD) \n')
 
 
-# UKSR securities
-security_uksr = own_sec_cov.filter(pl.col('FDS_UKSR_FLAG') == 1) 
-security_uksr_set = set(security_uksr['FSYM_ID'])
+# UKSR securities (of the shard)
+security_uksr = scheme_securities(cd, 4)
 
 # Source code for Stakes
 source_code_uksr = set(['W', 'Q', 'H'])
 
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#     MASTER DATAFRAME - SETTING UP THE SECURITY+HOLDER+QUARTER PAIR
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-# Define a master dataframe for scheme 4 (similar to scheme 3)
-# The master dataframe will have as rows all combinations of
-# institutions + UKSR securities + quarter dates
-
-# Quarter dates (including 202312 and excluding 202403)
-date_range = pd.date_range(start = pd.to_datetime('198809', format='%Y%m'), 
-                         end   = pd.to_datetime('202406', format='%Y%m'), 
-                         freq  = 'Q')
-
-date_range_int = [int(x.strftime('%Y%m')) for x in date_range]
-quarters_pl = pl.DataFrame({'date_q' :date_range_int }).cast(pl.Int32)
-
-
-# First I need to find all the valid holder + security combinations
-# and then then expand on quarter dates 
-
-# ----------------
-#  STAKES table
-# --------------
-
-# Finding the valid holder-securities pairs from Stakes Table
-# Filter for UKSR security + any holder
-stakes_pairs = (
-    own_inst_stakes_uksr.filter(
-    pl.col('FSYM_ID').is_in(security_uksr_set) &
-    pl.col('SOURCE_CODE').is_in(source_code_uksr)
-    )
-    .unique(['FSYM_ID', 'FACTSET_ENTITY_ID'])
-    .select(['FSYM_ID', 'FACTSET_ENTITY_ID'])
-    )
-
-
-# -----------------
-#   SUM OF FUNDS table
-# -----------------------
-
-
-# Finding the valid holder-securities pairs from Funds Tables
-funds_pairs = pl.DataFrame()
-
-# Iterate through Sum of Funds datasets
-for dataset in os.listdir(own_funds_dir):
-    
-    print('%s is processed. \n' % dataset)
-    
-    # Import sum of funds dataset
-    own_fund = pl.read_parquet(os.path.join(own_funds_dir, dataset),
-                               use_pyarrow=True)
-    
-    # Keep positive positions
-    own_fund = own_fund.filter(pl.col('REPORTED_HOLDING')>0)
-    
-    
-    # Merge Fund with Institution that manages the Fund
-    own_fund = own_fund.join(own_ent_funds, 
-                             how='inner',
-                             on='FACTSET_FUND_ID')
-
-    # Filter 
-    funds_pairs_ =  (
-        own_fund.filter(
-        pl.col('FSYM_ID').is_in(security_uksr_set) 
-        )
-        .unique(['FSYM_ID', 'FACTSET_ENTITY_ID'])
-        .select(['FSYM_ID', 'FACTSET_ENTITY_ID'])
-        )
-        
-    # Concat
-    funds_pairs = pl.concat([funds_pairs, funds_pairs_])
-    
-    
-# Concat and keep unique pairs
-funds_pairs = funds_pairs.unique()
-
-# All unique pairs
-valid_pairs = pl.concat([stakes_pairs, funds_pairs]).unique()
-
-# Initialize scheme 4 dataframe
-scheme_4 = valid_pairs.join(quarters_pl, how='cross')
-
-# Free memory
-del stakes_pairs, funds_pairs
-
-
-
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #   POSITIIONS FROM STAKES TABLE
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-
-# Filter for UKSR securities
-stakes_positions = own_inst_stakes_uksr.filter(
-    pl.col('FSYM_ID').is_in(security_uksr_set) &
-    pl.col('SOURCE_CODE').is_in(source_code_uksr)
+# Positive stakes positions
+# Filter for UKSR security + UKSR or RNS source + any holder
+stakes_positions = (
+    scan_ledger(cd, sources=[SOURCE_STAKES])
+    .join(security_uksr, how='semi', on='FSYM_ID')
+    .filter(pl.col('SOURCE_CODE').is_in(source_code_uksr) &
+            pl.col('POSITIVE_SHARES'))
+    .select(['FSYM_ID',
+             'FACTSET_ENTITY_ID',
+             'date_q',
+             'AS_OF_DATE',
+             pl.col('ADJ_SHARES').alias('ADJ_SHARES_HELD_STAKES')])
+    .collect()
     )
 
-
-    
-
 # Keep only the most recent 'AS_OF_DATE' observation within quarter
-stakes_positions = ( 
-    stakes_positions
-    .group_by(['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'])
-    .agg(pl.all().sort_by('AS_OF_DATE').last())
-    )
-
-# Re-order and keep cols
-stakes_positions = ( 
-                    stakes_positions
-                    .select(['FSYM_ID',
-                            'FACTSET_ENTITY_ID',
-                            'AS_OF_DATE',
-                            'POSITION',
-                            'date_q'])
-                    .drop_nulls()
-                    )
-
-
-# Rename
-stakes_positions = stakes_positions.rename({'POSITION' : 'ADJ_SHARES_HELD_STAKES'})
-
-
+# (over all stakes sources)
+stakes_positions = latest_observation(stakes_positions,
+                                      ['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'],
+                                      'AS_OF_DATE')
 
-# -----------------------------------------------------
-#           MERGE WITH MASTER DATAFRAME
-# -----------------------------------------------------
-
-
-scheme_4 = scheme_4.join(stakes_positions, how='left',
-                         on=['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'])
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #    POSITIONS FROM FUNDS TABLE
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Define DataFrame to store
-funds_positions = pl.DataFrame()
-
-
-# Iterate through Sum of Funds datasets
-for dataset in os.listdir(own_funds_dir):
-    
-    print('%s is processed. \n' % dataset)
-    
-    # Import sum of funds dataset
-    own_fund = pl.read_parquet(os.path.join(own_funds_dir, dataset),
-                               use_pyarrow=True)
-    
-    # Keep positive positions
-    own_fund = own_fund.filter(pl.col('REPORTED_HOLDING')>0)
-    
-    
-    # Merge Fund with Institution that manages the Fund
-    own_fund = own_fund.join(own_ent_funds, 
-                             how='inner',
-                             on='FACTSET_FUND_ID')
-    
-
-    # Filter for UKSR securites
-    own_fund_ =  own_fund.filter(
-        pl.col('FSYM_ID').is_in(security_uksr_set) 
-        )
-    
-    # Define quarter
-    own_fund_ = apply_quarter_scheme(own_fund_, 'REPORT_DATE')
-    
-    # Keep only the most recent 'REPORT_DATE' within a quarter for
-    # a security-fund pair
-    own_fund_ = ( 
-        own_fund_
-        .sort(['FSYM_ID', 'FACTSET_FUND_ID', 'date_q', 'REPORT_DATE'])
-        .group_by(['FSYM_ID', 'FACTSET_FUND_ID', 'date_q'])
-        .agg(pl.all().sort_by('REPORT_DATE').last())
-        )
-    
-    own_fund_ = own_fund_.select(['FSYM_ID',
-                                  'FACTSET_ENTITY_ID',
-                                  'REPORT_DATE',
-                                  'date_q',
-                                  'ADJ_HOLDING'])
-    
-    
-    # Sum the position of an institution for each security within a quarter
-    own_fund_inst = ( 
-        own_fund_
-        .group_by(['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'])
-        .agg(pl.col('ADJ_HOLDING').sum())
-        )
-    
-    # Concat 
-    funds_positions = pl.concat([funds_positions, own_fund_inst])
- 
-    
-# Sum positions again because a security in a quarter that belongs to a different
-# fund  under the same institution might appear in a different own_fund_eq table 
-funds_positions = ( 
-    funds_positions
+# Positive sum of funds positions
+# Filter for UKSR security + any holder
+# Sum the positions of the funds of an institution for each security
+# within a quarter.
+funds_positions = (
+    scan_ledger(cd, sources=[SOURCE_FUNDS])
+    .join(security_uksr, how='semi', on='FSYM_ID')
+    .filter(pl.col('POSITIVE_SHARES'))
     .group_by(['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'])
-    .agg(pl.col('ADJ_HOLDING').sum())
-    )  
-
+    .agg(acc('ADJ_SHARES').sum().alias('ADJ_HOLDING'))
+    .collect()
+    )
 
 # Zero adjusted positions are null
 funds_positions = funds_positions.with_columns(
@@ -390,46 +150,56 @@ funds_positions = funds_positions.drop_nulls(['ADJ_HOLDING'])
 # Rename
 funds_positions = funds_positions.rename({'ADJ_HOLDING' : 'ADJ_SHARES_HELD_FUNDS'})
 
-  
-    
 
 
-# -----------------------------------------------------
-#           MERGE WITH MASTER DATAFRAME
-# -----------------------------------------------------
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#     MASTER DATAFRAME - SETTING UP THE SECURITY+HOLDER+QUARTER PAIR
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-scheme_4 = scheme_4.join(funds_positions, how='left',
-                         on=['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'])
+# The master dataframe has as rows the combinations of
+# institutions + UKSR securities + quarter dates
+# where a stakes position can still be within its window or there is a
+# funds position. It grows with the positions and not with all the
+# holder-security pairs times all the quarters.
+
+# Quarter dates (up to 202403; months with FACTSET_FREQUENCY=monthly)
+quarters_pl = period_range(198809, 202403)
+
+scheme_4 = (
+    pl.concat([window_quarters(stakes_positions, WINDOW_MONTHS_UKSR),
+               funds_positions.select(['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'])])
+    .unique()
+    .join(quarters_pl, how='semi', on='date_q')
+    )
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #           WINDOW OF 18 MONTHS FOR UKSR SECURITIES 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Compare the perspective date to the as_of_date and forward fill null positions
-# using an 18 month or 6 quarter window.
-scheme_4 = scheme_4.with_columns(
-            pl.col('ADJ_SHARES_HELD_STAKES')
-            .forward_fill(limit=6)
-            .over(['FSYM_ID', 'FACTSET_ENTITY_ID'])
-            .alias('ADJ_SHARES_HELD_STAKES_FILLED')
-            )
+# Compare the perspective date (end of the quarter) to the as_of_date of the
+# latest stakes position using an 18 month window.
+scheme_4 = latest_within_window(scheme_4,
+                                stakes_positions.rename({'ADJ_SHARES_HELD_STAKES': 'ADJ_SHARES_HELD_STAKES_FILLED'}),
+                                WINDOW_MONTHS_UKSR)
 
+# Funds position of the quarter
+scheme_4 = scheme_4.join(funds_positions, how='left',
+                         on=['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'])
 
 # Use a filled stakes position if it exists.
 # Otherwise use a funds position.
-scheme_4_final = ( 
-    scheme_4.with_columns(
-    pl.when(pl.col('ADJ_SHARES_HELD_STAKES_FILLED').is_not_null())
-    .then(pl.col('ADJ_SHARES_HELD_STAKES_FILLED'))
-    .otherwise(pl.col('ADJ_SHARES_HELD_FUNDS'))
-    .alias('ADJ_SHARES_HELD')
-    )
-    )
+candidates = pl.concat([
+    candidate_positions(scheme_4, SOURCE_STAKES, 'ADJ_SHARES_HELD_STAKES_FILLED',
+                        alias='ADJ_SHARES_HELD'),
+    candidate_positions(scheme_4, SOURCE_FUNDS, 'ADJ_SHARES_HELD_FUNDS',
+                        alias='ADJ_SHARES_HELD')
+    ])
+scheme_4_final = resolve_positions(candidates, POLICY_SCHEME_4)
 
 
 # Free memory
-del scheme_4, funds_positions, stakes_positions, own_fund, own_fund_, own_fund_inst
+del candidates, scheme_4, funds_positions, stakes_positions
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #    SOME HOUSEKEEPING
@@ -453,5 +223,5 @@ scheme_4_final = scheme_4_final.with_columns(
 #   SAVE
 # ~~~~~~~~~~~
 
-scheme_4_final.write_parquet(os.path.join(cd, 'scheme_4_adj_shares_held.parquet'))
+to_storage(scheme_4_final).write_parquet(os.path.join(cd, shard_name(frequency_name('scheme_4_adj_shares_held.parquet'))))
 
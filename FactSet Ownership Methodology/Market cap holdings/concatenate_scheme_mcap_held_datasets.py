@@ -2,21 +2,34 @@
 # -*- coding: utf-8 -*-
 """
 Concatenate datasets constructed from the 4 Schemes
+
+The scheme outputs are streamed into one dataset partitioned by 'date_q'
+and into the single file factset_mcap_holdings.parquet as before (see
+factset_ownership/union.py). The security-holder-quarter keys that are in
+more than one scheme are counted in the same pass.
+
+Input:
+    scheme_1_mcap_held.parquet
+    .
+    .
+    .
+    scheme_4_mcap_held.parquet
+
+Output:
+    factset_mcap_holdings.parquet
+    factset_mcap_holdings\date_q=*\*.parquet
+    factset_mcap_holdings_overlap.csv
+    factset_mcap_holdings_by_holder.parquet (+ _index.parquet)
 """
 
 
 import os
-import polars as pl
-
-def any_duplicates(df, unique_cols):
-    a = df.shape[0]
-    b = df.unique(unique_cols).shape[0]
-    print('Before unique: %d \n' % a )
+import sys
 
-    print('After unique: %d \n' %  b )
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from factset_ownership import frequency_name, write_union, scan_union, write_store
 
-    print('Difference: %d' %(a-b))
-    
 main_cols = ['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q']
 
 # ~~~~~~~~~~~~~
@@ -39,38 +52,21 @@ own_stakes_dir = os.path.join(factset_dir, 'own_stakes_eq_v5_full')
 own_funds_dir = os.path.join(factset_dir, 'own_fund_eq_v5_full')
 
 
-# ~~~~~~~~~~~~~~~~
-#   IMPORT DATA
-# ~~~~~~~~~~~~~~~~
-
-
-scheme_1 = pl.read_parquet(os.path.join(cd, 'scheme_1_mcap_held.parquet'))
-#any_duplicates(scheme_1, main_cols)
-
-scheme_2 = pl.read_parquet(os.path.join(cd, 'scheme_2_mcap_held.parquet'))
-#any_duplicates(scheme_2, main_cols)
-
-scheme_3 = pl.read_parquet(os.path.join(cd, 'scheme_3_mcap_held.parquet'))
-#any_duplicates(scheme_3, main_cols)
-
-scheme_4 = pl.read_parquet(os.path.join(cd, 'scheme_4_mcap_held.parquet'))
-#any_duplicates(scheme_4, main_cols)
-
-# ~~~~~~~~~~~~
-#   CONCAT
-# ~~~~~~~~~~~~
-
-fh = pl.concat([scheme_1,
-                scheme_2,
-                scheme_3,
-                scheme_4])
-
-
-# Sort
-#fh = fh.sort(['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'])
-
-# Save
-fh.write_parquet(os.path.join(cd, 'factset_mcap_holdings.parquet' ))
+# ~~~~~~~~~~~~~~~~~~~~
+#   CONCAT AND SAVE
+# ~~~~~~~~~~~~~~~~~~~~
 
+# Scheme outputs (the shard files with FACTSET_NUM_SHARDS)
+schemes = [os.path.join(cd, frequency_name('scheme_%d_mcap_held.parquet' % k))
+           for k in range(1, 5)]
 
+# Stream the union into the dataset partitioned by 'date_q' and the single
+# file, and count the keys (main_cols) in more than one scheme or repeated
+# within a scheme
+overlap = write_union(schemes, cd, 'factset_mcap_holdings', 'scheme_mcap_held', key=main_cols)
 
+# Copy clustered by institution for portfolio queries (get_portfolio)
+write_store(scan_union(cd, 'factset_mcap_holdings', 'scheme_mcap_held'),
+            cd,
+            'factset_mcap_holdings',
+            'holder')
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Positions ledger
+
+The 13F reports, the stakes-based positions and the funds reports are read
+once and stored in one long table, the positions ledger (see
+factset_ownership/ledger.py). The scheme scripts and part 1 of the
+Ferreira & Matos methodology filter and aggregate the ledger instead of
+scanning the raw FactSet tables again.
+
+For every source I keep the most recent observation within a quarter:
+
+    13F     institution-security pair    (latest REPORT_DATE)
+    STAKES  institution-security pair    (latest AS_OF_DATE by SOURCE_CODE)
+    FUNDS   fund-security pair           (latest REPORT_DATE)
+
+and the market value of the position in USD. The most recent observation
+with a positive position (or market value) is also kept when it is not
+the most recent one, as the scheme scripts drop the non-positive
+observations before keeping the most recent one (see latest_flags() in
+factset_ownership/ledger.py).
+
+The scheme of a holder-security pair depends on the FactSet flags of the
+holder and of the security. The flags are stored once in two lookup
+tables (see factset_ownership/classification.py) that the scheme scripts
+semi-join with the ledger.
+
+Run this script again whenever the FactSet tables are updated.
+
+Input:
+    own_ent_funds.parquet
+    own_ent_institutions.parquet
+    own_sec_coverage_eq.parquet
+    own_sec_prices_eq.parquet
+    \own_inst_eq_v5_full\own_inst_13f_detail_eq_*.parquet
+    \own_inst_eq_v5_full\own_inst_stakes_detail_eq.parquet
+    \own_fund_eq_v5_full\own_fund_detail_eq_*.parquet
+
+Output:
+    \positions_ledger\date_q=*\*.parquet
+    scheme_securities.parquet
+    scheme_holders.parquet
+
+"""
+
+
+import os
+import sys
+import polars as pl
+
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import (latest_observation,
+                               read_table,
+                               latest_flags,
+                               ledger_rows,
+                               write_ledger,
+                               SOURCE_13F,
+                               SOURCE_STAKES,
+                               SOURCE_FUNDS,
+                               apply_period_scheme,
+                               prefetch,
+                               write_classification)
+
+
+
+# Current directory
+cd = r'C:\Users\FMCC\Desktop\Ioannis'
+
+# Parquet Factset tables
+factset_dir =  r'C:\FactSet_Downloadfiles\zips\parquet'
+
+# 13F filings
+own_inst_13f_dir = os.path.join(factset_dir, 'own_inst_eq_v5_full')
+
+# Sum of Fund holdings
+own_funds_dir = os.path.join(factset_dir, 'own_fund_eq_v5_full')
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#        IMPORT DATA
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Import own_ent_funds table
+own_ent_funds = read_table(os.path.join(factset_dir, 'own_ent_funds.parquet'))
+# the table is used to match a Fund to the Institution that manages it
+own_ent_funds = (
+            own_ent_funds
+            .select(['FACTSET_FUND_ID', 'FACTSET_INST_ENTITY_ID'])
+            .rename({'FACTSET_INST_ENTITY_ID': 'FACTSET_ENTITY_ID'})
+            )
+
+# Import own_sec_prices
+own_sec_prices = read_table(os.path.join(factset_dir, 'own_sec_prices_eq.parquet'))
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#  FORMAT OWN_SEC_PRICES TABLE
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Define the period 'date_q' (quarter, or month with FACTSET_FREQUENCY=monthly)
+own_sec_prices = apply_period_scheme(own_sec_prices, 'PRICE_DATE')
+
+# Keep only the most recent 'price' observation within a quarter
+# for each security (data already sorted)
+own_sec_prices_q = latest_observation(own_sec_prices,
+                                      ['FSYM_ID', 'date_q'],
+                                      'PRICE_DATE')
+
+# Prices only
+prices_q = (own_sec_prices_q
+            .select(['FSYM_ID',
+                     'date_q',
+                     'ADJ_PRICE',
+                     'UNADJ_PRICE'])
+            )
+
+# Keep only positive unadjusted prices
+prices_q = prices_q.filter(pl.col('UNADJ_PRICE')>0)
+
+# Adjusted price of 0 is treated as null
+prices_q = (
+    prices_q.with_columns(
+        pl.when(pl.col('ADJ_PRICE') == 0)
+        .then(None)
+        .otherwise(pl.col('ADJ_PRICE'))
+        .alias('ADJ_PRICE')
+        )
+    )
+
+# Free memory
+del own_sec_prices, own_sec_prices_q
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~
+#      13F table
+# ~~~~~~~~~~~~~~~~~~~~
+
+print('13F reports \n')
+
+# Define dataframe to save
+ledger_13f = pl.DataFrame()
+
+# 13f datasets
+datasets_13f = [os.path.join(own_inst_13f_dir, dataset)
+                for dataset in os.listdir(own_inst_13f_dir) if '13f' in dataset]
+
+# Iterate through 13f datasets (the next dataset is read in the background)
+for path, own_inst_13f in prefetch(datasets_13f,
+                                   lambda path: read_table(path,
+                                                           columns=['FSYM_ID',
+                                                                    'FACTSET_ENTITY_ID',
+                                                                    'REPORT_DATE',
+                                                                    'ADJ_HOLDING',
+                                                                    'REPORTED_HOLDING']),
+                                   stage='13F reports'):
+
+    # Define the period 'date_q' (quarter, or month with FACTSET_FREQUENCY=monthly)
+    own_inst_13f = apply_period_scheme(own_inst_13f, 'REPORT_DATE')
+
+    # Keep the most recent 'REPORT_DATE' within a quarter for
+    # a security-holder pair (and the most recent positive one)
+    own_inst_13f = latest_flags(own_inst_13f,
+                                ['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'],
+                                'REPORT_DATE',
+                                positive_shares=pl.col('REPORTED_HOLDING')>0,
+                                positive_value=pl.col('REPORTED_HOLDING')>0)
+
+    # Concat
+    ledger_13f = pl.concat([ledger_13f, own_inst_13f])
+
+# Security-holder pairs may be reported in more than one 13f dataset
+# within the same quarter. Keep again the most recent 'REPORT_DATE'.
+ledger_13f = latest_flags(ledger_13f,
+                          ['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q'],
+                          'REPORT_DATE',
+                          positive_shares=pl.col('REPORTED_HOLDING')>0,
+                          positive_value=pl.col('REPORTED_HOLDING')>0)
+
+# Join with prices
+ledger_13f = ledger_13f.join(prices_q,
+                             how='left',
+                             on=['FSYM_ID', 'date_q'])
+
+# Use market value from adjusted positions if it is not missing
+# (adjusted holdings of 0 are considered null) otherwise use market
+# value from reported positions.
+ledger_13f = ledger_rows(
+    ledger_13f,
+    SOURCE_13F,
+    AS_OF_DATE='REPORT_DATE',
+    ADJ_SHARES='ADJ_HOLDING',
+    REPORTED_SHARES='REPORTED_HOLDING',
+    MARKET_VALUE=pl.when((pl.col('ADJ_HOLDING') != 0) & pl.col('ADJ_PRICE').is_not_null())
+                 .then(pl.col('ADJ_HOLDING') * pl.col('ADJ_PRICE'))
+                 .otherwise(pl.col('REPORTED_HOLDING') * pl.col('UNADJ_PRICE'))
+    )
+
+# Free memory
+del own_inst_13f
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~
+#   STAKES table
+# ~~~~~~~~~~~~~~~~~~~~
+
+print('Stakes-based positions \n')
+
+own_inst_stakes = read_table(os.path.join(own_inst_13f_dir, 'own_inst_stakes_detail_eq.parquet'),
+                             columns=['FSYM_ID',
+                                      'FACTSET_ENTITY_ID',
+                                      'AS_OF_DATE',
+                                      'SOURCE_CODE',
+                                      'POSITION'])
+
+# Define the period 'date_q' (quarter, or month with FACTSET_FREQUENCY=monthly)
+own_inst_stakes = apply_period_scheme(own_inst_stakes, 'AS_OF_DATE')
+
+# Keep only the most recent 'AS_OF_DATE' observation within quarter
+# for each source (Scheme 4 only uses some sources), and the most recent
+# positive one
+own_inst_stakes = latest_flags(own_inst_stakes,
+                               ['FSYM_ID', 'FACTSET_ENTITY_ID', 'SOURCE_CODE', 'date_q'],
+                               'AS_OF_DATE',
+                               positive_shares=pl.col('POSITION')>0,
+                               positive_value=pl.col('POSITION')>0)
+
+# Join with prices
+own_inst_stakes = own_inst_stakes.join(prices_q,
+                                       how='left',
+                                       on=['FSYM_ID', 'date_q'])
+
+# Stakes positions are adjusted
+ledger_stakes = ledger_rows(
+    own_inst_stakes,
+    SOURCE_STAKES,
+    ADJ_SHARES='POSITION',
+    MARKET_VALUE=pl.col('POSITION') * pl.col('ADJ_PRICE')
+    )
+
+# Free memory
+del own_inst_stakes
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#      FUNDS table
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+print('Funds reports \n')
+
+# Define DataFrame to store
+ledger_funds = pl.DataFrame()
+
+# Iterate through Sum of Funds datasets (the next dataset is read in
+# the background)
+for path, own_fund in prefetch([os.path.join(own_funds_dir, dataset)
+                                for dataset in os.listdir(own_funds_dir)],
+                               lambda path: read_table(path,
+                                                       columns=['FACTSET_FUND_ID',
+                                                                'FSYM_ID',
+                                                                'REPORT_DATE',
+                                                                'ADJ_HOLDING',
+                                                                'REPORTED_HOLDING',
+                                                                'ADJ_MV',
+                                                                'REPORTED_MV']),
+                               stage='Funds reports'):
+
+    print('%s is processed. \n' % os.path.basename(path))
+
+    # Merge Fund with Institution that manages the Fund
+    own_fund = own_fund.join(own_ent_funds,
+                             how='inner',
+                             on='FACTSET_FUND_ID')
+
+    # Define the period 'date_q' (quarter, or month with FACTSET_FREQUENCY=monthly)
+    own_fund = apply_period_scheme(own_fund, 'REPORT_DATE')
+
+    # Keep only the most recent 'REPORT_DATE' within a quarter for
+    # a security-fund pair, and the most recent one with a positive
+    # reported holding (adjusted shares schemes) or reported market value
+    # (market cap schemes)
+    own_fund = latest_flags(own_fund,
+                            ['FSYM_ID', 'FACTSET_FUND_ID', 'date_q'],
+                            'REPORT_DATE',
+                            positive_shares=pl.col('REPORTED_HOLDING')>0,
+                            positive_value=pl.col('REPORTED_MV')>0)
+
+    # Keep 'adjusted market value' if not missing, otherwise
+    # keep 'reported market value' as 'market value'.
+    own_fund = ledger_rows(
+        own_fund,
+        SOURCE_FUNDS,
+        AS_OF_DATE='REPORT_DATE',
+        ADJ_SHARES='ADJ_HOLDING',
+        REPORTED_SHARES='REPORTED_HOLDING',
+        MARKET_VALUE=pl.when(pl.col('ADJ_MV') > 0)
+                     .then(pl.col('ADJ_MV'))
+                     .otherwise(pl.col('REPORTED_MV'))
+        )
+
+    # Concat
+    ledger_funds = pl.concat([ledger_funds, own_fund])
+
+# Free memory
+del own_fund
+
+
+
+# ~~~~~~~~~~~~~~
+#   SAVE
+# ~~~~~~~~~~~
+
+ledger = pl.concat([ledger_13f, ledger_stakes, ledger_funds])
+
+# Free memory
+del ledger_13f, ledger_stakes, ledger_funds
+
+write_ledger(ledger, cd)
+
+print(ledger.group_by('SOURCE').len().sort('SOURCE'))
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#   SCHEME CLASSIFICATION
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Scheme class of every security and 13F flag of every holder
+securities, holders = write_classification(cd, factset_dir)
+
+print(securities.group_by('SECURITY_CLASS').len().sort('SECURITY_CLASS'))
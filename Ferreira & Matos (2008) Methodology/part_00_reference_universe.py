@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Replication of Ferreira & Matos (2008) methodology
+
+PART 00 - REFERENCE UNIVERSE
+
+Parts 0, 1 and 2 all need the same universe of stocks and the same
+company market cap. They are built once here and saved as artifacts that
+the other parts load (see factset_ownership/universe.py):
+
+    own_basic    : universe of stocks (EQ/AD plus PF/PREFEQ) with the
+                   company and the termination quarter of each security
+    hmktcap      : market cap at the company level (unadjusted prices if
+                   adjusted prices are insufficient)
+    hmktcap_prc  : hmktcap at the security level plus the adjusted price
+                   of the security at the end of the quarter
+
+Run this part first and again whenever the FactSet tables are updated.
+The other parts refuse artifacts built from other FactSet files.
+
+Market cap is in millions of USD.
+
+Input:
+    own_sec_coverage_eq.parquet
+    sym_coverage.parquet
+    own_sec_entity_eq.parquet
+    own_sec_prices_eq.parquet
+
+Output:
+    own_basic.parquet
+    hmktcap.parquet
+    hmktcap_prc.parquet
+    (.arrow with FACTSET_INTERMEDIATE_FORMAT=ipc)
+    universe_manifest.json
+
+"""
+
+
+import os
+import sys
+import polars as pl
+
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import (latest_observation,
+                               read_table,
+                               acc,
+                               to_storage,
+                               write_artifacts,
+                               apply_period_scheme)
+
+
+# ~~~~~~~~~~~~~~~~~~
+#    DIRECTORIES
+# ~~~~~~~~~~~~~~~~~~
+
+# Current directory
+cd = r'C:\Users\FMCC\Desktop\Ioannis'
+
+# Parquet Factset tables
+factset_dir =  r'C:\FactSet_Downloadfiles\zips\parquet'
+
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#        IMPORT DATA
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Import own_sec_coverage table
+own_sec_cov = read_table(os.path.join(factset_dir, 'own_sec_coverage_eq.parquet'),
+                         columns=['FSYM_ID', 'ISSUE_TYPE', 'ISO_COUNTRY'])
+
+# Import sym_coverage table
+sym_cov = read_table(os.path.join(factset_dir, 'sym_coverage.parquet'),
+                     columns=['FSYM_ID', 'FREF_SECURITY_TYPE'])
+
+# Import own_sec_entity_eq table
+own_sec_entity_eq = read_table(os.path.join(factset_dir, 'own_sec_entity_eq.parquet'))
+
+# Prices
+own_sec_prices = read_table(os.path.join(factset_dir, 'own_sec_prices_eq.parquet'))
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    FORMAT OWN_SEC_PRICES TABLE
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Define the period 'date_q' (quarter, or month with FACTSET_FREQUENCY=monthly)
+own_sec_prices = apply_period_scheme(own_sec_prices, 'PRICE_DATE')
+
+
+# Keep only the most recent 'price' observation within a quarter
+# for each security (data already sorted)
+own_sec_prices_q = latest_observation(own_sec_prices,
+                                      ['FSYM_ID', 'date_q'],
+                                      'PRICE_DATE')
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#     UNIVERSE OF STOCKS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+# termination_date TABLE (Termination quarter for each owneship security)
+termination_date = (
+    own_sec_prices
+    .group_by('FSYM_ID')
+    .agg(pl.col('date_q').max().alias('TERMINATION_DATE'))
+    )
+
+# Join
+equity_secs = own_sec_cov.join(sym_cov, how='left', on=['FSYM_ID'])
+
+# Equity or ADR
+filter1 = pl.col('ISSUE_TYPE').is_in(['EQ', 'AD'])
+
+# Preffered share
+filter2 = pl.col('ISSUE_TYPE').is_in(['PF']) & pl.col('FREF_SECURITY_TYPE').is_in(['PREFEQ'])
+
+# equity_secs TABLE (Universe of stocks)
+equity_secs = equity_secs.filter(filter1 | filter2)
+
+# own_basic TABLE (Universe of stocks plus information)
+own_basic = (
+    equity_secs
+    .join(own_sec_entity_eq, how='inner', on=['FSYM_ID'])
+    .join(termination_date, how='inner', on=['FSYM_ID'])
+    .sort(by=['FSYM_ID'])
+    )
+
+# Free memory
+del own_sec_cov, sym_cov, own_sec_entity_eq, own_sec_prices
+del termination_date, equity_secs
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    OWN MARKET CAP PROCEDURE
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+#  own_mv TABLE (market cap at the security level)
+own_mv = (
+    own_sec_prices_q.with_columns(
+    (pl.col('ADJ_PRICE') * pl.col('ADJ_SHARES_OUTSTANDING')).alias('ADJ_OWN_MV'),
+    (pl.col('UNADJ_PRICE') * pl.col('UNADJ_SHARES_OUTSTANDING')).alias('UNADJ_OWN_MV')
+    )
+    .select(['FSYM_ID', 'date_q', 'ADJ_OWN_MV', 'UNADJ_OWN_MV'])
+    )
+
+# Use information of unadjusted prices if information from adjusted prices is
+# insufficient.
+own_mv = own_mv.with_columns(
+    pl.when(pl.col('ADJ_OWN_MV') == 0)
+    .then(pl.col('UNADJ_OWN_MV'))
+    .otherwise(pl.col('ADJ_OWN_MV'))
+    .alias('OWN_MV')
+    )
+
+# Market cap at the security level for non-ADR universe of stocks
+own_mktcap1 = (
+    own_mv.select(['FSYM_ID', 'date_q', 'OWN_MV'])
+    .join(own_basic.select(['FSYM_ID', 'FACTSET_ENTITY_ID', 'ISSUE_TYPE', 'FREF_SECURITY_TYPE']),
+          how='inner', on=['FSYM_ID'])
+    .filter(pl.col('ISSUE_TYPE') != 'AD')
+    )
+
+
+r"""
+* unilever;
+proc sql;
+delete from own_mktcap1 where fsym_id eq 'DXVFL5-S' and price_date ge '30SEP2015'd;
+"""
+
+
+# own_mktcap TABLE (market cap at the firm level
+own_mktcap = (
+    own_mktcap1
+    .group_by(['FACTSET_ENTITY_ID', 'date_q'])
+    .agg(acc('OWN_MV').sum())
+    )
+
+
+# hmktcap TABLE (market cap at the firm-level + housekeeping)
+hmktcap = (
+    own_mktcap.with_columns(
+    (pl.col('OWN_MV')/1000000).alias('MKTCAP_USD')
+    )
+    .select(['FACTSET_ENTITY_ID', 'date_q', 'MKTCAP_USD'])
+    )
+hmktcap = hmktcap.filter(pl.col('MKTCAP_USD').is_not_null() &
+                         (pl.col('MKTCAP_USD') > 0))
+hmktcap = hmktcap.sort(by=['FACTSET_ENTITY_ID', 'date_q'])
+
+# Free memory
+del own_mv, own_mktcap, own_mktcap1
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    MARKET CAP AND PRICE AT THE SECURITY LEVEL
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Market capitalizaton at the firm level for securities
+hmktcap_ = hmktcap.join(own_basic.select(['FSYM_ID', 'FACTSET_ENTITY_ID', 'ISO_COUNTRY']),
+                        how='inner',
+                        on=['FACTSET_ENTITY_ID'])
+hmktcap_ = hmktcap_.rename({'FACTSET_ENTITY_ID' : 'COMPANY_ID'})
+
+# Augment with adjusted prices at the security level
+hmktcap_prc = hmktcap_.join(own_sec_prices_q.select(['FSYM_ID', 'date_q', 'ADJ_PRICE']),
+                            how='inner',
+                            on=['FSYM_ID', 'date_q'])
+hmktcap_prc = hmktcap_prc.sort(by=['FSYM_ID', 'date_q'])
+
+# Free memory
+del hmktcap_, own_sec_prices_q
+
+
+
+# ~~~~~~~~~~~~~~~~~~
+#      SAVE
+# ~~~~~~~~~~~~~~~~~~
+
+manifest = write_artifacts({'own_basic': own_basic,
+                            'hmktcap': to_storage(hmktcap),
+                            'hmktcap_prc': to_storage(hmktcap_prc)},
+                           cd,
+                           factset_dir)
+
+print(manifest)
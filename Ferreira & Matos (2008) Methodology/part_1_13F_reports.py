@@ -7,17 +7,35 @@ PART 1 - 13F REPORTS + IMPUTATION
 Market cap is in millions of USD.
 
 Input:
-    
+    own_basic, hmktcap, hmktcap_prc (part_00_reference_universe.py)
+    positions_ledger (build_positions_ledger.py)
     
 Output:
-    v2_holdings13f.parquet
+    v2_holdings13f.parquet (.arrow with FACTSET_INTERMEDIATE_FORMAT=ipc)
     
 """
 
 
 import os
+import sys
+import functools
 import polars as pl
 
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import (read_table,
+                               acc,
+                               to_storage,
+                               write_handoff,
+                               load_artifact,
+                               scan_artifact,
+                               scan_ledger,
+                               SOURCE_13F,
+                               imputation_fills,
+                               imputation_grid,
+                               IMPUTATION_MONTHS,
+                               run_period_shards)
+
 # ~~~~~~~~~~~~~~~~~~
 #    DIRECTORIES 
 # ~~~~~~~~~~~~~~~~~~
@@ -28,54 +46,6 @@ cd = r'C:\Users\FMCC\Desktop\Ioannis'
 # Parquet Factset tables
 factset_dir =  r'C:\FactSet_Downloadfiles\zips\parquet'
 
-# 13F filings
-own_inst_13f_dir = os.path.join(factset_dir, 'own_inst_eq_v5_full')
-
-# Stakes based sources including UKSR, RNS, 13D/G's, proxies, etc.
-own_stakes_dir = os.path.join(factset_dir, 'own_stakes_eq_v5_full')
-
-# Sum of Fund holdings
-own_funds_dir = os.path.join(factset_dir, 'own_fund_eq_v5_full')
-
-
-
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#   APPLY QUARTER SCHEME
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-def apply_quarter_scheme(df, date_col):
-    
-    # Col_names
-    df_col_names = df.columns
-    
-    df = df.with_columns(
-        pl.col(date_col).dt.strftime('%Y%m').alias('yyyymm').cast(pl.Int32),
-        )
-    
-    df =  df.with_columns(
-        (pl.col('yyyymm')% 100).alias('month'),
-        (pl.col('yyyymm')/100).floor().cast(pl.Int32).alias('year')
-        )
-    # Define quarter 'date_q' in integer format
-    df = df.with_columns(
-        pl.when(pl.col('month')<=3)
-        .then(3)
-        .when((pl.col('month')>3) & (pl.col('month')<=6))
-        .then(6)
-        .when((pl.col('month')>6) & (pl.col('month')<=9))
-        .then(9)
-        .otherwise(12)
-        .alias('month_q')
-        )
-    
-    df =  df.with_columns(
-        (pl.col('year')*100 + pl.col('month_q')).alias('date_q')
-        ).select(df_col_names + ['date_q'])   
-   
-    return df
-
-
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -83,151 +53,23 @@ def apply_quarter_scheme(df, date_col):
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 # Import own_ent_institutions table
-own_ent_inst = pl.read_parquet(os.path.join(factset_dir, 'own_ent_institutions.parquet'),
-                               use_pyarrow=True)
-
-# Import own_sec_coverage table
-own_sec_cov = pl.read_parquet(os.path.join(factset_dir, 'own_sec_coverage_eq.parquet'),
-                              use_pyarrow=True)
-
-# Import sym_coverage table
-sym_cov = pl.read_parquet(os.path.join(factset_dir, 'sym_coverage.parquet'),
-                              use_pyarrow=True,
-                              columns=['FSYM_ID', 'FREF_SECURITY_TYPE'])
-
-
-# Import own_sec_entity_eq table
-own_sec_entity_eq = pl.read_parquet(os.path.join(factset_dir, 'own_sec_entity_eq.parquet'),
-                                use_pyarrow=True)
+own_ent_inst = read_table(os.path.join(factset_dir, 'own_ent_institutions.parquet'))
 
 # Import own_ent_13f_combined_inst table 
-own_ent_13f_combined_inst = pl.read_parquet(os.path.join(factset_dir, 'own_ent_13f_combined_inst.parquet'),
-                                            use_pyarrow=True)
-
-
-# Prices
-own_sec_prices = pl.read_parquet(os.path.join(factset_dir, 'own_sec_prices_eq.parquet'),
-                                 use_pyarrow=True)
-
-
+own_ent_13f_combined_inst = read_table(os.path.join(factset_dir, 'own_ent_13f_combined_inst.parquet'))
 
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#    FORMAT OWN_SEC_PRICES TABLE
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Define quarter date 'date_q'
-own_sec_prices = apply_quarter_scheme(own_sec_prices, 'PRICE_DATE')
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    UNIVERSE OF STOCKS AND COMPANY MARKET CAP
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-
-# Keep only the most recent 'price' observation within a quarter
-# for each security (data already sorted)
-own_sec_prices_q = ( 
-    own_sec_prices
-    .group_by(['FSYM_ID', 'date_q'])
-    .agg(pl.all().sort_by('PRICE_DATE').last())
-    )
-
-
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#     SOME HOUSKEEPING
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-
-# termination_date TABLE (Termination quarter for each owneship security)
-termination_date = ( 
-    own_sec_prices
-    .group_by('FSYM_ID')
-    .agg(pl.col('date_q').max().alias('TERMINATION_DATE'))
-    )
-
-
-
-# Keep necessary columns
-own_sec_cov_ = own_sec_cov.select(['FSYM_ID',
-                                   'ISSUE_TYPE',
-                                   'ISO_COUNTRY'])
-
-# Join
-equity_secs = own_sec_cov_.join(sym_cov, how='left', on=['FSYM_ID'])
-
-# Equity or ADR
-filter1 = pl.col('ISSUE_TYPE').is_in(['EQ', 'AD'])
-
-# Preffered share
-filter2 = pl.col('ISSUE_TYPE').is_in(['PF']) & pl.col('FREF_SECURITY_TYPE').is_in(['PREFEQ'])
-
-# equity_secs TABLE (Universe of stocks)
-equity_secs = equity_secs.filter(filter1 | filter2)
+# Built once by part_00_reference_universe.py
 
 # own_basic TABLE (Universe of stocks plus information)
-own_basic = ( 
-    equity_secs
-    .join(own_sec_entity_eq, how='inner', on=['FSYM_ID'])
-    .join(termination_date, how='inner', on=['FSYM_ID'])
-    )
-
-# prices_historical TABLE 
-prices_historical = own_sec_prices_q
-
-
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#    OWN MARKET CAP PROCEDURE
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-#  own_mv TABLE (market cap at the security level)
-own_mv = ( 
-    own_sec_prices_q.with_columns(
-    (pl.col('ADJ_PRICE') * pl.col('ADJ_SHARES_OUTSTANDING')).alias('ADJ_OWN_MV'),
-    (pl.col('UNADJ_PRICE') * pl.col('UNADJ_SHARES_OUTSTANDING')).alias('UNADJ_OWN_MV')
-    )
-    .select(['FSYM_ID', 'date_q', 'ADJ_OWN_MV', 'UNADJ_OWN_MV'])
-    )
-
-# Use information of unadjusted prices if information from adjusted prices is 
-# insufficient.
-own_mv = own_mv.with_columns(
-    pl.when(pl.col('ADJ_OWN_MV') == 0)
-    .then(pl.col('UNADJ_OWN_MV'))
-    .otherwise(pl.col('ADJ_OWN_MV'))
-    .alias('OWN_MV')
-    )
-
-# Market cap at the security level for non-ADR universe of stocks
-own_mktcap1 = ( 
-    own_mv.select(['FSYM_ID', 'date_q', 'OWN_MV'])
-    .join(own_basic.select(['FSYM_ID', 'FACTSET_ENTITY_ID', 'ISSUE_TYPE', 'FREF_SECURITY_TYPE']), 
-          how='inner', on=['FSYM_ID'])
-    .filter(pl.col('ISSUE_TYPE') != 'AD')
-    )
-
-
-r"""
-* unilever;
-proc sql;
-delete from own_mktcap1 where fsym_id eq 'DXVFL5-S' and price_date ge '30SEP2015'd;
-"""
-
-
-# own_mktcap TABLE (market cap at the firm level
-own_mktcap = (
-    own_mktcap1
-    .group_by(['FACTSET_ENTITY_ID', 'date_q'])
-    .agg(pl.col('OWN_MV').sum())
-    )
-
+own_basic = load_artifact(cd, 'own_basic', factset_dir=factset_dir)
 
 # hmktcap TABLE (market cap at the firm-level + housekeeping)
-hmktcap = ( 
-    own_mktcap.with_columns(
-    (pl.col('OWN_MV')/1000000).alias('MKTCAP_USD')
-    )
-    .select(['FACTSET_ENTITY_ID', 'date_q', 'MKTCAP_USD'])
-    )
-hmktcap = hmktcap.filter(pl.col('MKTCAP_USD').is_not_null() &
-                         (pl.col('MKTCAP_USD') > 0))
-hmktcap = hmktcap.sort(by=['FACTSET_ENTITY_ID', 'date_q'])
+hmktcap = load_artifact(cd, 'hmktcap', factset_dir=factset_dir)
 
 
 # ///////////////////////////////////////////////////////
@@ -238,83 +80,110 @@ hmktcap = hmktcap.sort(by=['FACTSET_ENTITY_ID', 'date_q'])
 
 print('13F reports\n')
 
-# aux13f TABLE (13F reports with the most recent report date within quarter)
-aux13f = pl.DataFrame()
+# Columns of the v1_holdings13f TABLE
+REPORT_COLUMNS = ['FACTSET_ENTITY_ID',
+                  'FSYM_ID',
+                  'date_q',
+                  'ADJ_HOLDING',
+                  'MKTCAP_HOLDING',
+                  'MKTCAP_USD',
+                  'IO',
+                  'COMPANY_ID',
+                  'ISO_COUNTRY',
+                  'REPORT_DATE']
+
+
+def reports_13f(folder, factset_dir, quarters=None):
+    """
+    v1_holdings13f TABLE (13F reported positions for universe of stocks plus
+    company level market capitalization) of the quarters 'quarters'
+    (first, last; all quarters if None), lazily
+    """
+
+    # aux13f TABLE (13F reports with the most recent report date within quarter)
+    # from the positions ledger (build_positions_ledger.py). No positivity
+    # filter: the most recent report is kept whatever its holding.
+    aux13f = (
+        scan_ledger(folder,
+                    sources=[SOURCE_13F],
+                    quarters=quarters,
+                    columns=['FACTSET_ENTITY_ID',
+                             'FSYM_ID',
+                             'AS_OF_DATE',
+                             'ADJ_SHARES',
+                             'date_q',
+                             'LATEST'])
+        .filter(pl.col('LATEST'))
+        .drop('LATEST')
+        .rename({'AS_OF_DATE': 'REPORT_DATE', 'ADJ_SHARES': 'ADJ_HOLDING'})
+        )
 
-# Iterate through 13f datasets
-for dataset in os.listdir(own_inst_13f_dir):
-    
-    if '13f' in dataset:
-    
-        # Import 13f dataset
-        own_inst_13f = pl.read_parquet(os.path.join(own_inst_13f_dir, dataset),
-                                       use_pyarrow=True,
-                                       columns=['FACTSET_ENTITY_ID',
-                                                'FSYM_ID',
-                                                'REPORT_DATE',
-                                                'ADJ_HOLDING'])
-        
-        # Define quarter 'date_q' in integer format based on 'REPORT_DATE'
-        own_inst_13f = apply_quarter_scheme(own_inst_13f, 'REPORT_DATE')
-        
-        # Keep the most recent 'REPORT DATE' within each quarter
-        own_inst_13f_ = ( 
-            own_inst_13f
-            .group_by(['FACTSET_ENTITY_ID','FSYM_ID', 'date_q'])
-            .agg(pl.all().sort_by('REPORT_DATE').last())
+    # Market capitalizaton at the firm level for securities plus adjusted
+    # prices at the security level
+    hmktcap_prc = scan_artifact(folder, 'hmktcap_prc', factset_dir=factset_dir)
+
+    return (
+        aux13f
+        .join(hmktcap_prc, how='inner', on=['FSYM_ID', 'date_q'])
+        .with_columns(
+            (pl.col('ADJ_HOLDING')*pl.col('ADJ_PRICE')/1000000).alias('MKTCAP_HOLDING')
+            )
+        .with_columns(
+            (acc('MKTCAP_HOLDING')/acc('MKTCAP_USD')).alias('IO')
             )
-        
+        .select(REPORT_COLUMNS)
+        )
 
-        
-        # Concat 
-        aux13f = pl.concat([aux13f, own_inst_13f])     
-    
-# v1_holdings13f TABLE (13F reported positions for universe of stocks plus company
-# level market capitalization)
-
-# Market capitalizaton at the firm level for securities
-hmktcap_ = hmktcap.join(own_basic.select(['FSYM_ID', 'FACTSET_ENTITY_ID', 'ISO_COUNTRY']),
-                        how='inner', 
-                        on=['FACTSET_ENTITY_ID'])
-hmktcap_ = hmktcap_.rename({'FACTSET_ENTITY_ID' : 'COMPANY_ID'})
-
-# Augment with adjusted prices at the security level
-hmktcap_prc = hmktcap_.join(prices_historical.select(['FSYM_ID', 'date_q', 'ADJ_PRICE']),
-                         how='inner',
-                         on=['FSYM_ID', 'date_q'])
-
-
-v1_holdings13f = aux13f.join(hmktcap_prc, 
-                             how='inner',
-                             on=['FSYM_ID', 'date_q'])
-v1_holdings13f = ( 
-    v1_holdings13f.with_columns(
-    (pl.col('ADJ_HOLDING')*pl.col('ADJ_PRICE')/1000000).alias('MKTCAP_HOLDING')
-    )
-    .drop(['ADJ_PRICE'])
-    )
-v1_holdings13f = v1_holdings13f.with_columns(
-    (pl.col('MKTCAP_HOLDING')/pl.col('MKTCAP_USD')).alias('IO')
-    )
-v1_holdings13f = ( 
-                v1_holdings13f.select(['FACTSET_ENTITY_ID',
-                                        'FSYM_ID',
-                                        'date_q',
-                                        'ADJ_HOLDING',
-                                        'MKTCAP_HOLDING',
-                                        'MKTCAP_USD',
-                                        'IO',
-                                        'COMPANY_ID',
-                                        'ISO_COUNTRY',
-                                        'REPORT_DATE'])
-                .sort(by=['FACTSET_ENTITY_ID',
-                          'FSYM_ID',
-                          'date_q'])
-                )
 
+def impute_13f(first_halo, first, last, folder, factset_dir, periods_pl, entity_max, sym_range):
+    """ Imputed 13F reports of the quarters 'first' to 'last' """
+
+    # 13F reports of the quarters 'first' to 'last' and of the 7 quarters
+    # before them (halo), read from the ledger for this range only
+    reports = reports_13f(folder, factset_dir, quarters=(first_halo, last)).collect()
+
+    # fill_13f TABLE (13F institution-quarter pairs to be filled by previous reports)
+    # The quarters between two 13F reports of an institution that are within
+    # 7 quarters (IMPUTATION_MONTHS, in months) of the last report. The fills
+    # are generated from the reports (no institution x quarter grid), so the
+    # same code also runs with FACTSET_FREQUENCY=monthly.
+    fill_13f = imputation_fills(reports,
+                                'FACTSET_ENTITY_ID',
+                                horizon=IMPUTATION_MONTHS,
+                                periods_pl=periods_pl,
+                                entity_max=entity_max)
+    fill_13f = fill_13f.filter(pl.col('date_q').is_between(first, last))
+
+    # insterts_13f TABLE (Fill the quarterly reports of the 13F institutions 
+    # that are missing and are within the 7 quarter mark of the last reported
+    # quarter)
+    reports = ( 
+                reports
+                .select(['FACTSET_ENTITY_ID',
+                        'FSYM_ID',
+                        'date_q',
+                        'IO',
+                        'COMPANY_ID',
+                        'ISO_COUNTRY'])
+                .rename({'date_q':'LAST_REPORT_QUARTER'})
+                )
 
-# Free memory
-del aux13f, hmktcap_, hmktcap_prc
+    inserts_13f = fill_13f.join(reports,
+                                how='left',
+                                on=['FACTSET_ENTITY_ID', 'LAST_REPORT_QUARTER'])
+
+    # Account for the termination date of each security 'FSYM_ID'
+    inserts_13f = inserts_13f.join(sym_range, on=['FSYM_ID'])
+    # Drop security-quarter pairs for which the quarter exceeds the termination
+    # date
+    inserts_13f = inserts_13f.filter(pl.col('date_q')<=pl.col('maxofqtr'))
+
+    # Some housekeeping 
+    return (
+        inserts_13f
+        .drop(['maxofqtr', 'LAST_REPORT_QUARTER'])
+        .sort(by=['FACTSET_ENTITY_ID', 'FSYM_ID', 'date_q'])
+        )
 
 
 
@@ -334,149 +203,50 @@ sym_range = (
     .unique()
     )
 
-# rangeofquarters TABLE (all quarters for which FactSet has data)
-rangeofquarters = v1_holdings13f.select(['date_q']).unique().sort('date_q')
-    
-# insts_13f TABLE (all institutions for which FactSet has data)
-insts_13f = ( 
-    v1_holdings13f
-    .select(['FACTSET_ENTITY_ID'])
-    .unique()
-    .sort('FACTSET_ENTITY_ID')
-    )
-
-# insts_13fdates TABLE (all possible institution-quarter pairs)
-insts_13fdates = insts_13f.join(rangeofquarters, how='cross')
-
-# pairs_13f TABLE (all 13F institution-quarter pairs)
-pairs_13f = ( 
-    v1_holdings13f
+# Institution-quarter pairs of the 13F reports over the whole history (the
+# only columns of the reports that are collected at once)
+report_quarters = (
+    reports_13f(cd, factset_dir)
     .select(['FACTSET_ENTITY_ID', 'date_q'])
     .unique()
-    .sort(['FACTSET_ENTITY_ID', 'date_q'])
-    )
-pairs_13f = pairs_13f.with_columns(
-    pl.lit(1).alias('HAS_REPORT')
+    .collect()
     )
 
-# entity_minmax TABLE (mininum and maximum quarter that each entity reports 13F)
-entity_minmax = ( 
-    v1_holdings13f
+# rangeofquarters TABLE (all quarters for which FactSet has data)
+rangeofquarters = report_quarters.select(['date_q']).unique().sort('date_q')
+    
+# entity_max TABLE (last 13F quarter of each institution over the whole
+# history). A quarter is only filled if the institution reports again later.
+entity_max = (
+    report_quarters
     .group_by(['FACTSET_ENTITY_ID'])
-    .agg(
-        pl.col('date_q').min().alias('min_quarter'),
-        pl.col('date_q').max().alias('max_quarter')
-        )
-    )
-
-# roll113f TABLE (master dataset that tracks 13F reporting dates for institutions)
-roll113f = insts_13fdates.join(entity_minmax,
-                               how='left', 
-                               on=['FACTSET_ENTITY_ID'])
-# Kepp institution-quarter pairs that fall within the minimum and maximum 
-# reporting 13F quarter
-roll113f = roll113f.filter(
-    (pl.col('min_quarter') <= pl.col('date_q')) & 
-    (pl.col('date_q') <= pl.col('max_quarter'))
-    )
-
-# Augment with 13F institution-quarter pairs 
-roll113f = roll113f.join(pairs_13f, 
-                         how='left', 
-                         on=['FACTSET_ENTITY_ID', 'date_q'])
-
-roll113f = roll113f.with_columns(
-    pl.when(pl.col('HAS_REPORT').is_null())
-    .then(0)
-    .otherwise(pl.col('HAS_REPORT'))
-    .alias('HAS_REPORT')
-    )
-
-
-# Create a dummy variable that is 1 if the last 13F report of the institution
-# is within 7 quarters from the current quarter.
-roll113f = roll113f.with_columns(
-    pl.when(pl.col('HAS_REPORT')==1)
-    .then(pl.col('date_q'))
-    .otherwise(None)
-    .alias('REPORT_QUARTER')
-    )
-# Forward fill for 7 quarters the REPORT_QUARTER
-roll113f = roll113f.with_columns(
-    pl.col('REPORT_QUARTER')
-    .forward_fill(limit=7)
-    .over(['FACTSET_ENTITY_ID'])
-    .alias('LAST_REPORT_QUARTER')
-    )
-# Define the differce in quarters between the current quarter and the last
-# report quarter
-roll113f = roll113f.with_columns(
-    (
-    ((pl.col('date_q')/100).floor() -
-    (pl.col('LAST_REPORT_QUARTER')/100).floor())*4 +
-    ((pl.col('date_q').mod(100)) -
-    (pl.col('LAST_REPORT_QUARTER').mod(100)))/3
-    )
-    .cast(pl.Int32)
-    .alias('DIFF_QUARTERS')
+    .agg(pl.col('date_q').max().alias('max_quarter'))
     )
 
-# If the difference between current and last reported quarter is 
-# less or equal than 7, then VALID=1, otherwise 0
-roll113f = roll113f.with_columns(
-    pl.when(pl.col('DIFF_QUARTERS')<=7)
-    .then(1)
-    .otherwise(0)
-    .alias('VALID')
-    )
-
-# Example for sanity check
-roll113f.filter(pl.col('FACTSET_ENTITY_ID') == '000BJX-E').write_csv(os.path.join(cd, '13f_example.csv'))
-
+# Example for sanity check (reporting grid of the institution, as the
+# roll113f table of the original script)
+imputation_grid(report_quarters.filter(pl.col('FACTSET_ENTITY_ID') == '000BJX-E'),
+                'FACTSET_ENTITY_ID',
+                rangeofquarters).write_csv(os.path.join(cd, '13f_example.csv'))
 
-# Fill_13f TABLE (13F institution-quarter pairs to be filled by previous reports)
-fill_13f = (
-    roll113f
-    .filter((pl.col('HAS_REPORT')==0) & (pl.col('VALID')==1))
-    .select(['FACTSET_ENTITY_ID', 'date_q', 'LAST_REPORT_QUARTER'])
-    .unique(['FACTSET_ENTITY_ID', 'date_q'])
-    )
+# Free memory
+del report_quarters
 
 
-# insterts_13f TABLE (Fill the quarterly reports of the 13F institutions 
-# that are missing and are within the 7 quarter mark of the last reported
-# quarter)
-v1_holdings13f_ = ( 
-                    v1_holdings13f
-                    .select(['FACTSET_ENTITY_ID',
-                            'FSYM_ID',
-                            'date_q',
-                            'IO',
-                            'COMPANY_ID',
-                            'ISO_COUNTRY'])
-                    .rename({'date_q':'LAST_REPORT_QUARTER'})
-                    )
-
-inserts_13f = fill_13f.join(v1_holdings13f_,
-                            how='left',
-                            on=['FACTSET_ENTITY_ID', 'LAST_REPORT_QUARTER'])
-
-# Account for the termination date of each security 'FSYM_ID'
-inserts_13f = inserts_13f.join(sym_range, on=['FSYM_ID'])
-# Drop security-quarter pairs for which the quarter exceeds the termination
-# date
-inserts_13f = inserts_13f.filter(pl.col('date_q')<=pl.col('maxofqtr'))
-
-# Some housekeeping 
-inserts_13f = (
-    inserts_13f
-    .drop(['maxofqtr', 'LAST_REPORT_QUARTER'])
-    .sort(by=['FACTSET_ENTITY_ID', 'FSYM_ID', 'date_q'])
-    )
+# Impute by ranges of quarters (FACTSET_PERIOD_SHARDS ranges, 7 quarters of
+# halo each) in parallel. Each range reads its own reports.
+inserts_13f = run_period_shards(functools.partial(impute_13f,
+                                                  folder=cd,
+                                                  factset_dir=factset_dir,
+                                                  periods_pl=rangeofquarters,
+                                                  entity_max=entity_max,
+                                                  sym_range=sym_range),
+                                rangeofquarters,
+                                halo_months=IMPUTATION_MONTHS)
 
 
 # Free memory
-del sym_range, rangeofquarters, insts_13f, pairs_13f, roll113f, fill_13f, v1_holdings13f_ 
+del sym_range, rangeofquarters, entity_max
  
 
 # The implicit assumption of the imputation method is that institutions 
@@ -488,7 +258,7 @@ inserts_13f = inserts_13f.join(hmktcap.rename({'FACTSET_ENTITY_ID': 'COMPANY_ID'
                                how='inner',
                                on=['COMPANY_ID', 'date_q'])
 inserts_13f = inserts_13f.with_columns(
-    (pl.col('IO')*pl.col('MKTCAP_USD')).alias('MKTCAP_HOLDING')
+    (acc('IO')*acc('MKTCAP_USD')).alias('MKTCAP_HOLDING')
     ) 
 
 
@@ -497,19 +267,19 @@ inserts_13f = inserts_13f.with_columns(
     pl.lit(None).alias('ADJ_HOLDING'),
     pl.lit(None).alias('REPORT_DATE')
     )
-inserts_13f = inserts_13f.select(v1_holdings13f.columns)
-v1_holdings13f_ = pl.concat([v1_holdings13f, inserts_13f])
+inserts_13f = inserts_13f.select(REPORT_COLUMNS)
 
 # Sort and keep unique institution-security-quarter pairs
 v1_holdings13f_ = (
-    v1_holdings13f_
+    pl.concat([reports_13f(cd, factset_dir), inserts_13f.lazy()])
     .sort(by=['FACTSET_ENTITY_ID', 'FSYM_ID', 'date_q'])
     .unique(['FACTSET_ENTITY_ID', 'FSYM_ID', 'date_q'])
+    .collect()
     )
 
 
 # Free memory
-del v1_holdings13f, inserts_13f
+del inserts_13f
 
 
 # Roll up institution entity
@@ -530,8 +300,8 @@ v1_holdings13f_ = v1_holdings13f_.join(own_ent_13f_combined_inst,
 v2_holdings13f = (
     v1_holdings13f_
     .group_by(['FACTSET_ENTITY_ID', 'FSYM_ID', 'date_q'])
-    .agg(pl.col('MKTCAP_HOLDING').sum(),
-         pl.col('IO').sum())
+    .agg(acc('MKTCAP_HOLDING').sum(),
+         acc('IO').sum())
     .sort(by=['FACTSET_ENTITY_ID', 'FSYM_ID', 'date_q'])
     )
 
@@ -554,7 +324,7 @@ v2_holdings13f = v2_holdings13f.join(other_info,
 
 v2_holdings13f = v2_holdings13f.sort(by=['FACTSET_ENTITY_ID', 'FSYM_ID', 'date_q'])
 
-v2_holdings13f.write_parquet(os.path.join(cd, 'v2_holdings13f.parquet'))
+write_handoff(to_storage(v2_holdings13f), cd, 'v2_holdings13f')
 
 
 
@@ -7,18 +7,36 @@ PART 2 - MUTUAL FUNDS REPORTS + IMPUTATION
 Market cap is in millions of USD.
 
 Input:
-    
+    own_basic, hmktcap, hmktcap_prc (part_00_reference_universe.py)
     
 Output:
-    v2_holdingsmf.parquet
-    hmktcap.parquet
+    v2_holdingsmf.parquet (.arrow with FACTSET_INTERMEDIATE_FORMAT=ipc)
     
 """
 
 
 import os
+import sys
+import functools
 import polars as pl
 
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import (latest_observation,
+                               read_table,
+                               scan_table,
+                               acc,
+                               to_storage,
+                               write_handoff,
+                               load_artifact,
+                               scan_artifact,
+                               apply_period_scheme,
+                               imputation_fills,
+                               imputation_grid,
+                               IMPUTATION_MONTHS,
+                               run_period_shards,
+                               prefetch)
+
 
 # ~~~~~~~~~~~~~~~~~~
 #    DIRECTORIES 
@@ -42,64 +60,15 @@ funds_dir = os.path.join(factset_dir, 'own_fund_eq_v5_full_split_by_fund')
 
 
 
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#   APPLY QUARTER SCHEME
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-def apply_quarter_scheme(df, date_col):
-    
-    # Col_names
-    df_col_names = df.columns
-    
-    df = df.with_columns(
-        pl.col(date_col).dt.strftime('%Y%m').alias('yyyymm').cast(pl.Int32),
-        )
-    
-    df =  df.with_columns(
-        (pl.col('yyyymm')% 100).alias('month'),
-        (pl.col('yyyymm')/100).floor().cast(pl.Int32).alias('year')
-        )
-    # Define quarter 'date_q' in integer format
-    df = df.with_columns(
-        pl.when(pl.col('month')<=3)
-        .then(3)
-        .when((pl.col('month')>3) & (pl.col('month')<=6))
-        .then(6)
-        .when((pl.col('month')>6) & (pl.col('month')<=9))
-        .then(9)
-        .otherwise(12)
-        .alias('month_q')
-        )
-    
-    df =  df.with_columns(
-        (pl.col('year')*100 + pl.col('month_q')).alias('date_q')
-        ).select(df_col_names + ['date_q'])   
-   
-    return df
-
-
-
-
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #        IMPORT DATA
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 # Import own_ent_institutions table
-own_ent_inst = pl.read_parquet(os.path.join(factset_dir, 'own_ent_institutions.parquet'),
-                               use_pyarrow=True)
-
-# Import own_sec_coverage table
-own_sec_cov = pl.read_parquet(os.path.join(factset_dir, 'own_sec_coverage_eq.parquet'),
-                              use_pyarrow=True)
-
-# Import sym_coverage table
-sym_cov = pl.read_parquet(os.path.join(factset_dir, 'sym_coverage.parquet'),
-                              use_pyarrow=True,
-                              columns=['FSYM_ID', 'FREF_SECURITY_TYPE'])
+own_ent_inst = read_table(os.path.join(factset_dir, 'own_ent_institutions.parquet'))
 
 # Import own_ent_funds table 
-own_ent_funds = pl.read_parquet(os.path.join(factset_dir, 'own_ent_funds.parquet'),
-                                use_pyarrow=True)
+own_ent_funds = read_table(os.path.join(factset_dir, 'own_ent_funds.parquet'))
 # the table is used to match a Fund to the Institution that manages it
 own_ent_funds = ( 
             own_ent_funds
@@ -107,148 +76,140 @@ own_ent_funds = (
             .rename({'FACTSET_INST_ENTITY_ID': 'FACTSET_ENTITY_ID'})
             )
 
-# Import own_sec_entity_eq table
-own_sec_entity_eq = pl.read_parquet(os.path.join(factset_dir, 'own_sec_entity_eq.parquet'),
-                                use_pyarrow=True)
-
-
-# Prices
-own_sec_prices = pl.read_parquet(os.path.join(factset_dir, 'own_sec_prices_eq.parquet'),
-                                 use_pyarrow=True)
-
 
 
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#    FORMAT OWN_SEC_PRICES TABLE
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    UNIVERSE OF STOCKS AND COMPANY MARKET CAP
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Define quarter date 'date_q'
-own_sec_prices = apply_quarter_scheme(own_sec_prices, 'PRICE_DATE')
-
-
-# Keep only the most recent 'price' observation within a quarter
-# for each security (data already sorted)
-own_sec_prices_q = ( 
-    own_sec_prices
-    .group_by(['FSYM_ID', 'date_q'])
-    .agg(pl.all().sort_by('PRICE_DATE').last())
-    )
-
-
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#     SOME HOUSKEEPING
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-
-# termination_date TABLE (Termination quarter for each owneship security)
-termination_date = ( 
-    own_sec_prices
-    .group_by('FSYM_ID')
-    .agg(pl.col('date_q').max().alias('TERMINATION_DATE'))
-    )
-
-
-
-# Keep necessary columns
-own_sec_cov_ = own_sec_cov.select(['FSYM_ID',
-                                   'ISSUE_TYPE',
-                                   'ISO_COUNTRY'])
-
-# Join
-equity_secs = own_sec_cov_.join(sym_cov, how='left', on=['FSYM_ID'])
-
-# Equity or ADR
-filter1 = pl.col('ISSUE_TYPE').is_in(['EQ', 'AD'])
-
-# Preffered share
-filter2 = pl.col('ISSUE_TYPE').is_in(['PF']) & pl.col('FREF_SECURITY_TYPE').is_in(['PREFEQ'])
-
-# equity_secs TABLE (Universe of stocks)
-equity_secs = equity_secs.filter(filter1 | filter2)
+# Built once by part_00_reference_universe.py (hmktcap.parquet is also
+# saved there)
 
 # own_basic TABLE (Universe of stocks plus information)
-own_basic = ( 
-    equity_secs
-    .join(own_sec_entity_eq, how='inner', on=['FSYM_ID'])
-    .join(termination_date, how='inner', on=['FSYM_ID'])
-    )
+own_basic = load_artifact(cd, 'own_basic', factset_dir=factset_dir)
 
-# prices_historical TABLE 
-prices_historical = own_sec_prices_q
-
-# Free memory
-del own_sec_cov, own_sec_cov_, equity_secs, termination_date, own_sec_prices
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#    OWN MARKET CAP PROCEDURE
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-#  own_mv TABLE (market cap at the security level)
-own_mv = ( 
-    own_sec_prices_q.with_columns(
-    (pl.col('ADJ_PRICE') * pl.col('ADJ_SHARES_OUTSTANDING')).alias('ADJ_OWN_MV'),
-    (pl.col('UNADJ_PRICE') * pl.col('UNADJ_SHARES_OUTSTANDING')).alias('UNADJ_OWN_MV')
-    )
-    .select(['FSYM_ID', 'date_q', 'ADJ_OWN_MV', 'UNADJ_OWN_MV'])
-    )
-
-# Use information of unadjusted prices if information from adjusted prices is 
-# insufficient.
-own_mv = own_mv.with_columns(
-    pl.when(pl.col('ADJ_OWN_MV') == 0)
-    .then(pl.col('UNADJ_OWN_MV'))
-    .otherwise(pl.col('ADJ_OWN_MV'))
-    .alias('OWN_MV')
-    )
+# hmktcap TABLE (market cap at the firm-level + housekeeping)
+hmktcap = load_artifact(cd, 'hmktcap', factset_dir=factset_dir)
 
-# Market cap at the security level for non-ADR universe of stocks
-own_mktcap1 = ( 
-    own_mv.select(['FSYM_ID', 'date_q', 'OWN_MV'])
-    .join(own_basic.select(['FSYM_ID', 'FACTSET_ENTITY_ID', 'ISSUE_TYPE', 'FREF_SECURITY_TYPE']), 
-          how='inner', on=['FSYM_ID'])
-    .filter(pl.col('ISSUE_TYPE') != 'AD')
-    )
 
+# ///////////////////////////////////////////////////////
 
-r"""
-* unilever;
-proc sql;
-delete from own_mktcap1 where fsym_id eq 'DXVFL5-S' and price_date ge '30SEP2015'd;
-"""
+#        MUTUAL FUNDS REPORTS 
 
+# ///////////////////////////////////////////////////////
 
-# own_mktcap TABLE (market cap at the firm level
-own_mktcap = (
-    own_mktcap1
-    .group_by(['FACTSET_ENTITY_ID', 'date_q'])
-    .agg(pl.col('OWN_MV').sum())
-    )
+# Columns of the v1_holdingsmf TABLE
+REPORT_COLUMNS = ['FACTSET_FUND_ID',
+                  'FSYM_ID',
+                  'date_q',
+                  'ADJ_HOLDING',
+                  'MKTCAP_HOLDING',
+                  'MKTCAP_USD',
+                  'IO',
+                  'COMPANY_ID',
+                  'ISO_COUNTRY',
+                  'REPORT_DATE']
+
+
+def reports_mf(path, folder, factset_dir, quarters=None):
+    """
+    v1_holdingsmf TABLE (Mutual funds reported positions for universe of
+    stocks plus company level market capitalization) of the funds dataset
+    'path' and of the quarters 'quarters' (first, last; all quarters if
+    None), lazily
+    """
+
+    own_fund = scan_table(path,
+                          columns=['FACTSET_FUND_ID',
+                                   'FSYM_ID',
+                                   'REPORT_DATE',
+                                   'ADJ_HOLDING'])
+
+    # Define the period 'date_q' (quarter, or month with FACTSET_FREQUENCY=monthly)
+    own_fund = apply_period_scheme(own_fund, 'REPORT_DATE')
+    if quarters is not None:
+        own_fund = own_fund.filter(pl.col('date_q').is_between(*quarters))
 
+    # auxmf TABLE (13F reports with the most recent report date within quarter)
+    auxmf = latest_observation(own_fund,
+                               ['FACTSET_FUND_ID', 'FSYM_ID', 'date_q'],
+                               'REPORT_DATE')
+
+    # Market capitalizaton at the firm level for securities plus adjusted
+    # prices at the security level
+    hmktcap_prc = scan_artifact(folder, 'hmktcap_prc', factset_dir=factset_dir)
+
+    return (
+        auxmf
+        .join(hmktcap_prc, how='inner', on=['FSYM_ID', 'date_q'])
+        .with_columns(
+            (pl.col('ADJ_HOLDING')*pl.col('ADJ_PRICE')/1000000).alias('MKTCAP_HOLDING')
+            )
+        .with_columns(
+            (acc('MKTCAP_HOLDING')/acc('MKTCAP_USD')).alias('IO')
+            )
+        .select(REPORT_COLUMNS)
+        )
 
-# hmktcap TABLE (market cap at the firm-level + housekeeping)
-hmktcap = ( 
-    own_mktcap.with_columns(
-    (pl.col('OWN_MV')/1000000).alias('MKTCAP_USD')
-    )
-    .select(['FACTSET_ENTITY_ID', 'date_q', 'MKTCAP_USD'])
-    )
-hmktcap = hmktcap.filter(pl.col('MKTCAP_USD').is_not_null() &
-                         (pl.col('MKTCAP_USD') > 0))
-hmktcap = hmktcap.sort(by=['FACTSET_ENTITY_ID', 'date_q'])
 
-# Save 
-hmktcap.write_parquet(os.path.join(cd, 'hmktcap.parquet'))
-                     
+def fund_quarters(path, folder, factset_dir):
+    """ Fund-quarter pairs of the reports of the funds dataset 'path' """
+    return (
+        reports_mf(path, folder, factset_dir)
+        .select(['FACTSET_FUND_ID', 'date_q'])
+        .unique()
+        .collect()
+        )
 
-# Free memory
-del own_mv, own_mktcap, own_mktcap1
 
-# ///////////////////////////////////////////////////////
+def impute_mf(first_halo, first, last, path, folder, factset_dir, periods_pl, fund_max, sym_range):
+    """ Imputed fund reports of the funds dataset 'path' of the quarters 'first' to 'last' """
 
-#        MUTUAL FUNDS REPORTS 
+    # Fund reports of the quarters 'first' to 'last' and of the 7
+    # quarters before them (halo), read for this range only
+    reports = reports_mf(path, folder, factset_dir, quarters=(first_halo, last)).collect()
+    
+    # fill_mf TABLE (fund-quarter pairs to be filled by previous reports)
+    # The quarters between two reports of a fund that are within 7
+    # quarters (IMPUTATION_MONTHS, in months) of the last report.
+    fill_mf = imputation_fills(reports,
+                               'FACTSET_FUND_ID',
+                               horizon=IMPUTATION_MONTHS,
+                               periods_pl=periods_pl,
+                               entity_max=fund_max)
+    fill_mf = fill_mf.filter(pl.col('date_q').is_between(first, last))
+    
+    # inserts_mf TABLE (Fill the quarterly reports of the mutual funds
+    # that are missing and are within the 7 quarter mark of the last reported
+    # quarter)
+    reports = ( 
+                reports
+                .select(['FACTSET_FUND_ID',
+                        'FSYM_ID',
+                        'date_q',
+                        'IO',
+                        'COMPANY_ID',
+                        'ISO_COUNTRY'])
+                .rename({'date_q':'LAST_REPORT_QUARTER'})
+                )
+    
+    inserts_mf = fill_mf.join(reports,
+                              how='left',
+                              on=['FACTSET_FUND_ID', 'LAST_REPORT_QUARTER'])
+    
+    # Account for the termination date of each security 'FSYM_ID'
+    inserts_mf = inserts_mf.join(sym_range, on=['FSYM_ID'])
+    # Drop security-quarter pairs for which the quarter exceeds the termination
+    # date
+    inserts_mf = inserts_mf.filter(pl.col('date_q')<=pl.col('maxofqtr'))
+    
+    # Some housekeeping 
+    return (
+        inserts_mf
+        .drop(['maxofqtr', 'LAST_REPORT_QUARTER'])
+        .sort(by=['FACTSET_FUND_ID', 'FSYM_ID', 'date_q'])
+        )
 
-# ///////////////////////////////////////////////////////
 
 print('Mutual funds reports \n')
 
@@ -259,88 +220,30 @@ print('Mutual funds reports \n')
 # i)   Break the mutual funds dataset into 17 tables in chunks of 10,000 funds 
 # ii)  Filter securities as per Ferreira & Matos (2008)
 # iii) Drop any US securities from the tables
+# The reports of a dataset are read by ranges of quarters in the imputation;
+# only the fund-quarter pairs of the whole dataset are collected at once.
+
+# sym_range TABLE (Find the termination quarter for each security)
+sym_range = ( 
+    own_basic
+    .select(['FSYM_ID', 'TERMINATION_DATE'])
+    .rename({'TERMINATION_DATE' : 'maxofqtr'})
+    .unique()
+    )
 
 # Output table after iteration through funds datasets
 output_table = pl.DataFrame()
 
-dataset = 'funds_table_1.parquet'
-
-# Iterate through the mutual funds datasets
-for dataset in os.listdir(funds_dir):
-    
-    print('%s is processed \n' % dataset)
-    
-    
-    # Import mutual funds dataset
-    own_fund = pl.read_parquet(os.path.join(funds_dir, dataset),
-                               use_pyarrow=True,
-                               columns = ['FACTSET_FUND_ID',
-                                          'FSYM_ID',
-                                          'REPORT_DATE',
-                                          'ADJ_HOLDING'])
-    
-    # Define quarter 'date_q' in integer format based on 'REPORT_DATE'
-    own_fund = apply_quarter_scheme(own_fund, 'REPORT_DATE')
-    
-    # Sort 
-    own_fund = (own_fund.sort(by=['FACTSET_FUND_ID', 
-                                  'FSYM_ID', 
-                                  'REPORT_DATE']))
-    
-    # auxmf TABLE (13F reports with the most recent report date within quarter)
-    auxmf = ( 
-        own_fund
-        .group_by(['FACTSET_FUND_ID','FSYM_ID', 'date_q'])
-        .agg(pl.all().sort_by('REPORT_DATE').last())
-        .sort(by=['FACTSET_FUND_ID','FSYM_ID', 'date_q'])
-        )
-    
-    # v1_holdingsmf TABLE (Mutual funds reported positions for universe of stocks
-    # plus company level market capitalization)
-    
-    # Market capitalizaton at the firm level for securities
-    hmktcap_ = hmktcap.join(own_basic.select(['FSYM_ID', 'FACTSET_ENTITY_ID', 'ISO_COUNTRY']),
-                            how='inner', 
-                            on=['FACTSET_ENTITY_ID'])
-    hmktcap_ = hmktcap_.rename({'FACTSET_ENTITY_ID' : 'COMPANY_ID'})
+# Iterate through the mutual funds datasets (the fund-quarter pairs of the
+# next dataset are read in the background)
+for path, report_quarters in prefetch([os.path.join(funds_dir, dataset)
+                                       for dataset in os.listdir(funds_dir)],
+                                      functools.partial(fund_quarters,
+                                                        folder=cd,
+                                                        factset_dir=factset_dir),
+                                      stage='Mutual funds reports'):
     
-    # Augment with adjusted prices at the security level
-    hmktcap_prc = hmktcap_.join(prices_historical.select(['FSYM_ID', 'date_q', 'ADJ_PRICE']),
-                             how='inner',
-                             on=['FSYM_ID', 'date_q'])
-    
-    
-    v1_holdingsmf = auxmf.join(hmktcap_prc, 
-                                 how='inner',
-                                 on=['FSYM_ID', 'date_q'])
-    v1_holdingsmf = ( 
-        v1_holdingsmf.with_columns(
-        (pl.col('ADJ_HOLDING')*pl.col('ADJ_PRICE')/1000000).alias('MKTCAP_HOLDING')
-        )
-        .drop(['ADJ_PRICE'])
-        )
-    v1_holdingsmf = v1_holdingsmf.with_columns(
-        (pl.col('MKTCAP_HOLDING')/pl.col('MKTCAP_USD')).alias('IO')
-        )
-    v1_holdingsmf = ( 
-                    v1_holdingsmf.select(['FACTSET_FUND_ID',
-                                            'FSYM_ID',
-                                            'date_q',
-                                            'ADJ_HOLDING',
-                                            'MKTCAP_HOLDING',
-                                            'MKTCAP_USD',
-                                            'IO',
-                                            'COMPANY_ID',
-                                            'ISO_COUNTRY',
-                                            'REPORT_DATE'])
-                    .sort(by=['FACTSET_FUND_ID',
-                              'FSYM_ID',
-                              'date_q'])
-                    )
-
-
-    # Free memory
-    del auxmf, hmktcap_, hmktcap_prc    
+    print('%s is processed \n' % os.path.basename(path))
     
     
 # ///////////////////////////////////////////////////////
@@ -351,159 +254,38 @@ for dataset in os.listdir(funds_dir):
 
     print('Mutual funds reports - Imputation \n')
     
-    
-    # sym_range TABLE (Find the termination quarter for each security)
-    sym_range = ( 
-        own_basic
-        .select(['FSYM_ID', 'TERMINATION_DATE'])
-        .rename({'TERMINATION_DATE' : 'maxofqtr'})
-        .unique()
-        )
-    
     # rangeofquarters TABLE (all quarters for which FactSet has data)
-    rangeofquarters = v1_holdingsmf.select(['date_q']).unique().sort('date_q')
-    
-    # insts_mf TABLE (all funds for which FactSet has data)
-    insts_mf = ( 
-        v1_holdingsmf
-        .select(['FACTSET_FUND_ID'])
-        .unique()
-        .sort('FACTSET_FUND_ID')
-        )
-    
-    # insts_mfdates TABLE (all possible fund-quarter pairs)
-    insts_mfdates = insts_mf.join(rangeofquarters, how='cross')
-    
-    # pairs_mf TABLE (all fund-quarter pairs)
-    pairs_mf = ( 
-        v1_holdingsmf
-        .select(['FACTSET_FUND_ID', 'date_q'])
-        .unique()
-        .sort(['FACTSET_FUND_ID', 'date_q'])
-        )
-    pairs_mf = pairs_mf.with_columns(
-        pl.lit(1).alias('HAS_REPORT')
-        )
+    rangeofquarters = report_quarters.select(['date_q']).unique().sort('date_q')
     
-    # fund_minmax TABLE (mininum and maximum quarter that each funds reports)
-    fund_minmax = ( 
-        v1_holdingsmf
+    # fund_max TABLE (last quarter of each fund in the dataset). A quarter
+    # is only filled if the fund reports again later.
+    fund_max = (
+        report_quarters
         .group_by(['FACTSET_FUND_ID'])
-        .agg(
-            pl.col('date_q').min().alias('min_quarter'),
-            pl.col('date_q').max().alias('max_quarter')
-            )
-        )    
-        
-    
-    # roll1mf TABLE (master dataset that tracks reporting dates for mutual funds)
-    roll1mf = insts_mfdates.join(fund_minmax,
-                                   how='left', 
-                                   on=['FACTSET_FUND_ID'])
-    # Kepp fund-quarter pairs that fall within the minimum and maximum 
-    # reporting mutual fund quarter
-    roll1mf = roll1mf.filter(
-        (pl.col('min_quarter') <= pl.col('date_q')) & 
-        (pl.col('date_q') <= pl.col('max_quarter'))
-        )
-    
-    # Augment with valid fund-quarter pairs 
-    roll1mf = roll1mf.join(pairs_mf, 
-                             how='left', 
-                             on=['FACTSET_FUND_ID', 'date_q'])
-    
-    roll1mf = roll1mf.with_columns(
-        pl.when(pl.col('HAS_REPORT').is_null())
-        .then(0)
-        .otherwise(pl.col('HAS_REPORT'))
-        .alias('HAS_REPORT')
-        )
-    
-    
-    # Create a dummy variable that is 1 if the last report of the fund
-    # is within 7 quarters from the current quarter.
-    roll1mf = roll1mf.with_columns(
-        pl.when(pl.col('HAS_REPORT')==1)
-        .then(pl.col('date_q'))
-        .otherwise(None)
-        .alias('REPORT_QUARTER')
-        )
-    # Forward fill for 7 quarters the REPORT_QUARTER
-    roll1mf = roll1mf.with_columns(
-        pl.col('REPORT_QUARTER')
-        .forward_fill(limit=7)
-        .over(['FACTSET_FUND_ID'])
-        .alias('LAST_REPORT_QUARTER')
-        )
-    # Define the differce in quarters between the current quarter and the last
-    # report quarter
-    roll1mf = roll1mf.with_columns(
-        (
-        ((pl.col('date_q')/100).floor() -
-        (pl.col('LAST_REPORT_QUARTER')/100).floor())*4 +
-        ((pl.col('date_q').mod(100)) -
-        (pl.col('LAST_REPORT_QUARTER').mod(100)))/3
-        )
-        .cast(pl.Int32)
-        .alias('DIFF_QUARTERS')
-        )
-    
-    # If the difference between current and last reported quarter is 
-    # less or equal than 7, then VALID=1, otherwise 0
-    roll1mf = roll1mf.with_columns(
-        pl.when(pl.col('DIFF_QUARTERS')<=7)
-        .then(1)
-        .otherwise(0)
-        .alias('VALID')
-        )
-    
-    # Example for sanity check
-    roll1mf.filter(pl.col('FACTSET_FUND_ID') == '04B8D4-E').write_csv(os.path.join(cd, 'mf_example.csv'))
-    
-    
-    # Fill_mf TABLE (fund-quarter pairs to be filled by previous reports)
-    fill_mf = (
-        roll1mf
-        .filter((pl.col('HAS_REPORT')==0) & (pl.col('VALID')==1))
-        .select(['FACTSET_FUND_ID', 'date_q', 'LAST_REPORT_QUARTER'])
-        .unique(['FACTSET_FUND_ID', 'date_q'])
-        )
-
-
-    # inserts_mf TABLE (Fill the quarterly reports of the mutual funds
-    # that are missing and are within the 7 quarter mark of the last reported
-    # quarter)
-    v1_holdingsmf_ = ( 
-                        v1_holdingsmf
-                        .select(['FACTSET_FUND_ID',
-                                'FSYM_ID',
-                                'date_q',
-                                'IO',
-                                'COMPANY_ID',
-                                'ISO_COUNTRY'])
-                        .rename({'date_q':'LAST_REPORT_QUARTER'})
-                        )
-    
-    inserts_mf = fill_mf.join(v1_holdingsmf_,
-                                how='left',
-                                on=['FACTSET_FUND_ID', 'LAST_REPORT_QUARTER'])
-    
-    # Account for the termination date of each security 'FSYM_ID'
-    inserts_mf = inserts_mf.join(sym_range, on=['FSYM_ID'])
-    # Drop security-quarter pairs for which the quarter exceeds the termination
-    # date
-    inserts_mf = inserts_mf.filter(pl.col('date_q')<=pl.col('maxofqtr'))
-    
-    # Some housekeeping 
-    inserts_mf = (
-        inserts_mf
-        .drop(['maxofqtr', 'LAST_REPORT_QUARTER'])
-        .sort(by=['FACTSET_FUND_ID', 'FSYM_ID', 'date_q'])
+        .agg(pl.col('date_q').max().alias('max_quarter'))
         )
     
+    # Example for sanity check (reporting grid of the fund, as the roll1mf
+    # table of the original script)
+    imputation_grid(report_quarters.filter(pl.col('FACTSET_FUND_ID') == '04B8D4-E'),
+                    'FACTSET_FUND_ID',
+                    rangeofquarters).write_csv(os.path.join(cd, 'mf_example.csv'))
+    
+    
+    # Impute by ranges of quarters (FACTSET_PERIOD_SHARDS ranges, 7 quarters
+    # of halo each) in parallel. Each range reads its own reports.
+    inserts_mf = run_period_shards(functools.partial(impute_mf,
+                                                     path=path,
+                                                     folder=cd,
+                                                     factset_dir=factset_dir,
+                                                     periods_pl=rangeofquarters,
+                                                     fund_max=fund_max,
+                                                     sym_range=sym_range),
+                                   rangeofquarters,
+                                   halo_months=IMPUTATION_MONTHS)
     
     # Free memory
-    del sym_range, rangeofquarters, insts_mf, pairs_mf, roll1mf, fill_mf, v1_holdingsmf_ 
+    del report_quarters, rangeofquarters, fund_max
        
         
     # The implicit assumption of the imputation method is that funds 
@@ -515,7 +297,7 @@ for dataset in os.listdir(funds_dir):
                                    how='inner',
                                    on=['COMPANY_ID', 'date_q'])
     inserts_mf = inserts_mf.with_columns(
-        (pl.col('IO')*pl.col('MKTCAP_USD')).alias('MKTCAP_HOLDING')
+        (acc('IO')*acc('MKTCAP_USD')).alias('MKTCAP_HOLDING')
         ) 
     
     
@@ -524,19 +306,19 @@ for dataset in os.listdir(funds_dir):
         pl.lit(None).alias('ADJ_HOLDING'),
         pl.lit(None).alias('REPORT_DATE')
         )
-    inserts_mf = inserts_mf.select(v1_holdingsmf.columns)
-    v1_holdingsmf_ = pl.concat([v1_holdingsmf, inserts_mf])
+    inserts_mf = inserts_mf.select(REPORT_COLUMNS)
     
     # Sort and keep unique fund-security-quarter pairs
     v1_holdingsmf_ = (
-        v1_holdingsmf_
+        pl.concat([reports_mf(path, cd, factset_dir), inserts_mf.lazy()])
         .sort(by=['FACTSET_FUND_ID', 'FSYM_ID', 'date_q'])
         .unique(['FACTSET_FUND_ID', 'FSYM_ID', 'date_q'])
+        .collect()
         )
     
     
     # Free memory
-    del v1_holdingsmf, inserts_mf
+    del inserts_mf
     
     # Assign each fund to the institution that manages it
     v1_holdingsmf_ = v1_holdingsmf_.join(own_ent_funds,
@@ -562,8 +344,8 @@ print('Aggregate over institutions \n')
 v2_holdingsmf = (
     output_table
     .group_by(['FACTSET_ENTITY_ID', 'FSYM_ID', 'date_q'])
-    .agg(pl.col('MKTCAP_HOLDING').sum(),
-         pl.col('IO').sum())
+    .agg(acc('MKTCAP_HOLDING').sum(),
+         acc('IO').sum())
     .sort(by=['FACTSET_ENTITY_ID', 'FSYM_ID', 'date_q'])
     )
 
@@ -585,7 +367,7 @@ v2_holdingsmf = v2_holdingsmf.join(other_info,
 #     SAVE
 # ~~~~~~~~~~~~
 
-v2_holdingsmf.write_parquet(os.path.join(cd, 'v2_holdingsmf.parquet'))
+write_handoff(to_storage(v2_holdingsmf), cd, 'v2_holdingsmf')
 
 
 
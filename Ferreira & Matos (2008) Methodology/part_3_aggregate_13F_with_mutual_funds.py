@@ -12,19 +12,30 @@ When both 13F reports and fund reports are available
 Market cap is in millions of USD.
 
 Input:
-    v2_holdings13f.parquet
-    v2_holdingsmf.parquet
-    hmktcap.parquet
+    v2_holdings13f.parquet (.arrow with FACTSET_INTERMEDIATE_FORMAT=ipc)
+    v2_holdingsmf.parquet (.arrow with FACTSET_INTERMEDIATE_FORMAT=ipc)
+    hmktcap.parquet (.arrow with FACTSET_INTERMEDIATE_FORMAT=ipc)
 
     
 Output:
-    holdingsall_company_level.parquet
+    holdingsall_company_level.parquet (.arrow with FACTSET_INTERMEDIATE_FORMAT=ipc)
+    holdingsall_company_level_by_holder.parquet (+ _index.parquet)
+    holdingsall_company_level_by_company.parquet (+ _index.parquet)
 """
 
 
 import os
+import sys
 import polars as pl
 
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import (acc,
+                               to_storage,
+                               read_handoff,
+                               write_handoff,
+                               write_store)
+
 
 # ~~~~~~~~~~~~~~~~~~
 #    DIRECTORIES 
@@ -53,26 +64,24 @@ funds_dir = os.path.join(factset_dir, 'own_fund_eq_v5_full_split_by_fund')
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 # Holdings from 13F reports
-v2_holdings13f = pl.read_parquet(os.path.join(cd, 'v2_holdings13f.parquet'),
-                                 use_pyarrow=True,
-                                 columns = ['FACTSET_ENTITY_ID',
-                                            'FSYM_ID',
-                                            'date_q',
-                                            'IO',
-                                            'COMPANY_ID',
-                                            'ISO_COUNTRY'])
+v2_holdings13f = read_handoff(cd, 'v2_holdings13f',
+                            columns = ['FACTSET_ENTITY_ID',
+                                       'FSYM_ID',
+                                       'date_q',
+                                       'IO',
+                                       'COMPANY_ID',
+                                       'ISO_COUNTRY'])
 v2_holdings13f = v2_holdings13f.rename({'ISO_COUNTRY' : 'SEC_COUNTRY'})
 
 
 # Holdings from Mutual Funds reports
-v2_holdingsmf = pl.read_parquet(os.path.join(cd, 'v2_holdingsmf.parquet'),
-                                 use_pyarrow=True,
-                                 columns = ['FACTSET_ENTITY_ID',
-                                            'FSYM_ID',
-                                            'date_q',
-                                            'IO',
-                                            'COMPANY_ID',
-                                            'ISO_COUNTRY'])
+v2_holdingsmf = read_handoff(cd, 'v2_holdingsmf',
+                            columns = ['FACTSET_ENTITY_ID',
+                                       'FSYM_ID',
+                                       'date_q',
+                                       'IO',
+                                       'COMPANY_ID',
+                                       'ISO_COUNTRY'])
 v2_holdingsmf = v2_holdingsmf.rename({'ISO_COUNTRY' : 'SEC_COUNTRY'})
 
 
@@ -281,7 +290,7 @@ del holdings13f_only, holdingsmf_only, holdings13fmf, holdings13fmf_
 adjfactor = (
     v1_holdingsall
     .group_by(['COMPANY_ID', 'date_q'])
-    .agg(pl.col('IO').sum())
+    .agg(acc('IO').sum())
     )
 
 adjfactor = adjfactor.with_columns(
@@ -304,7 +313,7 @@ v1_holdingsall = v1_holdingsall.join(adjfactor,
 # Adjust IO at the security level
 v1_holdingsall = ( 
     v1_holdingsall.with_columns(
-    (pl.col('IO')/pl.col('adjf')).alias('IO')
+    (acc('IO')/pl.col('adjf')).alias('IO')
     )
     .drop(['adjf'])
     )
@@ -318,8 +327,7 @@ del adjfactor
 # ~~~~~~~~~~~~~~~~~~~~~~~~
 
 # Import company-level market capitalization in millions USD
-hmktcap = pl.read_parquet(os.path.join(cd, 'hmktcap.parquet'),
-                          use_pyarrow=True)
+hmktcap = read_handoff(cd, 'hmktcap')
 hmktcap = hmktcap.rename({'FACTSET_ENTITY_ID' : 'COMPANY_ID'})
 
 # Augment holdings with company market cap
@@ -329,7 +337,7 @@ v2_holdingsall = v1_holdingsall.join(hmktcap,
 
 # Market cap holdings
 v2_holdingsall = v2_holdingsall.with_columns(
-    (pl.col('IO')*pl.col('MKTCAP_USD')).alias('MKTCAP_HELD')
+    (acc('IO')*acc('MKTCAP_USD')).alias('MKTCAP_HELD')
     )
 
 
@@ -337,7 +345,12 @@ v2_holdingsall = v2_holdingsall.with_columns(
 #     SAVE
 # ~~~~~~~~~~~~~~~~
 
-v2_holdingsall.write_parquet(os.path.join(cd, 'holdingsall_company_level.parquet'))
+write_handoff(to_storage(v2_holdingsall), cd, 'holdingsall_company_level', export_parquet=True)
+
+# Copies clustered by institution and by company for portfolio and holders
+# queries (get_portfolio, get_holders)
+write_store(to_storage(v2_holdingsall), cd, 'holdingsall_company_level', 'holder')
+write_store(to_storage(v2_holdingsall), cd, 'holdingsall_company_level', 'company')
 
 
 
@@ -349,7 +362,7 @@ v2_holdingsall.write_parquet(os.path.join(cd, 'holdingsall_company_level.parquet
 mcap_held = (
     v2_holdingsall
     .group_by('date_q')
-    .agg(pl.col('MKTCAP_HELD').sum())
+    .agg(acc('MKTCAP_HELD').sum())
     .sort(by='date_q')
     )
 
@@ -357,7 +370,7 @@ mcap_held = (
 mcap_sum = (
     hmktcap
     .group_by('date_q')
-    .agg(pl.col('MKTCAP_USD').sum())
+    .agg(acc('MKTCAP_USD').sum())
     .sort(by='date_q')
     )
 
@@ -18,6 +18,13 @@ has in the portfolio of investor i in quarter t and w_imt is the hypothetical
 market cap weight of security j if investors held a local, regional or global
 market-cap portfolio based on their classification.
 
+The sum runs over the companies held by the investor and the companies of
+its market portfolio. The companies of the market portfolio the investor
+does not hold contribute w_imt, i.e. 1 - Sum_{j held} w_imt in total, so
+the active share is computed from the holdings alone (see
+factset_ownership/activeshare.py). Set FACTSET_ACTIVE_SHARE=truncated to
+only sum over the held companies that are in the market portfolio.
+
 Notes:
     i. The active share's definition of Bartram et al. (2015)
     provides flexibility to calculate the variable at the institutional 
@@ -38,6 +45,7 @@ The Review of Financial Studies, 28(11), 3036-3072.
 Input:
     holdingsall_company_level.parquet 
     investors_type.parquet
+    market_portfolio_weights (factset_ownership/benchmarks.py)
     
     
 Output:
@@ -48,8 +56,13 @@ Output:
 
 
 import os
+import sys
 import polars as pl
 
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import read_table, acc, compute_active_share, read_benchmarks
+
 
 
 # Current directory
@@ -66,24 +79,20 @@ factset_dir =  r'C:\FactSet_Downloadfiles\zips\parquet'
 
 
 # Factset market cap holdings at the security level
-fh = pl.read_parquet(os.path.join(cd,'holdingsall_company_level.parquet'))
+fh = read_table(os.path.join(cd,'holdingsall_company_level.parquet'))
 
 # Classification of investors/institutions to local, regional or global
-investors_type = pl.read_parquet(os.path.join(cd, 'investors_type.parquet'))
+investors_type = read_table(os.path.join(cd, 'investors_type.parquet'))
 
 # sym entity table : country origin of entities
-sym_entity =  pl.read_parquet(os.path.join(factset_dir, 'sym_entity.parquet'),
-                           use_pyarrow=True, 
-                           columns=['FACTSET_ENTITY_ID', 
-                                    'ISO_COUNTRY'])
+sym_entity =  read_table(os.path.join(factset_dir, 'sym_entity.parquet'), 
+                      columns=['FACTSET_ENTITY_ID', 
+                               'ISO_COUNTRY'])
 sym_entity = sym_entity.rename({'FACTSET_ENTITY_ID' : 'COMPANY_ID'})
 
 # ISO country and Region match
-iso_region = pl.read_csv(os.path.join(cd, 'iso_region_match.csv'))
+iso_region = read_table(os.path.join(cd, 'iso_region_match.csv'))
 
-# Market capitalization of all companies in the investable universe
-hmktcap = pl.read_parquet(os.path.join(cd, 'hmktcap.parquet'))
-hmktcap = hmktcap.rename({'FACTSET_ENTITY_ID' : 'COMPANY_ID'})
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -93,8 +102,8 @@ hmktcap = hmktcap.rename({'FACTSET_ENTITY_ID' : 'COMPANY_ID'})
 fh = (
       fh
       .group_by(['FACTSET_ENTITY_ID', 'COMPANY_ID', 'date_q'])
-      .agg(pl.col('IO').sum(),
-           pl.col('MKTCAP_HELD').sum(),
+      .agg(acc('IO').sum(),
+           acc('MKTCAP_HELD').sum(),
            pl.col('MKTCAP_USD').last())
       )
 
@@ -139,7 +148,7 @@ fh_ = fh_.join(iso_company.drop(['COUNTRY_NAME']),
 
 # Total market cap holdings per institution-quarter
 fh_ = fh_.with_columns(
-    pl.col('MKTCAP_HELD')
+    acc('MKTCAP_HELD')
     .sum()
     .over(['FACTSET_ENTITY_ID', 'date_q'])
     .alias('MKTCAP_HELD_TOTAL')
@@ -147,7 +156,7 @@ fh_ = fh_.with_columns(
 
 # Institutional portfolio weights
 fh_ = fh_.with_columns(
-    (pl.col('MKTCAP_HELD') / pl.col('MKTCAP_HELD_TOTAL')).alias('INST_PORTFOLIO_WEIGHT')
+    (acc('MKTCAP_HELD') / pl.col('MKTCAP_HELD_TOTAL')).alias('INST_PORTFOLIO_WEIGHT')
     )
 
 
@@ -164,54 +173,16 @@ fh_ = fh_.with_columns(
 # For global institutions, market cap portfolio weights are calculated from
 # the value-weighted global market portfolio (all investable companies)
 
-# Augment company information with country and region
-hmktcap = hmktcap.join(sym_entity, how='left', on=['COMPANY_ID'])
-hmktcap = hmktcap.join(iso_region, how='left', on=['ISO_COUNTRY'])
-hmktcap = ( 
-    hmktcap
-    .drop(['COUNTRY_NAME'])
-    .rename({'ISO_COUNTRY' : 'COUNTRY'})
-    )
-
-# Use a different dataframe
-mcap = hmktcap
-
-# Total market capitalization per country 
-mcap = mcap.with_columns(
-    pl.col('MKTCAP_USD').sum()
-    .over(['COUNTRY', 'date_q'])
-    .alias('MKTCAP_TOTAL_COUNTRY')
-    )
-
-# Total market capitalization per region
-mcap = mcap.with_columns(
-    pl.col('MKTCAP_USD').sum()
-    .over(['REGION', 'date_q'])
-    .alias('MKTCAP_TOTAL_REGION')
-    )
-
-# Total market capitalization of the world
-mcap = mcap.with_columns(
-    pl.col('MKTCAP_USD').sum()
-    .over(['date_q'])
-    .alias('MKTCAP_TOTAL_WORLD')
-    )
-
-# Market-cap weighted portfolio weights per country, region, world
-mcap = mcap.with_columns(
-    (pl.col('MKTCAP_USD')/pl.col('MKTCAP_TOTAL_COUNTRY')).alias('LOCAL_MARKET_PORTFOLIO_WEIGHT'),
-    (pl.col('MKTCAP_USD')/pl.col('MKTCAP_TOTAL_REGION')).alias('REGIONAL_MARKET_PORTFOLIO_WEIGHT'),
-    (pl.col('MKTCAP_USD')/pl.col('MKTCAP_TOTAL_WORLD')).alias('WORLD_MARKET_PORTFOLIO_WEIGHT') 
-    )
-
-# Keep necessary columns
-market_portfolio_weights = mcap.select(['COMPANY_ID',
-                                      'date_q',
-                                      'COUNTRY',
-                                      'REGION',
-                                      'LOCAL_MARKET_PORTFOLIO_WEIGHT',
-                                      'REGIONAL_MARKET_PORTFOLIO_WEIGHT',
-                                      'WORLD_MARKET_PORTFOLIO_WEIGHT'])
+# The weights are built from hmktcap, sym_entity and iso_region_match.csv
+# once per universe build (see factset_ownership/benchmarks.py)
+market_portfolio_weights = read_benchmarks(cd, factset_dir,
+                                           columns=['COMPANY_ID',
+                                                    'date_q',
+                                                    'COUNTRY',
+                                                    'REGION',
+                                                    'LOCAL_MARKET_PORTFOLIO_WEIGHT',
+                                                    'REGIONAL_MARKET_PORTFOLIO_WEIGHT',
+                                                    'WORLD_MARKET_PORTFOLIO_WEIGHT'])
 
 
 
@@ -250,23 +221,25 @@ del inst_portfolio_weights, market_portfolio_weights
 # For local investors, use local market portfolio weight
 # For regional investors, use regional market portfolio weight
 # For global investors, use global market portfolio weight
+# The benchmark weight is null for companies outside the benchmark
+# (e.g. a foreign company held by a local investor)
 portfolio_weights = portfolio_weights.with_columns(
     pl.when((pl.col('IS_LOCAL_INVESTOR')==1) & (pl.col('COUNTRY') == pl.col('COUNTRY_MAX')))
-    .then((pl.col('INST_PORTFOLIO_WEIGHT') - pl.col('LOCAL_MARKET_PORTFOLIO_WEIGHT')).abs())
+    .then(pl.col('LOCAL_MARKET_PORTFOLIO_WEIGHT'))
     .when((pl.col('IS_REGIONAL_INVESTOR') == 1) & (pl.col('REGION') == pl.col('REGION_MAX')))
-    .then((pl.col('INST_PORTFOLIO_WEIGHT') - pl.col('REGIONAL_MARKET_PORTFOLIO_WEIGHT')).abs())
+    .then(pl.col('REGIONAL_MARKET_PORTFOLIO_WEIGHT'))
     .when(pl.col('IS_GLOBAL_INVESTOR') == 1)
-    .then((pl.col('INST_PORTFOLIO_WEIGHT') - pl.col('WORLD_MARKET_PORTFOLIO_WEIGHT')).abs())
-    .alias('ABS_DEVIATION')
+    .then(pl.col('WORLD_MARKET_PORTFOLIO_WEIGHT'))
+    .alias('BENCHMARK_WEIGHT')
     )
 
 
 
-
+# Active share from the holdings only: the benchmark companies that are not
+# held contribute 1 - (sum of the benchmark weights of the holdings).
+# FACTSET_ACTIVE_SHARE=truncated only sums over the holdings in the benchmark.
 active_share = (
-    portfolio_weights
-    .group_by(['FACTSET_ENTITY_ID', 'date_q'])
-    .agg((0.5*pl.col('ABS_DEVIATION').sum()).alias('ACTIVE_SHARE'))
+    compute_active_share(portfolio_weights)
     .sort(['FACTSET_ENTITY_ID', 'date_q'])
     )
 
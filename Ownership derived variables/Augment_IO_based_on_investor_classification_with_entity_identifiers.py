@@ -13,8 +13,13 @@ Output:
 
 
 import os
+import sys
 import polars as pl
 
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import read_table, interval_join
+
 
 
 # ~~~~~~~~~~~~~~~~~~
@@ -44,11 +49,11 @@ funds_dir = os.path.join(factset_dir, 'own_fund_eq_v5_full_split_by_fund')
 
 
 # Company level IO
-io_comp = pl.read_parquet(os.path.join(cd, 'IO_by_geographic_investment_and_active_share_bartram2015.parquet'))
+io_comp = read_table(os.path.join(cd, 'IO_by_geographic_investment_and_active_share_bartram2015.parquet'))
 
 
 # Entity identifiers
-entity_identifiers = pl.read_parquet(os.path.join(cd, 'entity_identifiers.parquet'))
+entity_identifiers = read_table(os.path.join(cd, 'entity_identifiers.parquet'))
 
 # Factset-CRSP link table
 fc_link = pl.read_csv(os.path.join(cd, 'Factset_CRSP_Link_Table_beta_202307.csv'),
@@ -92,31 +97,24 @@ fc_link_ = (
            'link_edate' : pl.Int32})
     )
 
+# Spells without a PERMNO do not link to CRSP
+fc_link_ = fc_link_.drop_nulls(['PERMNO'])
+
 # Define link_date as end of month of quarter 
 io_comp = io_comp.with_columns(
     (pl.col('date_q')*100 + 29).cast(pl.Int32).alias('link_date')
     )
  
 
-# Use FSYM_ID-link_date pairs from IO dataset as reference
-pairs = io_comp.select(['FSYM_ID', 'link_date']).drop_nulls()
-
-# Left merge with pairs
-pairs = pairs.join(fc_link_, 
-                   how='left',
-                   on=['FSYM_ID'])
-# Drop rows for which PERMNO is missing -> keep US pairs
-us_pairs = pairs.filter(pl.col('PERMNO').is_not_null())
-
-# link_date is within the range of start and end date
-us_pairs_ = us_pairs.filter( (pl.col('link_bdate')<=pl.col('link_date')) &
-                             (pl.col('link_date')<=pl.col('link_edate')) )
-
-
-# Augment with IO dataset with matched PERMNO/PERMCO
-io_comp_ = io_comp.join(us_pairs_.drop(['link_bdate', 'link_edate']), 
-                        how='left',
-                        on=['FSYM_ID', 'link_date'])
+# Match every FSYM_ID-link_date pair of the IO dataset to the link spell
+# that covers link_date (link_bdate <= link_date <= link_edate). Pairs that
+# are not covered (non-US) get a missing PERMNO/PERMCO
+io_comp_ = interval_join(io_comp,
+                         fc_link_,
+                         on=['FSYM_ID'],
+                         date='link_date',
+                         start='link_bdate',
+                         end='link_edate')
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Institutional ownership concentration
+
+For every company-quarter I compute
+
+    1. BREADTH       : number of institutions holding the company
+    2. DELTA_BREADTH : change in breadth from the previous quarter
+    3. HHI           : Herfindahl index of the institutional holdings
+    4. TOP5_IO_SHARE : share of IO held by the 5 largest institutions
+
+from one pass over the holdings clustered by company (written by part 3,
+sorted by COMPANY_ID and date_q), so the previous quarter of a company is
+the previous row (see factset_ownership/concentration.py). The
+company-quarters of the universe ('hmktcap') without holders have BREADTH
+0, so DELTA_BREADTH counts the entries and exits of all the holders.
+
+Market cap is in millions USD.
+
+Input:
+    holdingsall_company_level_by_company.parquet
+    hmktcap (part_00_reference_universe.py)
+
+Output:
+    ownership_concentration.parquet
+"""
+
+
+import os
+import sys
+import polars as pl
+
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import (scan_table, to_storage, store_path, load_artifact,
+                               concentration_metrics)
+
+
+# ~~~~~~~~~~~~~~
+#  DIRECTORIES
+# ~~~~~~~~~~~~~~
+
+# Current directory
+cd = r'C:\Users\FMCC\Desktop\Ioannis'
+
+# Parquet Factset tables
+factset_dir =  r'C:\FactSet_Downloadfiles\zips\parquet'
+
+
+# ~~~~~~~~~~~~
+# IMPORT DATA
+# ~~~~~~~~~~~~
+
+# Factset market cap holdings at the company level, sorted by company and
+# quarter
+fh = scan_table(store_path(cd, 'holdingsall_company_level', 'company'),
+                columns=['FACTSET_ENTITY_ID', 'COMPANY_ID', 'date_q', 'IO', 'MKTCAP_HELD'],
+                table='holdingsall_company_level')
+
+# Company-quarters of the universe
+hmktcap = (
+    load_artifact(cd, 'hmktcap', factset_dir=factset_dir,
+                  columns=['FACTSET_ENTITY_ID', 'date_q'])
+    .rename({'FACTSET_ENTITY_ID': 'COMPANY_ID'})
+    )
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#   CONCENTRATION METRICS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+concentration = concentration_metrics(fh, presorted=True, universe=hmktcap).collect()
+
+
+# Median concentration across companies
+concentration_q = (
+    concentration
+    .group_by('date_q')
+    .agg(pl.col('BREADTH').median(),
+         pl.col('HHI').median(),
+         pl.col('TOP5_IO_SHARE').median())
+    .sort('date_q')
+    )
+
+concentration_q.to_pandas().set_index('date_q').plot(subplots=True)
+
+
+# ~~~~~~~~~~~~~~~~~~~~
+#   SAVE
+# ~~~~~~~~~~~~~~~~~~
+
+to_storage(concentration).write_parquet(os.path.join(cd, 'ownership_concentration.parquet'))
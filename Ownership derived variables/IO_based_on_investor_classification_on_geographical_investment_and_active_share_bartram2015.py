@@ -11,6 +11,9 @@ I decompose total IO into 6 components:
     5. IO_LA : IO of local and active
     6. IO_LP : IO of local and passive
 
+The six components are computed in one group_by over the holdings
+(factset_ownership/decomposition.py).
+
 
 Market cap is in millions USD.
 
@@ -27,11 +30,15 @@ Output:
 """
 
 import os
+import sys
 import polars as pl
 import pandas as pd
-from functools import reduce
 import matplotlib.pyplot as plt
 
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import read_table, acc, decompose, category_columns
+
 
 # Current directory
 cd = r'C:\Users\FMCC\Desktop\Ioannis'
@@ -56,16 +63,16 @@ if save_folder not in os.listdir(cd):
 
 
 # Factset market cap holdings at the company level
-fh = pl.read_parquet(os.path.join(cd,'holdingsall_company_level.parquet'))
+fh = read_table(os.path.join(cd,'holdingsall_company_level.parquet'))
 
 
 
 # Global, regional, local investors of Bartram et al. (2015)
-investors_type = pl.read_parquet(os.path.join(cd, 'investors_type.parquet')) 
+investors_type = read_table(os.path.join(cd, 'investors_type.parquet')) 
 
 
 # Active share of Bartram et al. (2015)
-active_share = pl.read_parquet(os.path.join(cd, 'active_share_bartram2015.parquet'))
+active_share = read_table(os.path.join(cd, 'active_share_bartram2015.parquet'))
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -75,8 +82,8 @@ active_share = pl.read_parquet(os.path.join(cd, 'active_share_bartram2015.parque
 fh = (
       fh
       .group_by(['FACTSET_ENTITY_ID', 'COMPANY_ID', 'date_q'])
-      .agg(pl.col('IO').sum(),
-           pl.col('MKTCAP_HELD').sum(),
+      .agg(acc('IO').sum(),
+           acc('MKTCAP_HELD').sum(),
            pl.col('MKTCAP_USD').last())
       )
 
@@ -91,24 +98,6 @@ fh = (
 investors_type_ = investors_type.filter(pl.col('IS_CLASSIFIED') == 1)
 
 
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#     TOTAL INSTITUTIONAL OWNERSHIP IO
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-io = ( 
-       fh
-       .group_by(['COMPANY_ID', 'date_q'])
-       .agg(pl.col('IO').sum())
-       .sort(by=['COMPANY_ID', 'date_q'])
-       )
-#  AGGREGATE MARKET CAP HOLDINGS BY QUARTER
-io_sum = ( 
-    fh
-    .group_by('date_q')
-    .agg(pl.col('MKTCAP_HELD').sum().alias('MKTCAP_HELD_ALL'))
-    .sort('date_q')
-    )
-
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #   AUGMENT HOLDINGS WITH INVESTOR CLASSIFICATION
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -124,193 +113,87 @@ fh = fh.join(active_share,
              on=['FACTSET_ENTITY_ID', 'date_q'])
 
 
-# Keep only observations that are not null
-fh_ = fh.drop_nulls()
-
-
-# Number of firms in the final sample
-num_stocks = fh_.select(['COMPANY_ID', 'date_q']).unique()
-
-num_stocks_q = ( 
-    num_stocks
-    .group_by('date_q')
-    .agg(pl.col('COMPANY_ID').count().alias('COUNT'))
-    .sort(by='date_q')
-    )
-
-num_stocks_q.to_pandas().set_index('date_q').plot()
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#  GLOBAL AND ACTIVE INVESTORS : IO_GA
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-# Keep only global and active institutions
-fh_s = fh_.filter( 
-    (pl.col('IS_GLOBAL_INVESTOR') == 1)
-    & (pl.col('IS_PASSIVE_INVESTOR') == 0)
-    )
-#  IO_GA
-io_ga = ( 
-       fh_s
-       .group_by(['COMPANY_ID', 'date_q'])
-       .agg(pl.col('IO').sum().alias('IO_GA'))
-       .sort(by=['COMPANY_ID', 'date_q'])
-       )
-#  AGGREGATE MARKET CAP HOLDINGS BY QUARTER
-io_ga_sum = ( 
-    fh_s
-    .group_by('date_q')
-    .agg(pl.col('MKTCAP_HELD').sum().alias('MKTCAP_HELD_GA'))
-    .sort('date_q')
-    )
-
-
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#  GLOBAL AND PASSIVE INVESTORS : IO_GP
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-# Keep only global and passive institutions
-fh_s = fh_.filter( 
-    (pl.col('IS_GLOBAL_INVESTOR') == 1)
-    & (pl.col('IS_PASSIVE_INVESTOR') == 1)
-    )
-#  IO_GP
-io_gp = ( 
-       fh_s
-       .group_by(['COMPANY_ID', 'date_q'])
-       .agg(pl.col('IO').sum().alias('IO_GP'))
-       .sort(by=['COMPANY_ID', 'date_q'])
-       )
-#  AGGREGATE MARKET CAP HOLDINGS BY QUARTER
-io_gp_sum = ( 
-    fh_s
-    .group_by('date_q')
-    .agg(pl.col('MKTCAP_HELD').sum().alias('MKTCAP_HELD_GP'))
-    .sort('date_q')
+# Only observations that are not null are decomposed (total IO still
+# includes all holdings)
+fh = fh.with_columns(
+    (~pl.any_horizontal(pl.all().is_null())).alias('IN_SAMPLE')
     )
 
 
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#  REGIONAL AND ACTIVE INVESTORS : IO_RA
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#     INVESTOR CATEGORIES
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Keep only regional and active institutions
-fh_s = fh_.filter( 
-    (pl.col('IS_REGIONAL_INVESTOR') == 1)
-    & (pl.col('IS_PASSIVE_INVESTOR') == 0)
-    )
-#  IO_RA
-io_ra = ( 
-       fh_s
-       .group_by(['COMPANY_ID', 'date_q'])
-       .agg(pl.col('IO').sum().alias('IO_RA'))
-       .sort(by=['COMPANY_ID', 'date_q'])
-       )
-#  AGGREGATE MARKET CAP HOLDINGS BY QUARTER
-io_ra_sum = ( 
-    fh_s
-    .group_by('date_q')
-    .agg(pl.col('MKTCAP_HELD').sum().alias('MKTCAP_HELD_RA'))
-    .sort('date_q')
-    )
+# Global, regional, local and active, passive institutions
+is_global = pl.col('IN_SAMPLE') & (pl.col('IS_GLOBAL_INVESTOR') == 1)
+is_regional = pl.col('IN_SAMPLE') & (pl.col('IS_REGIONAL_INVESTOR') == 1)
+is_local = pl.col('IN_SAMPLE') & (pl.col('IS_LOCAL_INVESTOR') == 1)
+is_active = pl.col('IS_PASSIVE_INVESTOR') == 0
+is_passive = pl.col('IS_PASSIVE_INVESTOR') == 1
+
+# One split with six categories. More splits (e.g. foreign/domestic) can be
+# added here and are computed in the same group_by
+splits = {
+    'GEO_STYLE': {
+        'GA': is_global & is_active,
+        'GP': is_global & is_passive,
+        'RA': is_regional & is_active,
+        'RP': is_regional & is_passive,
+        'LA': is_local & is_active,
+        'LP': is_local & is_passive,
+        }
+    }
 
 
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#  REGIONAL AND PASSIVE INVESTORS : IO_RP
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#     IO DECOMPOSITION
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Keep only regional and passive institutions
-fh_s = fh_.filter( 
-    (pl.col('IS_REGIONAL_INVESTOR') == 1)
-    & (pl.col('IS_PASSIVE_INVESTOR') == 1)
-    )
-#  IO_RP
-io_rp = ( 
-       fh_s
-       .group_by(['COMPANY_ID', 'date_q'])
-       .agg(pl.col('IO').sum().alias('IO_RP'))
-       .sort(by=['COMPANY_ID', 'date_q'])
-       )
-#  AGGREGATE MARKET CAP HOLDINGS BY QUARTER
-io_rp_sum = ( 
-    fh_s
-    .group_by('date_q')
-    .agg(pl.col('MKTCAP_HELD').sum().alias('MKTCAP_HELD_RP'))
-    .sort('date_q')
-    )
+# Total and category IO and market cap holdings of every company-quarter
+# in one group_by
+io_dec = decompose(fh,
+                   splits,
+                   ['IO', 'MKTCAP_HELD'],
+                   aggs=[pl.col('IN_SAMPLE').any()])
 
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#  LOCAL AND ACTIVE INVESTORS : IO_LA
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Keep only local and active institutions
-fh_s = fh_.filter( 
-    (pl.col('IS_LOCAL_INVESTOR') == 1)
-    & (pl.col('IS_PASSIVE_INVESTOR') == 0)
-    )
-#  IO_LA
-io_la = ( 
-       fh_s
-       .group_by(['COMPANY_ID', 'date_q'])
-       .agg(pl.col('IO').sum().alias('IO_LA'))
-       .sort(by=['COMPANY_ID', 'date_q'])
-       )
-#  AGGREGATE MARKET CAP HOLDINGS BY QUARTER
-io_la_sum = ( 
-    fh_s
+# Number of firms in the final sample
+num_stocks_q = ( 
+    io_dec
+    .filter(pl.col('IN_SAMPLE'))
     .group_by('date_q')
-    .agg(pl.col('MKTCAP_HELD').sum().alias('MKTCAP_HELD_LA'))
-    .sort('date_q')
+    .agg(pl.col('COMPANY_ID').count().alias('COUNT'))
+    .sort(by='date_q')
     )
 
-
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-#  LOCAL AND PASSIVE INVESTORS : IO_LP
-# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
-
-# Keep only local and passive institutions
-fh_s = fh_.filter( 
-    (pl.col('IS_LOCAL_INVESTOR') == 1)
-    & (pl.col('IS_PASSIVE_INVESTOR') == 1)
-    )
-# IO_LP
-io_lp = ( 
-       fh_s
-       .group_by(['COMPANY_ID', 'date_q'])
-       .agg(pl.col('IO').sum().alias('IO_LP'))
-       .sort(by=['COMPANY_ID', 'date_q'])
-       )
-#  AGGREGATE MARKET CAP HOLDINGS BY QUARTER
-io_lp_sum = ( 
-    fh_s
-    .group_by('date_q')
-    .agg(pl.col('MKTCAP_HELD').sum().alias('MKTCAP_HELD_LP'))
-    .sort('date_q')
-    )
+num_stocks_q.to_pandas().set_index('date_q').plot()
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #    COMPANY LEVEL IO
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Merge
-io_comp_ls = [io, io_ga, io_gp, io_ra, io_rp, io_la, io_lp]
-io_comp = reduce(lambda a,b : a.join(b, 
-                                     how='full',
-                                     coalesce=True,
-                                     on=['COMPANY_ID','date_q']), io_comp_ls)
 # Null values are 0 positions
-io_comp = io_comp.fill_null(0)
-io_comp = io_comp.sort(['COMPANY_ID', 'date_q'])
+io_comp = ( 
+    io_dec
+    .select(['COMPANY_ID', 'date_q', 'IO'] + category_columns(splits, 'IO'))
+    .fill_null(0)
+    .sort(['COMPANY_ID', 'date_q'])
+    )
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~
 #   AGGREGATE LEVEL IO 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-# Merge
-io_sum_ls = [io_sum, io_ga_sum, io_gp_sum, io_ra_sum, io_rp_sum, io_la_sum, io_lp_sum]
-io_agg = reduce(lambda a,b : a.join(b, how='inner', on='date_q'), io_sum_ls)
+#  AGGREGATE MARKET CAP HOLDINGS BY QUARTER
+mcap_held_cols = ['MKTCAP_HELD'] + category_columns(splits, 'MKTCAP_HELD')
+io_agg = ( 
+    io_dec
+    .group_by('date_q')
+    .agg(acc(mcap_held_cols).sum())
+    .rename({'MKTCAP_HELD' : 'MKTCAP_HELD_ALL'})
+    .sort('date_q')
+    )
 
 # To pandas
 io_agg_pd = io_agg.to_pandas()
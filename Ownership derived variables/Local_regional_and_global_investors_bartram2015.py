@@ -53,9 +53,14 @@ Output:
 
 
 import os
+import sys
 import polars as pl
 import pandas as pd
 
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import read_table, acc
+
 # ~~~~~~~~~~~~~~
 #  DIRECTORIES
 # ~~~~~~~~~~~~~~
@@ -80,17 +85,16 @@ print('Local, regional and global investors - START \n')
 # ~~~~~~~~~~~~~~~~~
 
 # Onwership holdings at the company level
-holdingsall = pl.read_parquet(os.path.join(cd, 'holdingsall_company_level.parquet'))
+holdingsall = read_table(os.path.join(cd, 'holdingsall_company_level.parquet'))
 
 # sym entity table : country origin of entities
-sym_entity =  pl.read_parquet(os.path.join(factset_dir, 'sym_entity.parquet'),
-                           use_pyarrow=True, 
-                           columns=['FACTSET_ENTITY_ID', 
-                                    'ISO_COUNTRY'])
+sym_entity =  read_table(os.path.join(factset_dir, 'sym_entity.parquet'), 
+                      columns=['FACTSET_ENTITY_ID', 
+                               'ISO_COUNTRY'])
 sym_entity = sym_entity.rename({'FACTSET_ENTITY_ID' : 'COMPANY_ID'})
 
 # ISO country and Region match
-iso_region = pl.read_csv(os.path.join(cd, 'iso_region_match.csv'))
+iso_region = read_table(os.path.join(cd, 'iso_region_match.csv'))
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -149,7 +153,7 @@ investors_type = (
 fh_country = ( 
     fh_
     .group_by(['FACTSET_ENTITY_ID', 'date_q', 'ISO_COUNTRY'])
-    .agg(pl.col('MCAP_HELD').sum())
+    .agg(acc('MCAP_HELD').sum())
     )
 
 # Sort
@@ -354,7 +358,7 @@ del fh_country_aug, min_max_q, fh_country
 fh_region = ( 
     fh_
     .group_by(['FACTSET_ENTITY_ID', 'date_q', 'REGION'])
-    .agg(pl.col('MCAP_HELD').sum())
+    .agg(acc('MCAP_HELD').sum())
     )
 
 # Sort
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Largest institutional holders of every company-quarter
+
+I keep the K largest institutions of every company and quarter, ranked by
+their IO (or their market cap holdings), and the share of the IO of the
+company they hold. The reports that need the largest holders of a company
+read this side table instead of sorting the holdings.
+
+Market cap is in millions USD.
+
+Input:
+    holdingsall_company_level.parquet
+
+Output:
+    top_holders.parquet
+"""
+
+
+import os
+import sys
+import polars as pl
+
+# Shared helpers (factset_ownership package at the root of the repository)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from factset_ownership import scan_table, to_storage, top_holders
+
+
+# ~~~~~~~~~~~~~~
+#  DIRECTORIES
+# ~~~~~~~~~~~~~~
+
+# Current directory
+cd = r'C:\Users\FMCC\Desktop\Ioannis'
+
+# Parquet Factset tables
+factset_dir =  r'C:\FactSet_Downloadfiles\zips\parquet'
+
+
+# ~~~~~~~~~~~~~~
+#  PARAMETERS
+# ~~~~~~~~~~~~~~
+
+# Number of holders per company-quarter
+K = 10
+
+# Ranking measure ('IO' or 'MKTCAP_HELD')
+RANK_BY = 'IO'
+
+
+# ~~~~~~~~~~~~
+# IMPORT DATA
+# ~~~~~~~~~~~~
+
+# Factset market cap holdings at the company level
+fh = scan_table(os.path.join(cd, 'holdingsall_company_level.parquet'),
+                columns=['FACTSET_ENTITY_ID', 'COMPANY_ID', 'date_q', 'IO', 'MKTCAP_HELD'])
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+#   TOP K HOLDERS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# The K largest institutions of every company-quarter (top_k_by within
+# the company-quarter group_by, see factset_ownership/topholders.py)
+top = top_holders(fh, k=K, by=RANK_BY).collect()
+
+
+# Share of IO held by the K largest holders, averaged across companies
+top_share_q = (
+    top
+    .filter(pl.col('RANK') == 1)
+    .group_by('date_q')
+    .agg(pl.col('TOP_K_IO_SHARE').mean())
+    .sort('date_q')
+    )
+
+top_share_q.to_pandas().set_index('date_q').plot()
+
+
+# ~~~~~~~~~~~~~~~~~~~~
+#   SAVE
+# ~~~~~~~~~~~~~~~~~~
+
+to_storage(top).write_parquet(os.path.join(cd, 'top_holders.parquet'))
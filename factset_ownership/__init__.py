@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the FactSet ownership scripts.
+
+The scripts in the methodology folders import the helpers from here
+instead of re-defining them in every file. Add the root of the repository
+to sys.path before importing, e.g.
+
+    import sys
+    sys.path.append(repo_dir)
+    from factset_ownership import latest_observation
+
+"""
+
+from factset_ownership.reductions import latest_observation
+from factset_ownership.frequency import (apply_period_scheme, period_range, imputation_fills,
+                                         imputation_grid, frequency_name, FREQUENCY,
+                                         IMPUTATION_MONTHS)
+from factset_ownership.schemas import read_table, scan_table, apply_schema, memory_report
+from factset_ownership.precision import (acc, to_storage, precision_report,
+                                         storage_error_report)
+from factset_ownership.handoff import read_handoff, scan_handoff, write_handoff
+from factset_ownership.universe import load_artifact, scan_artifact, write_artifacts
+from factset_ownership.precedence import (candidate_positions, resolve_positions,
+                                          compare_policies,
+                                          SOURCE_13F, SOURCE_STAKES, SOURCE_FUNDS,
+                                          POLICY_SCHEME_1, POLICY_SCHEME_1_BASELINE,
+                                          POLICY_SCHEME_2, POLICY_SCHEME_3, POLICY_SCHEME_4)
+from factset_ownership.ledger import (latest_flags, ledger_rows, write_ledger, scan_ledger,
+                                     read_ledger)
+from factset_ownership.windows import (latest_within_window, window_quarters, window_months,
+                                       WINDOW_MONTHS_NA, WINDOW_MONTHS_UKSR, WINDOW_MONTHS_GLOBAL)
+from factset_ownership.snapshots import holdings_snapshot, perspective_dates, prices_as_of, scan_observations
+from factset_ownership.shards import shard_filter, shard_name, shard_files, read_shards, scan_shards
+from factset_ownership.timeshards import run_period_shards, period_shards
+from factset_ownership.prefetch import prefetch, PREFETCH_STATS
+from factset_ownership.classification import (write_classification, scheme_securities,
+                                               scheme_holders, classify_positions, in_scheme)
+from factset_ownership.union import write_union, scan_union, overlap_report
+from factset_ownership.activeshare import compute_active_share, ACTIVE_SHARE_VARIANT
+from factset_ownership.benchmarks import scan_benchmarks, read_benchmarks, write_benchmarks
+from factset_ownership.decomposition import decompose, category_key, category_columns
+from factset_ownership.links import interval_join, spell_overlaps
+from factset_ownership.principal import (update_principal_index, scan_principal_index,
+                                          read_principal_index, lookup_principal_security)
+from factset_ownership.stores import (write_store, get_portfolio, get_holders,
+                                     ownership_breakdown, store_index, store_path)
+from factset_ownership.topholders import top_holders, holder_positions, TOP_K
+from factset_ownership.concentration import concentration_metrics
+from factset_ownership.flows import write_flows, scan_flows, position_flows
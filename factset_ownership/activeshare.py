@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Active share of institutional portfolios
+
+The active share of Cremers & Petajisto (2009) of institution i against
+its benchmark m is
+
+    AS_i = 0.5 * Sum_j | w_ij - w_mj |
+
+over every company j that is in the portfolio or in the benchmark. The
+companies of the benchmark that the institution does not hold contribute
+their benchmark weight, so with b_j = 0 for the held companies outside
+the benchmark
+
+    AS_i = 0.5 * ( Sum_{j held} | w_ij - b_j | + 1 - Sum_{j held} b_j )
+
+since the benchmark weights sum to one. The exact measure only needs the
+holdings of the institution and the benchmark weight of each holding:
+nothing is expanded to the companies of the benchmark.
+
+With
+
+    set FACTSET_ACTIVE_SHARE=truncated
+
+the sum only runs over the holdings that are in the benchmark, as in the
+first versions of 'Active_share_bartram2015.py'. The default is
+FACTSET_ACTIVE_SHARE=exact.
+"""
+
+
+import os
+import polars as pl
+
+
+ACTIVE_SHARE_VARIANT = os.environ.get('FACTSET_ACTIVE_SHARE', 'exact').lower()
+
+if ACTIVE_SHARE_VARIANT not in ('exact', 'truncated'):
+    raise ValueError("FACTSET_ACTIVE_SHARE must be 'exact' or 'truncated', got %r"
+                     % ACTIVE_SHARE_VARIANT)
+
+
+def compute_active_share(weights, by=None, weight='INST_PORTFOLIO_WEIGHT',
+                         benchmark='BENCHMARK_WEIGHT', variant=None):
+    """
+    'ACTIVE_SHARE' of every 'by' group (institution-quarter) of the
+    holdings 'weights': the portfolio 'weight' of every holding and the
+    'benchmark' weight of the company in the benchmark of the institution
+    (null if the company is not in the benchmark). Works with DataFrames
+    and LazyFrames.
+    """
+
+    if by is None:
+        by = ['FACTSET_ENTITY_ID', 'date_q']
+    if variant is None:
+        variant = ACTIVE_SHARE_VARIANT
+
+    if variant == 'truncated':
+        measure = 0.5 * (pl.col(weight) - pl.col(benchmark)).abs().sum()
+    elif variant == 'exact':
+        b = pl.col(benchmark).fill_null(0)
+        measure = 0.5 * ((pl.col(weight) - b).abs().sum() + 1 - b.sum())
+    else:
+        raise ValueError("variant must be 'exact' or 'truncated', got %r" % variant)
+
+    return weights.group_by(by).agg(measure.alias('ACTIVE_SHARE'))
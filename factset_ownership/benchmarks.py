@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Market portfolio weights (local, regional and world benchmarks)
+
+The active share of Bartram et al. (2015) compares the portfolio of an
+institution with the market-cap weighted portfolio of its country, its
+region or the world. The weights only depend on the company market cap
+('hmktcap' of part_00_reference_universe.py), the country of the company
+(sym_entity) and the region of the country (iso_region_match.csv), so
+they are built once per universe build and stored as a Parquet dataset
+partitioned by 'date_q'
+
+    market_portfolio_weights/date_q=200203/00000000.parquet
+    ...
+
+with one row per company-quarter:
+
+    COMPANY_ID | date_q | COUNTRY | REGION | MKTCAP_USD |
+    MKTCAP_TOTAL_COUNTRY | MKTCAP_TOTAL_REGION | MKTCAP_TOTAL_WORLD |
+    LOCAL_MARKET_PORTFOLIO_WEIGHT | REGIONAL_MARKET_PORTFOLIO_WEIGHT |
+    WORLD_MARKET_PORTFOLIO_WEIGHT
+
+'market_portfolio_weights.json' records the universe build and the
+fingerprints (name, size, modification time) of sym_entity and
+iso_region_match.csv the weights come from. scan_benchmarks() rebuilds
+them when 'hmktcap' was rebuilt or either file changed since.
+"""
+
+
+import os
+import json
+import shutil
+import polars as pl
+
+from factset_ownership.precision import acc, to_storage
+from factset_ownership.schemas import read_table, apply_schema
+from factset_ownership.frequency import frequency_name
+from factset_ownership.universe import load_artifact, read_manifest, inputs_fingerprint
+
+
+BENCHMARKS_NAME = 'market_portfolio_weights'
+
+
+def benchmarks_path(folder):
+    """ Directory of the weights in 'folder' ('_monthly' suffix in monthly mode) """
+    return os.path.join(folder, frequency_name(BENCHMARKS_NAME))
+
+
+def benchmarks_stamp_path(folder):
+    """ Path of the record of the universe build of the weights """
+    return os.path.join(folder, frequency_name(BENCHMARKS_NAME + '.json'))
+
+
+def universe_stamp(folder, factset_dir):
+    """
+    Universe build (creation time and inputs fingerprint) of 'hmktcap' and
+    fingerprints of sym_entity in 'factset_dir' and iso_region_match.csv
+    in 'folder'
+    """
+
+    manifest = read_manifest(folder)
+    return {'CREATED': manifest['CREATED'],
+            'INPUTS_FINGERPRINT': manifest['INPUTS_FINGERPRINT'],
+            'HMKTCAP_HASH': manifest['ARTIFACTS']['hmktcap']['CONTENT_HASH'],
+            'SYM_ENTITY_FINGERPRINT': inputs_fingerprint(factset_dir, ['sym_entity.parquet']),
+            'ISO_REGION_FINGERPRINT': inputs_fingerprint(folder, ['iso_region_match.csv'])}
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    BUILD
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def market_portfolio_weights(hmktcap, sym_entity, iso_region):
+    """
+    Local, regional and world market portfolio weights of every
+    company-quarter of 'hmktcap' (FACTSET_ENTITY_ID of the company,
+    'date_q', 'MKTCAP_USD'). Works with DataFrames and LazyFrames.
+    """
+
+    mcap = (
+        hmktcap
+        .select([pl.col('FACTSET_ENTITY_ID').alias('COMPANY_ID'), 'date_q', 'MKTCAP_USD'])
+        .join(sym_entity.select([pl.col('FACTSET_ENTITY_ID').alias('COMPANY_ID'),
+                                 'ISO_COUNTRY']),
+              how='left',
+              on='COMPANY_ID')
+        .join(iso_region.select(['ISO_COUNTRY', 'REGION']), how='left', on='ISO_COUNTRY')
+        .rename({'ISO_COUNTRY': 'COUNTRY'})
+        )
+
+    # Total market capitalization per country, region and of the world
+    # (one group_by each, joined back to the companies)
+    for level, keys in [('COUNTRY', ['COUNTRY', 'date_q']),
+                        ('REGION', ['REGION', 'date_q']),
+                        ('WORLD', ['date_q'])]:
+        totals = mcap.group_by(keys).agg(acc('MKTCAP_USD').sum().alias('MKTCAP_TOTAL_' + level))
+        mcap = mcap.join(totals, how='left', on=keys, nulls_equal=True)
+
+    return mcap.with_columns(
+        (acc('MKTCAP_USD') / pl.col('MKTCAP_TOTAL_COUNTRY')).alias('LOCAL_MARKET_PORTFOLIO_WEIGHT'),
+        (acc('MKTCAP_USD') / pl.col('MKTCAP_TOTAL_REGION')).alias('REGIONAL_MARKET_PORTFOLIO_WEIGHT'),
+        (acc('MKTCAP_USD') / pl.col('MKTCAP_TOTAL_WORLD')).alias('WORLD_MARKET_PORTFOLIO_WEIGHT')
+        )
+
+
+def write_benchmarks(folder, factset_dir):
+    """
+    Build the market portfolio weights from 'hmktcap' in 'folder',
+    sym_entity in 'factset_dir' and iso_region_match.csv in 'folder' and
+    write them partitioned by 'date_q' (replaces them)
+    """
+
+    hmktcap = load_artifact(folder, 'hmktcap', factset_dir=factset_dir,
+                            columns=['FACTSET_ENTITY_ID', 'date_q', 'MKTCAP_USD'])
+    sym_entity = read_table(os.path.join(factset_dir, 'sym_entity.parquet'),
+                            columns=['FACTSET_ENTITY_ID', 'ISO_COUNTRY'])
+    iso_region = read_table(os.path.join(folder, 'iso_region_match.csv'))
+
+    weights = to_storage(market_portfolio_weights(hmktcap, sym_entity, iso_region))
+
+    path = benchmarks_path(folder)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    weights.sort(['date_q', 'COMPANY_ID']).write_parquet(path, partition_by='date_q')
+
+    with open(benchmarks_stamp_path(folder), 'w') as f:
+        json.dump(universe_stamp(folder, factset_dir), f, indent=4)
+
+    return weights
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    SCAN
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def benchmarks_current(folder, factset_dir):
+    """
+    Whether the weights in 'folder' come from the last universe build and
+    the current sym_entity and iso_region_match.csv
+    """
+
+    if not os.path.exists(benchmarks_path(folder)) or \
+       not os.path.exists(benchmarks_stamp_path(folder)):
+        return False
+    with open(benchmarks_stamp_path(folder)) as f:
+        return json.load(f) == universe_stamp(folder, factset_dir)
+
+
+def scan_benchmarks(folder, factset_dir, quarters=None, columns=None):
+    """
+    Lazily scan the market portfolio weights, (re)building them first if
+    they are missing, older than the universe build or built from another
+    sym_entity or iso_region_match.csv. 'quarters' (list
+    of 'date_q' or (first, last) tuple) only reads the matching partitions.
+    """
+
+    if not benchmarks_current(folder, factset_dir):
+        write_benchmarks(folder, factset_dir)
+
+    lf = apply_schema(pl.scan_parquet(benchmarks_path(folder), hive_partitioning=True),
+                      BENCHMARKS_NAME)
+
+    if quarters is not None:
+        if isinstance(quarters, tuple):
+            lf = lf.filter(pl.col('date_q').is_between(quarters[0], quarters[1]))
+        else:
+            lf = lf.filter(pl.col('date_q').is_in(list(quarters)))
+
+    if columns is not None:
+        lf = lf.select(columns)
+
+    return lf
+
+
+def read_benchmarks(folder, factset_dir, quarters=None, columns=None):
+    """ Eager version of scan_benchmarks() """
+    return scan_benchmarks(folder, factset_dir, quarters=quarters, columns=columns).collect()
+
+
+
+if __name__ == '__main__':
+
+    import sys
+
+    weights = write_benchmarks(sys.argv[1], sys.argv[2])
+    print('%d company-quarters, %d quarters' % (weights.height, weights['date_q'].n_unique()))
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Scheme classification of securities and holders
+
+Every scheme script used to build its own Python sets of securities and
+holders from own_sec_coverage and own_ent_institutions and to filter the
+positions ledger with is_in(set). The classification is now built once,
+with the positions ledger, and stored as two small lookup tables:
+
+    scheme_securities   FSYM_ID + SECURITY_CLASS, the FactSet flags of the
+                        security as bits (SECURITY_13F = 1,
+                        SECURITY_13F_CA = 2, SECURITY_UKSR = 4)
+    scheme_holders      FACTSET_ENTITY_ID + HOLDER_13F (FDS_13F_FLAG)
+
+A holder-security pair belongs to
+
+    Scheme 1   13F holder      + 13F US security
+    Scheme 2   13F holder      + 13F CA security
+    Scheme 3   non-13F holder  + security that is not 13F, 13F CA or UKSR
+    Scheme 4   any holder      + UKSR security
+
+The scheme scripts semi-join the ledger with scheme_securities() and
+scheme_holders(), or classify_positions() adds both columns with one join
+each so that in_scheme(k) routes every row to its schemes.
+"""
+
+
+import os
+import polars as pl
+
+from factset_ownership.schemas import read_table, scan_table
+from factset_ownership.shards import shard_filter
+
+
+# Bits of SECURITY_CLASS
+SECURITY_13F = 1
+SECURITY_13F_CA = 2
+SECURITY_UKSR = 4
+
+# Security bits and holder flag of each scheme (None: any)
+SCHEME_SECURITIES = {1: SECURITY_13F, 2: SECURITY_13F_CA, 3: 0, 4: SECURITY_UKSR}
+SCHEME_HOLDER_13F = {1: 1, 2: 1, 3: 0, 4: None}
+
+
+def classification_path(folder, name):
+    """ Path of the classification table 'name' in 'folder' """
+    return os.path.join(folder, name + '.parquet')
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    BUILD
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def flag_bit(flag, bit):
+    """ 'bit' if the FactSet 'flag' is 1, otherwise 0 """
+    return (pl.col(flag) == 1).fill_null(False).cast(pl.Int8) * bit
+
+
+def classification_tables(own_ent_inst, own_sec_cov):
+    """ scheme_securities and scheme_holders tables of the FactSet tables """
+
+    securities = (
+        own_sec_cov
+        .select(['FSYM_ID',
+                 (flag_bit('FDS_13F_FLAG', SECURITY_13F) +
+                  flag_bit('FDS_13F_CA_FLAG', SECURITY_13F_CA) +
+                  flag_bit('FDS_UKSR_FLAG', SECURITY_UKSR))
+                 .alias('SECURITY_CLASS'),
+                 pl.any_horizontal(pl.col('FDS_13F_FLAG', 'FDS_13F_CA_FLAG', 'FDS_UKSR_FLAG')
+                                   .is_null())
+                 .alias('MISSING_FLAG')])
+        # Scheme 3 needs the three flags at 0: securities with a missing flag
+        # and no other flag belong to no scheme
+        .filter(~(pl.col('MISSING_FLAG') & (pl.col('SECURITY_CLASS') == 0)))
+        .select(['FSYM_ID', pl.col('SECURITY_CLASS').cast(pl.Int8)])
+        .unique('FSYM_ID')
+        .sort('FSYM_ID')
+        )
+
+    holders = (
+        own_ent_inst
+        .select(['FACTSET_ENTITY_ID', pl.col('FDS_13F_FLAG').cast(pl.Int8).alias('HOLDER_13F')])
+        .filter(pl.col('HOLDER_13F').is_in([0, 1]))
+        .unique('FACTSET_ENTITY_ID')
+        .sort('FACTSET_ENTITY_ID')
+        )
+
+    return securities, holders
+
+
+def write_classification(folder, factset_dir):
+    """
+    Build the classification tables from own_ent_institutions and
+    own_sec_coverage_eq in 'factset_dir' and write them in 'folder'
+    """
+
+    own_ent_inst = read_table(os.path.join(factset_dir, 'own_ent_institutions.parquet'),
+                              columns=['FACTSET_ENTITY_ID', 'FDS_13F_FLAG'])
+    own_sec_cov = read_table(os.path.join(factset_dir, 'own_sec_coverage_eq.parquet'),
+                             columns=['FSYM_ID', 'FDS_13F_FLAG', 'FDS_13F_CA_FLAG',
+                                      'FDS_UKSR_FLAG'])
+
+    securities, holders = classification_tables(own_ent_inst, own_sec_cov)
+    securities.write_parquet(classification_path(folder, 'scheme_securities'))
+    holders.write_parquet(classification_path(folder, 'scheme_holders'))
+
+    return securities, holders
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    LOOKUPS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def scheme_security_filter(scheme):
+    """ Rows of 'SECURITY_CLASS' that belong to 'scheme' """
+
+    bits = SCHEME_SECURITIES[scheme]
+    if bits == 0:
+        return pl.col('SECURITY_CLASS') == 0
+    return (pl.col('SECURITY_CLASS') & bits) != 0
+
+
+def in_scheme(scheme):
+    """ Rows of classify_positions() that belong to 'scheme' """
+
+    holder_13f = SCHEME_HOLDER_13F[scheme]
+    if holder_13f is None:
+        return scheme_security_filter(scheme).fill_null(False)
+    return (scheme_security_filter(scheme) &
+            (pl.col('HOLDER_13F') == holder_13f)).fill_null(False)
+
+
+def scheme_securities(folder, scheme):
+    """ LazyFrame of the FSYM_ID of the securities of 'scheme' (in the current shard) """
+
+    if scheme not in SCHEME_SECURITIES:
+        raise ValueError('scheme must be 1, 2, 3 or 4, got %r' % scheme)
+
+    return (
+        scan_table(classification_path(folder, 'scheme_securities'))
+        .filter(scheme_security_filter(scheme) & shard_filter())
+        .select('FSYM_ID')
+        )
+
+
+def scheme_holders(folder, scheme):
+    """ LazyFrame of the FACTSET_ENTITY_ID of the holders of 'scheme' """
+
+    if scheme not in SCHEME_HOLDER_13F:
+        raise ValueError('scheme must be 1, 2, 3 or 4, got %r' % scheme)
+    if SCHEME_HOLDER_13F[scheme] is None:
+        raise ValueError('Scheme %d keeps any holder' % scheme)
+
+    return (
+        scan_table(classification_path(folder, 'scheme_holders'))
+        .filter(pl.col('HOLDER_13F') == SCHEME_HOLDER_13F[scheme])
+        .select('FACTSET_ENTITY_ID')
+        )
+
+
+def classify_positions(lf, folder):
+    """
+    Add 'SECURITY_CLASS' and 'HOLDER_13F' to the positions 'lf' (null when
+    the security or the holder is not classified). Filter with in_scheme().
+    """
+
+    securities = scan_table(classification_path(folder, 'scheme_securities'))
+    holders = scan_table(classification_path(folder, 'scheme_holders'))
+
+    return (
+        lf
+        .join(securities, how='left', on='FSYM_ID')
+        .join(holders, how='left', on='FACTSET_ENTITY_ID')
+        )
+
+
+
+if __name__ == '__main__':
+
+    import sys
+
+    securities, holders = write_classification(sys.argv[1], sys.argv[2])
+    for scheme in SCHEME_SECURITIES:
+        print('Scheme %d: %d securities' % (scheme,
+                                             securities.filter(scheme_security_filter(scheme))
+                                             .height))
+    print(holders.group_by('HOLDER_13F').len().sort('HOLDER_13F'))
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Ownership concentration of every company-quarter
+
+concentration_metrics() computes, from one group_by of the institution
+positions in each company-quarter,
+
+    IO              total institutional ownership
+    BREADTH         number of institutions holding the company
+    HHI             Herfindahl index of the institutional holdings,
+                    Sum_i (IO_i / IO)^2
+    TOP5_IO_SHARE   share of IO held by the 5 largest institutions
+
+and the change in breadth from the previous quarter (DELTA_BREADTH). The
+company-quarters are in (COMPANY_ID, date_q) order, so the previous
+quarter of a company is the previous row: DELTA_BREADTH is a shift, not
+a self-join.
+
+The holdings only have the company-quarters with holders, so a company
+that loses (or gains) all its holders would have no previous row. With
+'universe' (COMPANY_ID, date_q of every company-quarter of the universe,
+e.g. 'hmktcap') the company-quarters without holders are added with
+BREADTH 0 and IO 0, so entries and exits count in DELTA_BREADTH.
+DELTA_BREADTH is null for the first quarter of a company, or when the
+previous quarter is missing (no holders and no universe given).
+
+The company store of 'holdingsall_company_level' (factset_ownership/
+stores.py) is already sorted by COMPANY_ID, date_q and FACTSET_ENTITY_ID:
+with presorted=True the groups keep that order and nothing is sorted.
+"""
+
+
+import polars as pl
+
+from factset_ownership.precision import acc
+from factset_ownership.frequency import period_index
+
+
+# Number of largest institutions of TOP5_IO_SHARE
+TOP_HOLDERS = 5
+
+
+def concentration_metrics(holdings, top=TOP_HOLDERS, presorted=False, universe=None):
+    """
+    Concentration metrics of every company-quarter of the security-level
+    'holdings' (FACTSET_ENTITY_ID, COMPANY_ID, date_q, IO, MKTCAP_HELD)
+    and of the company-quarters of 'universe' (COMPANY_ID, date_q)
+    without holders. 'presorted' holdings are sorted by COMPANY_ID and
+    date_q. Works with DataFrames and LazyFrames.
+    """
+
+    keys = ['COMPANY_ID', 'date_q']
+    top_col = 'TOP%d_IO_SHARE' % top
+
+    # IO of every institution in the company-quarter
+    positions = (
+        holdings
+        .group_by(keys + ['FACTSET_ENTITY_ID'], maintain_order=presorted)
+        .agg(acc('IO').sum(), acc('MKTCAP_HELD').sum())
+        )
+
+    metrics = (
+        positions
+        .group_by(keys, maintain_order=presorted)
+        .agg(pl.col('IO').sum(),
+             pl.col('MKTCAP_HELD').sum(),
+             pl.len().alias('BREADTH'),
+             (pl.col('IO') ** 2).sum().alias('IO_SQUARED'),
+             pl.col('IO').top_k(top).sum().alias('IO_TOP'))
+        )
+    if universe is not None:
+        # Company-quarters of the universe without holders (BREADTH 0)
+        if isinstance(metrics, pl.LazyFrame):
+            universe = universe.lazy()
+        metrics = (
+            metrics
+            .join(universe.select(keys).unique(), how='full', on=keys, coalesce=True)
+            .with_columns(pl.col(['IO', 'MKTCAP_HELD']).fill_null(0),
+                          pl.col('BREADTH').fill_null(0))
+            .sort(keys)
+            )
+    elif not presorted:
+        metrics = metrics.sort(keys)
+
+    # Previous row is the previous quarter of the same company
+    previous = (
+        (pl.col('COMPANY_ID') == pl.col('COMPANY_ID').shift(1)) &
+        (period_index() - period_index().shift(1) == 1)
+        )
+
+    return (
+        metrics
+        .with_columns(
+            (pl.col('IO_SQUARED') / pl.col('IO') ** 2).alias('HHI'),
+            (pl.col('IO_TOP') / pl.col('IO')).alias(top_col),
+            pl.when(previous)
+            .then(pl.col('BREADTH').cast(pl.Int64) - pl.col('BREADTH').shift(1))
+            .otherwise(None)
+            .alias('DELTA_BREADTH')
+            )
+        .select(keys + ['IO', 'MKTCAP_HELD', 'BREADTH', 'DELTA_BREADTH', 'HHI', top_col])
+        )
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+Decomposition of IO by investor category
+
+The decomposition of IO into IO_GA, IO_GP, IO_RA, IO_RP, IO_LA and IO_LP
+used to filter the holdings once per category and run a company-level and
+a quarter-level group_by on each subset, then join the results back with
+reduce(join). decompose() derives the category of every row once (one key
+column per split) and computes the sums of all the categories in a single
+group_by with conditional aggregation:
+
+    splits = {'GEO_STYLE': {'GA': global_ & active, 'GP': global_ & passive, ...},
+              'HOME':      {'FOREIGN': ..., 'DOMESTIC': ...}}
+
+    decompose(fh, splits, ['IO', 'MKTCAP_HELD'])
+
+    COMPANY_ID | date_q | IO | IO_GA | IO_GP | ... | IO_FOREIGN | IO_DOMESTIC |
+    MKTCAP_HELD | MKTCAP_HELD_GA | ...
+
+The categories of a split should not overlap: a row gets the label of the
+first condition it meets (null if none). Rows outside every category still
+count in the totals. Adding a split or a category adds aggregations, not
+passes over the holdings.
+"""
+
+
+import polars as pl
+
+from factset_ownership.precision import acc
+
+
+def category_key(categories, name):
+    """
+    Column 'name' with the label of the first of 'categories' ({label:
+    condition}) that the row meets, null if it meets none
+    """
+
+    labels = list(categories)
+    if not labels:
+        raise ValueError('A split needs at least one category')
+
+    key = pl.when(categories[labels[0]].fill_null(False)).then(pl.lit(labels[0]))
+    for label in labels[1:]:
+        key = key.when(categories[label].fill_null(False)).then(pl.lit(label))
+
+    return key.otherwise(pl.lit(None, dtype=pl.String)).alias(name)
+
+
+def category_sums(splits, values):
+    """ Conditional sums of 'values' for every category of every split """
+
+    return [acc(value).filter(pl.col(split) == label).sum().alias(value + '_' + label)
+            for value in values
+            for split, categories in splits.items()
+            for label in categories]
+
+
+def decompose(lf, splits, values, by=None, totals=True, aggs=None):
+    """
+    Sums of 'values' by 'by' (company-quarter) for every category of
+    'splits' ({split: {label: condition}}) in one group_by. 'totals' also
+    keeps the sum over all the rows. 'aggs' are extra aggregations of the
+    same group_by. Works with DataFrames and LazyFrames.
+    """
+
+    if by is None:
+        by = ['COMPANY_ID', 'date_q']
+
+    exprs = [acc(value).sum().alias(value) for value in values] if totals else []
+    exprs = exprs + category_sums(splits, values) + list(aggs or [])
+
+    return (
+        lf
+        .with_columns([category_key(categories, split) for split, categories in splits.items()])
+        .group_by(by)
+        .agg(exprs)
+        )
+
+
+def category_columns(splits, value):
+    """ Names of the columns of decompose() for 'value' """
+    return [value + '_' + label for categories in splits.values() for label in categories]
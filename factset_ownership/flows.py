@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Quarter-over-quarter position changes (flows)
+
+The adjusted-shares holdings are in adjusted shares so that positions can
+be compared from one quarter to the next. position_flows() sums the rows
+of every holder-security-quarter (a key in more than one scheme, see the
+overlap report of union.py, would otherwise show up as spurious flows
+between its own rows), sorts the positions by (FACTSET_ENTITY_ID,
+FSYM_ID, date_q), so that the previous quarter of a holder-security pair
+is the previous row, and
+
+    * adds a zero position in the quarter after the last quarter of every
+      run of positions of a pair (the holder exited the security);
+    * compares every position with the previous row (shift), which is
+      the previous quarter of the pair or nothing (zero position);
+
+without joining the panel with itself. The flows are
+
+    FLOW_TYPE   NEW        first position after no position
+                EXIT       zero position after a position
+                INCREASE   more adjusted shares than the previous quarter
+                DECREASE   less adjusted shares than the previous quarter
+
+with FLOW = ADJ_SHARES_HELD - PREV_ADJ_SHARES_HELD. Unchanged positions
+are not flows and are dropped. The first quarter of the holdings has no
+previous quarter and gets no flows.
+
+write_flows() runs position_flows() on the ranges of quarters of
+FACTSET_PERIOD_SHARDS (see timeshards.py), each with one quarter of halo,
+and sinks the flows of every range into a Parquet dataset partitioned by
+'date_q'
+
+    factset_adj_shares_flows/date_q=200206/00000000.parquet
+    ...
+
+so the memory of the stage is bounded by the size of a range.
+"""
+
+
+import os
+import shutil
+import polars as pl
+
+from factset_ownership.frequency import frequency_name, period_index, index_period, shift_period
+from factset_ownership.precision import acc, to_storage
+from factset_ownership.schemas import apply_schema
+from factset_ownership.timeshards import period_shards
+from factset_ownership.union import scan_union
+
+
+FLOWS_NAME = 'factset_adj_shares_flows'
+
+# Holder-security pair of a position
+FLOW_PAIR = ['FACTSET_ENTITY_ID', 'FSYM_ID']
+
+
+def flows_path(folder, name=FLOWS_NAME):
+    """ Directory of the flows in 'folder' ('_monthly' suffix in monthly mode) """
+    return os.path.join(folder, frequency_name(name))
+
+
+def same_pair(n):
+    """ Whether the row 'n' rows before (n > 0) or after (n < 0) is the same pair """
+    return pl.all_horizontal([pl.col(c) == pl.col(c).shift(n) for c in FLOW_PAIR]).fill_null(False)
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    FLOWS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def position_flows(holdings, first, last, value='ADJ_SHARES_HELD'):
+    """
+    Flows of the periods 'first' to 'last' of the 'holdings' (FACTSET_ENTITY_ID,
+    FSYM_ID, date_q, 'value') of the periods the period before 'first' to
+    'last'. Rows with the same holder, security and period are summed.
+    Works with DataFrames and LazyFrames.
+    """
+
+    prev_col = 'PREV_' + value
+
+    # One position per holder-security-period (the rows of overlapping
+    # schemes are summed), otherwise the previous row would not be the
+    # previous period of the pair
+    positions = (
+        holdings
+        .group_by(FLOW_PAIR + [pl.col('date_q').cast(pl.Int32)])
+        .agg(acc(value).sum().alias(value))
+        .with_columns(period_index().alias('PERIOD_IDX'))
+        .sort(FLOW_PAIR + ['PERIOD_IDX'])
+        )
+
+    # Zero position in the period after the last period of every run
+    next_period = same_pair(-1) & (pl.col('PERIOD_IDX').shift(-1) == pl.col('PERIOD_IDX') + 1)
+    exits = (
+        positions
+        .filter(~next_period & (pl.col('date_q') < last))
+        .with_columns((pl.col('PERIOD_IDX') + 1).alias('PERIOD_IDX'),
+                      pl.lit(0.0).alias(value))
+        .with_columns(index_period().alias('date_q'))
+        )
+
+    # Previous row is the previous period of the pair
+    prev_period = same_pair(1) & (pl.col('PERIOD_IDX').shift(1) == pl.col('PERIOD_IDX') - 1)
+
+    flows = (
+        pl.concat([positions, exits])
+        .sort(FLOW_PAIR + ['PERIOD_IDX'])
+        .with_columns(pl.when(prev_period).then(pl.col(value).shift(1))
+                      .otherwise(0.0)
+                      .alias(prev_col))
+        .with_columns((pl.col(value) - pl.col(prev_col)).alias('FLOW'))
+        .with_columns(
+            pl.when((pl.col(prev_col) == 0) & (pl.col(value) != 0)).then(pl.lit('NEW'))
+            .when((pl.col(prev_col) != 0) & (pl.col(value) == 0)).then(pl.lit('EXIT'))
+            .when(pl.col('FLOW') > 0).then(pl.lit('INCREASE'))
+            .when(pl.col('FLOW') < 0).then(pl.lit('DECREASE'))
+            .otherwise(None)
+            .alias('FLOW_TYPE')
+            )
+        .filter(pl.col('date_q').is_between(first, last) & pl.col('FLOW_TYPE').is_not_null())
+        .select(FLOW_PAIR + ['date_q', 'FLOW_TYPE', prev_col, value, 'FLOW'])
+        )
+
+    return apply_schema(flows, 'position_flows')
+
+
+def write_flows(folder, holdings_name='factset_adj_shares_holdings',
+                table='scheme_adj_shares_held', name=FLOWS_NAME, num_shards=None):
+    """
+    Compute the flows of the adjusted-shares holdings 'holdings_name' in
+    'folder' by ranges of periods and sink them into the dataset 'name'
+    partitioned by 'date_q' (replaces it). Returns the number of flows of
+    every period and FLOW_TYPE.
+    """
+
+    holdings = scan_union(folder, holdings_name, table)
+    dates = holdings.select('date_q').unique().sort('date_q').collect()
+
+    path = flows_path(folder, name)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    # The first period has no previous period
+    for first, last in period_shards(dates.slice(1), num_shards):
+        start = shift_period(first, -1)
+        flows = position_flows(holdings.filter(pl.col('date_q').is_between(start, last)),
+                               first, last)
+        to_storage(flows).sink_parquet(pl.PartitionBy(path, key='date_q'), mkdir=True)
+        print('Flows %d-%d written' % (first, last))
+
+    return (
+        scan_flows(folder, name)
+        .group_by(['date_q', 'FLOW_TYPE'])
+        .len()
+        .sort(['date_q', 'FLOW_TYPE'])
+        .collect()
+        )
+
+
+def scan_flows(folder, name=FLOWS_NAME):
+    """ Lazily scan the flows written by write_flows() """
+    return apply_schema(pl.scan_parquet(flows_path(folder, name), hive_partitioning=True),
+                        'position_flows')
+
+
+
+if __name__ == '__main__':
+
+    import sys
+
+    with pl.Config(tbl_rows=-1):
+        print(write_flows(sys.argv[1]))
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Frequency of the holdings panels
+
+The scheme scripts and the Ferreira & Matos parts bucket prices, 13F
+reports, stakes and fund reports into quarters. With
+
+    set FACTSET_FREQUENCY=monthly
+
+they bucket them into months instead. The default is
+FACTSET_FREQUENCY=quarterly, i.e. nothing changes.
+
+The period column keeps its name 'date_q' and its format: the yyyymm of
+the last month of the period (200203, 200206, ... for quarters and
+200201, 200202, ... for months), so every join and filter on 'date_q'
+works in both modes. Windows and imputation horizons are expressed in
+months (e.g. the 7-quarter imputation horizon is IMPUTATION_MONTHS = 21)
+and converted to a number of periods with periods().
+
+Monthly files are written next to the quarterly ones with a '_monthly'
+suffix (see frequency_name()), so the two modes never overwrite each
+other.
+"""
+
+
+import os
+import datetime
+import polars as pl
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    FREQUENCY MODE
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+FREQUENCY = os.environ.get('FACTSET_FREQUENCY', 'quarterly').lower()
+
+# Months in a period of each frequency
+FREQUENCY_MONTHS = {'quarterly': 3, 'monthly': 1}
+
+if FREQUENCY not in FREQUENCY_MONTHS:
+    raise ValueError("FACTSET_FREQUENCY must be 'quarterly' or 'monthly', got %r" % FREQUENCY)
+
+PERIOD_MONTHS = FREQUENCY_MONTHS[FREQUENCY]
+
+# Institutions and funds that miss a report are filled with their last
+# report for up to 7 quarters
+IMPUTATION_MONTHS = 21
+
+
+def periods(months):
+    """ Number of periods in 'months' months """
+    return months // PERIOD_MONTHS
+
+
+def frequency_name(name):
+    """ File or folder name of the current frequency ('_monthly' suffix) """
+
+    if FREQUENCY == 'quarterly':
+        return name
+    root, ext = os.path.splitext(name)
+    return '%s_%s%s' % (root, FREQUENCY, ext)
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    PERIODS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def period_of(date_col):
+    """ Period 'date_q' (Int32 yyyymm of the last month) of a date column """
+
+    date = pl.col(date_col)
+    month = ((date.dt.month().cast(pl.Int32) - 1) // PERIOD_MONTHS + 1) * PERIOD_MONTHS
+    return (date.dt.year().cast(pl.Int32) * 100 + month).cast(pl.Int32)
+
+
+def apply_period_scheme(df, date_col):
+    """ Define the period 'date_q' of every row based on 'date_col' """
+    return df.with_columns(period_of(date_col).alias('date_q'))
+
+
+def period_index(date_q='date_q'):
+    """ Running index of the period 'date_q' (consecutive periods differ by 1) """
+
+    date_q = pl.col(date_q)
+    return (date_q // 100 * 12 + date_q % 100 - 1) // PERIOD_MONTHS
+
+
+def index_period(index='PERIOD_IDX'):
+    """ Period 'date_q' of a running index (inverse of period_index()) """
+
+    month = pl.col(index) * PERIOD_MONTHS + PERIOD_MONTHS - 1
+    return (month // 12 * 100 + month % 12 + 1).cast(pl.Int32)
+
+
+def date_period(date):
+    """ Period (int yyyymm) of a datetime.date """
+    return date.year * 100 + ((date.month - 1) // PERIOD_MONTHS + 1) * PERIOD_MONTHS
+
+
+def shift_period(date_q, n):
+    """ Period (int yyyymm) 'n' periods after 'date_q' (before if n < 0) """
+
+    index = (date_q // 100 * 12 + date_q % 100 - 1) // PERIOD_MONTHS + n
+    month = index * PERIOD_MONTHS + PERIOD_MONTHS - 1
+    return month // 12 * 100 + month % 12 + 1
+
+
+def period_range(first, last):
+    """ DataFrame of the periods 'date_q' from 'first' to 'last' (yyyymm) """
+
+    first = date_period(datetime.date(first // 100, first % 100, 1))
+    last = date_period(datetime.date(last // 100, last % 100, 1))
+
+    return (
+        pl.DataFrame({'date_q': [first, last]})
+        .select(pl.int_range(period_index().first(), period_index().last() + 1)
+                .alias('PERIOD_IDX'))
+        .select(index_period().alias('date_q'))
+        )
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    IMPUTATION
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def imputation_fills(pairs, key, horizon=IMPUTATION_MONTHS, periods_pl=None,
+                     entity_max=None):
+    """
+    Periods to fill with the last report of each 'key' (institution or
+    fund): the periods between two consecutive reports of 'pairs' ('key'
+    + 'date_q' of the reports) that are at most 'horizon' months after
+    the last report. Returns 'key', 'date_q' and 'LAST_REPORT_QUARTER'.
+
+    The fills are generated from the reports, so nothing is built for the
+    key x period grid. 'periods_pl' ('date_q') restricts the fills to the
+    periods of the panel.
+
+    When 'pairs' only holds a range of periods, 'entity_max' ('key' +
+    'max_quarter', the last report over the whole history) tells whether a
+    key reports again after the range, so the last report of the range is
+    filled up to 'max_quarter' as it would be with the full history.
+    """
+
+    limit = periods(horizon)
+
+    fills = (
+        pairs
+        .select([key, 'date_q'])
+        .unique()
+        .sort([key, 'date_q'])
+        .with_columns(period_index().alias('PERIOD_IDX'),
+                      period_index().shift(-1).over(key).alias('NEXT_IDX'))
+        )
+
+    if entity_max is not None:
+        fills = (
+            fills
+            .join(entity_max.select([key, 'max_quarter']), how='left', on=key)
+            .with_columns(pl.col('NEXT_IDX').fill_null(period_index('max_quarter')))
+            .drop('max_quarter')
+            )
+
+    fills = (
+        fills
+        .drop_nulls(['NEXT_IDX'])
+        .select([key,
+                 pl.col('date_q').alias('LAST_REPORT_QUARTER'),
+                 pl.int_ranges(pl.col('PERIOD_IDX') + 1,
+                               pl.min_horizontal(pl.col('NEXT_IDX'),
+                                                 pl.col('PERIOD_IDX') + limit + 1))
+                 .alias('PERIOD_IDX')])
+        .explode('PERIOD_IDX')
+        .drop_nulls(['PERIOD_IDX'])
+        .with_columns(index_period().alias('date_q'))
+        .select([key, 'date_q', 'LAST_REPORT_QUARTER'])
+        )
+
+    if periods_pl is not None:
+        fills = fills.join(periods_pl.select('date_q'), how='semi', on='date_q')
+
+    return fills
+
+
+def imputation_grid(pairs, key, periods_pl, horizon=IMPUTATION_MONTHS):
+    """
+    Reporting grid of each 'key' of 'pairs' ('key' + 'date_q' of the
+    reports), as the roll tables of the original parts: every period of
+    'periods_pl' between the first and the last report with 'HAS_REPORT',
+    'REPORT_QUARTER', 'LAST_REPORT_QUARTER' (last report within 'horizon'
+    months), 'DIFF_QUARTERS' (periods since the last report) and 'VALID'.
+
+    The grid has one row per key x period, so it is only meant for a few
+    keys (e.g. the sanity check examples); imputation_fills() gives the
+    periods to fill without it.
+    """
+
+    limit = periods(horizon)
+    reports = pairs.select([key, 'date_q']).unique()
+
+    minmax = (
+        reports
+        .group_by(key)
+        .agg(pl.col('date_q').min().alias('min_quarter'),
+             pl.col('date_q').max().alias('max_quarter'))
+        )
+
+    return (
+        minmax
+        .join(periods_pl.select('date_q'), how='cross')
+        .filter(pl.col('date_q').is_between(pl.col('min_quarter'), pl.col('max_quarter')))
+        .join(reports.with_columns(pl.lit(1).alias('HAS_REPORT')),
+              how='left',
+              on=[key, 'date_q'])
+        .select([key, 'date_q', 'min_quarter', 'max_quarter',
+                 pl.col('HAS_REPORT').fill_null(0)])
+        .sort([key, 'date_q'])
+        .with_columns(pl.when(pl.col('HAS_REPORT') == 1)
+                      .then(pl.col('date_q'))
+                      .otherwise(None)
+                      .alias('REPORT_QUARTER'))
+        .with_columns(pl.col('REPORT_QUARTER')
+                      .forward_fill(limit=limit)
+                      .over(key)
+                      .alias('LAST_REPORT_QUARTER'))
+        .with_columns((period_index() - period_index('LAST_REPORT_QUARTER'))
+                      .cast(pl.Int32)
+                      .alias('DIFF_QUARTERS'))
+        .with_columns(pl.when(pl.col('DIFF_QUARTERS') <= limit)
+                      .then(1)
+                      .otherwise(0)
+                      .alias('VALID'))
+        )
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Hand-off files between the Ferreira & Matos parts
+
+'hmktcap', 'v2_holdings13f', 'v2_holdingsmf' and
+'holdingsall_company_level' are written by one part and read back in full
+by the next one. By default they are Parquet files as before. With
+
+    set FACTSET_INTERMEDIATE_FORMAT=ipc        (uncompressed Arrow IPC)
+    set FACTSET_INTERMEDIATE_FORMAT=ipc_lz4    (LZ4 compressed Arrow IPC)
+
+they are written as Arrow IPC files ('.arrow') instead. Uncompressed IPC
+files are memory-mapped by the reader, so there is no Parquet decode and
+parallel readers share the same pages of the OS cache.
+
+Final deliverables are still exported as Parquet: write_handoff(...,
+export_parquet=True) writes the '.parquet' file next to the '.arrow' one.
+"""
+
+
+import os
+import polars as pl
+
+from factset_ownership.schemas import apply_schema
+from factset_ownership.frequency import frequency_name
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    INTERMEDIATE FORMAT
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+INTERMEDIATE_FORMAT = os.environ.get('FACTSET_INTERMEDIATE_FORMAT', 'parquet').lower()
+
+# IPC compression of each format
+IPC_COMPRESSION = {'ipc': 'uncompressed', 'ipc_lz4': 'lz4'}
+
+if INTERMEDIATE_FORMAT not in ('parquet', 'ipc', 'ipc_lz4'):
+    raise ValueError("FACTSET_INTERMEDIATE_FORMAT must be 'parquet', 'ipc' or 'ipc_lz4', got %r"
+                     % INTERMEDIATE_FORMAT)
+
+
+def handoff_path(folder, name, fmt=None):
+    """
+    Path of the hand-off file 'name' (without extension) in 'folder'
+    ('_monthly' suffix in monthly mode)
+    """
+
+    if fmt is None:
+        fmt = INTERMEDIATE_FORMAT
+    ext = '.parquet' if fmt == 'parquet' else '.arrow'
+    return os.path.join(folder, frequency_name(name) + ext)
+
+
+def write_handoff(df, folder, name, export_parquet=False):
+    """
+    Write the hand-off table 'name' in the intermediate format. With
+    'export_parquet' a Parquet copy is also written when the intermediate
+    format is IPC (for tables that are also final deliverables).
+    """
+
+    if INTERMEDIATE_FORMAT == 'parquet':
+        df.write_parquet(handoff_path(folder, name))
+        return
+
+    df.write_ipc(handoff_path(folder, name),
+                 compression=IPC_COMPRESSION[INTERMEDIATE_FORMAT])
+    if export_parquet:
+        df.write_parquet(handoff_path(folder, name, fmt='parquet'))
+
+
+def scan_handoff(folder, name, columns=None):
+    """
+    Lazily scan the hand-off table 'name' with the registered dtypes.
+    IPC files are memory-mapped.
+    """
+
+    path = handoff_path(folder, name)
+    if INTERMEDIATE_FORMAT == 'parquet':
+        lf = pl.scan_parquet(path)
+    else:
+        lf = pl.scan_ipc(path)
+
+    if columns is not None:
+        lf = lf.select(columns)
+
+    return apply_schema(lf, name)
+
+
+def read_handoff(folder, name, columns=None):
+    """ Eager version of scan_handoff() """
+    return scan_handoff(folder, name, columns=columns).collect()
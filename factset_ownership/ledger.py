@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Positions ledger
+
+Every scheme script used to read and reshape the 13F detail, the stakes
+detail and the fund detail on its own, and part 1 of the Ferreira & Matos
+methodology read the 13F detail once more. 'build_positions_ledger.py'
+reads the three sources once and stores them in one long table
+
+    FACTSET_ENTITY_ID | FSYM_ID | date_q | SOURCE | FACTSET_FUND_ID |
+    SOURCE_CODE | AS_OF_DATE | ADJ_SHARES | REPORTED_SHARES | MARKET_VALUE |
+    LATEST | POSITIVE_SHARES | POSITIVE_VALUE
+
+with the latest observation within the quarter of every
+
+    13F     institution-security         (REPORT_DATE of the 13F report)
+    STAKES  institution-security-source  (AS_OF_DATE of the stake)
+    FUNDS   fund-security                (REPORT_DATE of the fund report,
+                                          FACTSET_ENTITY_ID is the
+                                          institution that manages the fund)
+
+The scheme scripts drop the non-positive observations before they keep
+the latest one of a quarter, so the latest observation is not enough: a
+zero or negative latest report would hide an earlier positive report of
+the same quarter. latest_flags() keeps, for every group, at most three
+observations flagged
+
+    LATEST            latest observation (part 1 of Ferreira & Matos)
+    POSITIVE_SHARES   latest observation with positive shares (reported
+                      holding for 13F and funds, position for stakes)
+    POSITIVE_VALUE    latest observation with a positive value (as
+                      POSITIVE_SHARES, reported market value for funds)
+
+and a scheme filters on the flag of its positivity rule instead of
+filtering the values. 'MARKET_VALUE' is in USD: the position times the
+quarter-end price for 13F and stakes (adjusted holding times adjusted
+price, otherwise reported holding times unadjusted price) and the
+adjusted market value of the fund report (otherwise the reported one)
+for funds.
+
+The ledger is a Parquet dataset partitioned by 'date_q'
+
+    positions_ledger/date_q=200203/00000000.parquet
+    ...
+
+so that a scan restricted to some quarters only reads those partitions.
+"""
+
+
+import os
+import shutil
+import polars as pl
+
+from factset_ownership.schemas import apply_schema
+from factset_ownership.frequency import frequency_name
+from factset_ownership.precedence import SOURCE_13F, SOURCE_STAKES, SOURCE_FUNDS
+
+
+LEDGER_NAME = 'positions_ledger'
+
+# Sources of the ledger
+LEDGER_SOURCE = pl.Enum([SOURCE_13F, SOURCE_STAKES, SOURCE_FUNDS])
+
+# Columns of the ledger (in order)
+LEDGER_COLUMNS = ['FACTSET_ENTITY_ID',
+                  'FSYM_ID',
+                  'date_q',
+                  'SOURCE',
+                  'FACTSET_FUND_ID',
+                  'SOURCE_CODE',
+                  'AS_OF_DATE',
+                  'ADJ_SHARES',
+                  'REPORTED_SHARES',
+                  'MARKET_VALUE',
+                  'LATEST',
+                  'POSITIVE_SHARES',
+                  'POSITIVE_VALUE']
+
+# Flags of the reductions of the ledger
+LEDGER_FLAGS = ['LATEST', 'POSITIVE_SHARES', 'POSITIVE_VALUE']
+
+
+def ledger_path(folder):
+    """ Directory of the ledger in 'folder' ('_monthly' suffix in monthly mode) """
+    return os.path.join(folder, frequency_name(LEDGER_NAME))
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    BUILD
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def latest_flags(df, keys, date_col, positive_shares, positive_value):
+    """
+    Keep the latest observation ('date_col') of every 'keys' group and the
+    latest observation among those where 'positive_shares' (resp.
+    'positive_value') holds, with the LEDGER_FLAGS of each kept row. Ties
+    on the date keep the last row in input order (see latest_observation()).
+    Applying it again to its output gives the same rows and flags.
+    """
+
+    keys = list(keys)
+
+    def last_of(cond):
+        # Last row of the group where 'cond' holds (rows sorted by date)
+        count = cond.fill_null(False).cast(pl.UInt32)
+        return cond.fill_null(False) & (count.cum_sum().over(keys) == count.sum().over(keys))
+
+    return (
+        df
+        .sort(keys + [date_col], nulls_last=False, maintain_order=True)
+        .with_columns(
+            (pl.int_range(pl.len()).over(keys) == pl.len().over(keys) - 1).alias('LATEST'),
+            last_of(positive_shares).alias('POSITIVE_SHARES'),
+            last_of(positive_value).alias('POSITIVE_VALUE')
+            )
+        .filter(pl.any_horizontal(LEDGER_FLAGS))
+        )
+
+
+def ledger_rows(df, source, **columns):
+    """
+    Rows of one source in the ledger layout. 'columns' maps ledger
+    columns to expressions (or column names) of 'df'; ledger columns that
+    are not given are null.
+    """
+
+    names = df.collect_schema().names()
+
+    exprs = []
+    for col in LEDGER_COLUMNS:
+        if col == 'SOURCE':
+            expr = pl.lit(source)
+        elif col in columns:
+            expr = columns[col]
+            if isinstance(expr, str):
+                expr = pl.col(expr)
+        elif col in names:
+            expr = pl.col(col)
+        else:
+            expr = pl.lit(None)
+        exprs.append(expr.alias(col))
+
+    return apply_schema(df.select(exprs).with_columns(pl.col('SOURCE').cast(LEDGER_SOURCE)),
+                        LEDGER_NAME)
+
+
+def write_ledger(ledger, folder):
+    """ Write the ledger sorted and partitioned by 'date_q' (replaces it) """
+
+    path = ledger_path(folder)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    (
+        ledger
+        .sort(['date_q', 'FACTSET_ENTITY_ID', 'FSYM_ID', 'SOURCE'])
+        .write_parquet(path, partition_by='date_q')
+        )
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    SCAN
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def scan_ledger(folder, sources=None, quarters=None, columns=None):
+    """
+    Lazily scan the ledger. 'sources' and 'quarters' (list of 'date_q' or
+    (first, last) tuple) restrict the rows; quarter filters only read the
+    matching partitions.
+    """
+
+    path = ledger_path(folder)
+    if not os.path.exists(path):
+        raise FileNotFoundError('%s not found, run build_positions_ledger.py first' % path)
+
+    lf = apply_schema(pl.scan_parquet(path, hive_partitioning=True), LEDGER_NAME)
+
+    if quarters is not None:
+        if isinstance(quarters, tuple):
+            lf = lf.filter(pl.col('date_q').is_between(quarters[0], quarters[1]))
+        else:
+            lf = lf.filter(pl.col('date_q').is_in(list(quarters)))
+
+    if sources is not None:
+        lf = lf.filter(pl.col('SOURCE').is_in(list(sources)))
+
+    if columns is not None:
+        lf = lf.select(columns)
+
+    return lf
+
+
+def read_ledger(folder, sources=None, quarters=None, columns=None):
+    """ Eager version of scan_ledger() """
+    return scan_ledger(folder, sources=sources, quarters=quarters, columns=columns).collect()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""
+Interval join with dated link tables
+
+Link tables such as the FactSet-CRSP link table map a key (FSYM_ID) to
+an identifier (PERMNO, PERMCO) over spells [link_bdate, link_edate]. The
+Augment_IO script joined every (FSYM_ID, link_date) pair to all the spells
+of the FSYM_ID and then kept the spells that cover the date, so the join
+grew with pairs x spells. interval_join() sorts the spells by start date
+within each key and matches every date to the latest spell that starts
+on or before it (as-of join), then checks the end date of the spell:
+
+    * at most one spell is matched per (key, date) pair;
+    * a date covered by more than one spell (overlapping spells) is
+      flagged as ambiguous and gets the spell with the latest start;
+    * a date that is not covered by the latest spell but by an earlier,
+      longer one (nested spells) is still matched, with a join restricted
+      to these pairs.
+
+Dates and spell bounds must have the same dtype (integers yyyymmdd or
+dates).
+"""
+
+
+import polars as pl
+
+
+def spell_bounds(spells, on, start, end):
+    """
+    Spells sorted by 'on' + 'start' with 'PREV_MAX_END', the latest end
+    of the earlier spells of the same key (null for the first spell)
+    """
+
+    return (
+        spells
+        .sort(list(on) + [start])
+        .with_columns(pl.col(end).cum_max().shift(1).over(on).alias('PREV_MAX_END'))
+        )
+
+
+def spell_overlaps(spells, on, start, end):
+    """ Spells that start before an earlier spell of the same key has ended """
+    return (
+        spell_bounds(spells, on, start, end)
+        .filter(pl.col(start) <= pl.col('PREV_MAX_END'))
+        .drop('PREV_MAX_END')
+        )
+
+
+def interval_join(left, spells, on, date, start, end, ambiguous=None, report=True):
+    """
+    Join to every row of the DataFrame 'left' the values of the spell of
+    'spells' ('on' + 'start' + 'end' + values) that covers 'date'
+    (start <= date <= end), null if no spell covers it. When more than one
+    spell covers the date, the spell with the latest start is kept and
+    the 'ambiguous' column (if given) is True. 'report' prints the number
+    of matched and ambiguous pairs.
+    """
+
+    on = list(on)
+    values = [c for c in spells.columns if c not in on + [start, end]]
+    spells = spell_bounds(spells.drop_nulls(on + [start, end]), on, start, end)
+
+    pairs = left.select(on + [date]).drop_nulls().unique()
+
+    # Latest spell starting on or before the date
+    asof = (
+        pairs
+        .sort(date)
+        .join_asof(spells.sort(start),
+                   left_on=date,
+                   right_on=start,
+                   by=on,
+                   strategy='backward',
+                   check_sortedness=False)
+        )
+
+    covered = (pl.col(date) <= pl.col(end)).fill_null(False)
+    earlier_covers = (pl.col(date) <= pl.col('PREV_MAX_END')).fill_null(False)
+
+    direct = (
+        asof
+        .filter(covered)
+        .select(on + [date] + values + [earlier_covers.alias('AMBIGUOUS')])
+        )
+
+    # Dates only covered by an earlier spell that outlives the latest one
+    nested = (
+        asof
+        .filter(~covered & earlier_covers)
+        .select(on + [date])
+        .join(spells, how='inner', on=on)
+        .filter(pl.col(start) <= pl.col(date), pl.col(date) <= pl.col(end))
+        .sort(on + [date, start])
+        .with_columns((pl.len().over(on + [date]) > 1).alias('AMBIGUOUS'))
+        .unique(on + [date], keep='last', maintain_order=True)
+        .select(on + [date] + values + ['AMBIGUOUS'])
+        )
+
+    matches = pl.concat([direct, nested], how='vertical_relaxed')
+
+    if report:
+        print('%d of %d pairs matched to a spell, %d covered by more than one spell '
+              '(latest start kept)' % (matches.height, pairs.height, matches['AMBIGUOUS'].sum()))
+
+    if ambiguous is None:
+        matches = matches.drop('AMBIGUOUS')
+    else:
+        matches = matches.rename({'AMBIGUOUS': ambiguous})
+
+    return left.join(matches, how='left', on=on + [date])
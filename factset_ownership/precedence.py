@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Source precedence for the FactSet schemes
+
+A holder-security-quarter position can come from a 13F report, a
+stakes-based filing (own_inst_stakes_detail) or the sum of the funds the
+institution manages. Each scheme used to combine the sources with its
+own chain of outer joins and when/then branches. Here the candidate
+positions are stacked in one long table
+
+    FSYM_ID | FACTSET_ENTITY_ID | date_q | SOURCE | AS_OF_DATE | <value>
+
+and resolve_positions() keeps the winning position of every
+holder-security-quarter with one sort and one unique(keep='last').
+
+The winner is chosen by a precedence policy: a list of tiers, each tier a
+list of sources.
+
+    * A source of an earlier tier always beats a source of a later tier
+      (e.g. 13F or stakes before sum of funds).
+    * Within a tier the most recent AS_OF_DATE wins (e.g. the latest
+      13F position unless there is a more recent stakes position).
+    * Ties on the date go to the source listed first in the tier.
+
+Sources that are not in the policy are ignored.
+
+POLICY_SCHEME_1 changes the market cap holdings of scheme 1: the original
+scheme_1_mcap_held.py took the stakes position whenever there was one
+(POLICY_SCHEME_1_BASELINE), while the most recent of the 13F and the
+stakes position now wins, ties going to 13F, as in the FactSet rule and in
+scheme 2 and scheme_1_adj_shares_held.py. compare_policies() lists the
+holder-security-quarters where two policies pick different positions.
+"""
+
+
+import polars as pl
+
+
+# Sources
+SOURCE_13F = '13F'
+SOURCE_STAKES = 'STAKES'
+SOURCE_FUNDS = 'FUNDS'
+
+# Position keys
+POSITION_KEYS = ['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q']
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    POLICIES
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Scheme 1: latest 13F position unless there is a more recent stakes position
+POLICY_SCHEME_1 = [[SOURCE_13F, SOURCE_STAKES]]
+
+# Scheme 1 of the original scheme_1_mcap_held.py: stakes position whenever
+# there is one, otherwise 13F (kept for compare_policies())
+POLICY_SCHEME_1_BASELINE = [[SOURCE_STAKES], [SOURCE_13F]]
+
+# Scheme 2: as scheme 1, then sum of funds if there is no 13F or stakes position
+POLICY_SCHEME_2 = [[SOURCE_13F, SOURCE_STAKES], [SOURCE_FUNDS]]
+
+# Schemes 3 and 4: stakes position within the window, then sum of funds
+POLICY_SCHEME_3 = [[SOURCE_STAKES], [SOURCE_FUNDS]]
+POLICY_SCHEME_4 = [[SOURCE_STAKES], [SOURCE_FUNDS]]
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    CANDIDATES
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def candidate_positions(df, source, value_col, date_col=None, alias=None,
+                        keys=POSITION_KEYS):
+    """
+    Candidate positions of one source in the long format expected by
+    resolve_positions(): keys, 'SOURCE', 'AS_OF_DATE' (null if 'date_col'
+    is None) and the position renamed to 'alias' (default 'value_col').
+    Rows with a null position are dropped.
+    """
+
+    if alias is None:
+        alias = value_col
+
+    if date_col is None:
+        as_of_date = pl.lit(None, dtype=pl.Date)
+    else:
+        as_of_date = pl.col(date_col).cast(pl.Date)
+
+    return (
+        df
+        .select(list(keys) + [pl.lit(source).alias('SOURCE'),
+                              as_of_date.alias('AS_OF_DATE'),
+                              pl.col(value_col).alias(alias)])
+        .drop_nulls([alias])
+        )
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    RESOLVER
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def resolve_positions(candidates, policy, keys=POSITION_KEYS):
+    """
+    Keep the winning candidate of every 'keys' group according to
+    'policy' (list of tiers of sources, see the module docstring).
+
+    'candidates' is a DataFrame or LazyFrame with 'keys', 'SOURCE' and
+    'AS_OF_DATE' (see candidate_positions()). The output has the same
+    columns, one row per group, sorted by 'keys'.
+    """
+
+    keys = list(keys)
+
+    # Tier of each source and priority within its tier (0 is best)
+    tier = {}
+    priority = {}
+    for t, sources in enumerate(policy):
+        for p, source in enumerate(sources):
+            if source in tier:
+                raise ValueError('source %r appears more than once in the policy' % source)
+            tier[source] = t
+            priority[source] = p
+
+    sources = list(tier)
+    source_tier = pl.col('SOURCE').replace_strict(sources, [tier[s] for s in sources],
+                                                  return_dtype=pl.Int8)
+    source_priority = pl.col('SOURCE').replace_strict(sources, [priority[s] for s in sources],
+                                                      return_dtype=pl.Int8)
+
+    # The winner is the last row of each group: best tier, most recent
+    # date, best priority within the tier
+    return (
+        candidates
+        .filter(pl.col('SOURCE').is_in(sources))
+        .sort(keys + [source_tier, 'AS_OF_DATE', source_priority],
+              descending=[False] * len(keys) + [True, False, True],
+              nulls_last=False,
+              maintain_order=True)
+        .unique(subset=keys, keep='last', maintain_order=True)
+        )
+
+
+def compare_policies(candidates, policy, baseline, value_col, keys=POSITION_KEYS):
+    """
+    Winners of 'policy' and of 'baseline' side by side for every 'keys'
+    group of 'candidates': 'SOURCE', 'AS_OF_DATE' and 'value_col' of each,
+    the baseline ones with a 'BASELINE_' prefix, and 'CHANGED' (the two
+    policies pick a different position).
+    """
+
+    keys = list(keys)
+    cols = ['SOURCE', 'AS_OF_DATE', value_col]
+
+    current = resolve_positions(candidates, policy, keys=keys).select(keys + cols)
+    previous = (
+        resolve_positions(candidates, baseline, keys=keys)
+        .select(keys + [pl.col(c).alias('BASELINE_' + c) for c in cols])
+        )
+
+    changed = (
+        pl.col('SOURCE').ne_missing(pl.col('BASELINE_SOURCE')) |
+        pl.col(value_col).ne_missing(pl.col('BASELINE_' + value_col))
+        )
+
+    return (
+        current
+        .join(previous, how='full', on=keys, coalesce=True)
+        .with_columns(changed.alias('CHANGED'))
+        .sort(keys)
+        )
@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+"""
+Float32 storage mode for the holdings columns
+
+The holdings panels carry 'MCAP_HELD', 'MKTCAP_HOLDING', 'MKTCAP_USD',
+'IO' and the portfolio weights as Float64 on every row. With
+
+    set FACTSET_PRECISION=float32
+
+the scripts store these columns as Float32 in their intermediate and
+output files, which halves memory and disk for them. The sums of the
+group_by rollups (company-level IO, 'adjfactor', market cap held, ...)
+are still accumulated in Float64 with acc(), so only the stored values
+are rounded, not the aggregates built from them.
+
+The default is FACTSET_PRECISION=float64, i.e. nothing changes.
+
+In a Float32 run, to_storage() also measures the rounding of the cast on
+every DataFrame it stores: it prints the maximum absolute and relative
+error of each cast column against its Float64 values and keeps the
+maximum over the run in STORAGE_ERRORS (storage_error_report()).
+LazyFrames are cast without the measure (it would collect them).
+
+To see the error of a whole Float32 run, including what the rounding
+does to the aggregates downstream, run the pipeline once in each mode (in
+two different output folders) and compare the outputs:
+
+    python -m factset_ownership.precision <float64 file> <float32 file>
+"""
+
+
+import os
+import sys
+import polars as pl
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    PRECISION MODE
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+PRECISION = os.environ.get('FACTSET_PRECISION', 'float64').lower()
+
+if PRECISION not in ('float64', 'float32'):
+    raise ValueError("FACTSET_PRECISION must be 'float64' or 'float32', got %r" % PRECISION)
+
+# Dtype of the stored holdings columns
+STORAGE_FLOAT = pl.Float32 if PRECISION == 'float32' else pl.Float64
+
+# Holdings, market cap and IO columns stored with STORAGE_FLOAT
+HOLDINGS_FLOAT_COLUMNS = [
+    'MCAP_HELD',
+    'MCAP_HELD_STAKES',
+    'MCAP_HELD_FUNDS',
+    'MKTCAP_HOLDING',
+    'MKTCAP_HELD',
+    'MKTCAP_USD',
+    'ADJ_SHARES_HELD',
+    'IO',
+    'IO_13F',
+    'IO_MF',
+    'INST_PORTFOLIO_WEIGHT',
+    'LOCAL_MARKET_PORTFOLIO_WEIGHT',
+    'REGIONAL_MARKET_PORTFOLIO_WEIGHT',
+    'WORLD_MARKET_PORTFOLIO_WEIGHT',
+    ]
+
+# Maximum error of the Float32 casts of to_storage() over the run, by column
+STORAGE_ERRORS = {}
+
+
+def acc(col):
+    """ Column as a Float64 accumulator, e.g. acc('IO').sum() """
+    return pl.col(col).cast(pl.Float64)
+
+
+def to_storage(df, columns=None):
+    """
+    Cast the holdings columns of 'df' (HOLDINGS_FLOAT_COLUMNS, or the given
+    'columns') to the storage dtype. Columns that are not in 'df' are
+    ignored. Works with DataFrames and LazyFrames.
+    """
+
+    if columns is None:
+        columns = HOLDINGS_FLOAT_COLUMNS
+
+    if isinstance(df, pl.LazyFrame):
+        present = df.collect_schema()
+    else:
+        present = df.schema
+
+    cast_cols = [col for col in columns if col in present and present[col] != STORAGE_FLOAT]
+    if not cast_cols:
+        return df
+
+    if STORAGE_FLOAT == pl.Float32 and isinstance(df, pl.DataFrame) and df.height > 0:
+        errors = storage_error(df, cast_cols)
+        print('Float32 storage error (max abs / max rel): ' +
+              ', '.join('%s %.3g / %.3g' % row for row in errors.iter_rows()))
+        for col, abs_err, rel_err in errors.iter_rows():
+            prev = STORAGE_ERRORS.get(col, (0.0, 0.0))
+            STORAGE_ERRORS[col] = (max(prev[0], abs_err or 0.0), max(prev[1], rel_err or 0.0))
+
+    return df.with_columns([pl.col(col).cast(STORAGE_FLOAT) for col in cast_cols])
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    ERROR ACCOUNTING
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def relative_error(reference, candidate):
+    """
+    |candidate - reference| / |reference| of two Float64 expressions (the
+    absolute error where reference == 0)
+    """
+
+    return (
+        pl.when(reference == 0)
+        .then((candidate - reference).abs())
+        .otherwise((candidate - reference).abs() / reference.abs())
+        )
+
+
+def storage_error(df, columns):
+    """
+    Maximum absolute and relative error of the Float32 cast of 'columns'
+    of 'df' against their Float64 values, one row per column, from one
+    pass over 'df'
+    """
+
+    exprs = []
+    for col in columns:
+        ref = pl.col(col).cast(pl.Float64)
+        cast = ref.cast(pl.Float32).cast(pl.Float64)
+        exprs += [(cast - ref).abs().max().alias(col + '|ABS'),
+                  relative_error(ref, cast).max().alias(col + '|REL')]
+    stats = df.select(exprs).row(0, named=True)
+
+    return pl.DataFrame([(col, stats[col + '|ABS'], stats[col + '|REL']) for col in columns],
+                        schema={'COLUMN': pl.String,
+                                'MAX_ABS_ERROR': pl.Float64,
+                                'MAX_REL_ERROR': pl.Float64},
+                        orient='row')
+
+
+def storage_error_report():
+    """ STORAGE_ERRORS as a DataFrame (one row per column) """
+
+    return pl.DataFrame([(col, err[0], err[1]) for col, err in sorted(STORAGE_ERRORS.items())],
+                        schema={'COLUMN': pl.String,
+                                'MAX_ABS_ERROR': pl.Float64,
+                                'MAX_REL_ERROR': pl.Float64},
+                        orient='row')
+
+
+def precision_error(reference, candidate, keys, columns=None):
+    """
+    Relative error of 'candidate' (e.g. a Float32 run) against 'reference'
+    (the Float64 run) for the float columns they share.
+
+    Rows are matched on 'keys'. The relative error of a cell is
+    |candidate - reference| / |reference| (cells with reference == 0 use
+    the absolute error). Returns one row per column with the maximum and
+    the mean relative error, and the number of rows that did not match.
+    """
+
+    keys = list(keys)
+
+    if columns is None:
+        columns = [col for col, dtype in reference.schema.items()
+                   if dtype in (pl.Float32, pl.Float64)
+                   and col in candidate.columns and col not in keys]
+
+    matched = reference.select(keys + columns).join(
+        candidate.select(keys + columns),
+        on=keys,
+        how='inner',
+        suffix='_CANDIDATE'
+        )
+
+    report = []
+    for col in columns:
+        err = relative_error(pl.col(col).cast(pl.Float64),
+                             pl.col(col + '_CANDIDATE').cast(pl.Float64))
+        stats = matched.select(
+            err.max().alias('MAX_REL_ERROR'),
+            err.mean().alias('MEAN_REL_ERROR'),
+            )
+        report.append({'COLUMN': col,
+                       'MAX_REL_ERROR': stats['MAX_REL_ERROR'][0],
+                       'MEAN_REL_ERROR': stats['MEAN_REL_ERROR'][0]})
+
+    return pl.DataFrame(report, schema={'COLUMN': pl.String,
+                                        'MAX_REL_ERROR': pl.Float64,
+                                        'MEAN_REL_ERROR': pl.Float64}).with_columns(
+        pl.lit(reference.height - matched.height).alias('ROWS_UNMATCHED_REFERENCE'),
+        pl.lit(candidate.height - matched.height).alias('ROWS_UNMATCHED_CANDIDATE'),
+        )
+
+
+# Keys of the holdings files for the comparison
+DEFAULT_KEYS = [
+    ['FACTSET_ENTITY_ID', 'FSYM_ID', 'date_q'],
+    ['FACTSET_ENTITY_ID', 'date_q'],
+    ['FSYM_ID', 'date_q'],
+    ['date_q'],
+    ]
+
+
+def precision_report(reference_path, candidate_path, keys=None, columns=None):
+    """
+    precision_error() for two parquet files. The keys are the first of
+    DEFAULT_KEYS present in the reference file unless 'keys' is given.
+    """
+
+    reference = pl.read_parquet(reference_path)
+    candidate = pl.read_parquet(candidate_path)
+
+    if keys is None:
+        keys = next(k for k in DEFAULT_KEYS if all(c in reference.columns for c in k))
+
+    return precision_error(reference, candidate, keys, columns=columns)
+
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) != 3:
+        print('usage: python -m factset_ownership.precision <float64 file> <float32 file>')
+        sys.exit(1)
+
+    with pl.Config(tbl_rows=-1):
+        print(precision_report(sys.argv[1], sys.argv[2]))
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Prefetching of the next input file in per-file loops
+
+The per-file loops (13F and funds files of build_positions_ledger.py, the
+funds files of part 0 and the fund tables of part 2) read a file and then
+compute on it, so the CPU waits for the Parquet decode and the disk waits
+for the joins. prefetch() reads the next files on a background thread
+while the current one is processed:
+
+    for path, df in prefetch(paths, read_table, stage='13F reports'):
+        ...
+
+At most 'depth' files wait in the queue (FACTSET_PREFETCH, default 1;
+FACTSET_PREFETCH=0 reads the files in the loop as before). At the end of
+the loop it prints the read time, the compute time, the time the loop
+waited for a file and the share of the read time hidden behind the
+compute. The numbers of each stage are also kept in PREFETCH_STATS.
+"""
+
+
+import os
+import time
+import queue
+import threading
+
+
+PREFETCH_DEPTH = int(os.environ.get('FACTSET_PREFETCH', '1'))
+
+if PREFETCH_DEPTH < 0:
+    raise ValueError('FACTSET_PREFETCH must be 0 or more, got %d' % PREFETCH_DEPTH)
+
+# Statistics of the last loop of each stage
+PREFETCH_STATS = {}
+
+# End of the files
+_DONE = object()
+
+
+def prefetch_report(stats):
+    """ One-line summary of the statistics of a loop """
+
+    hidden = 0.0
+    if stats['READ'] > 0:
+        hidden = min(1.0, max(0.0, 1 - stats['WAIT'] / stats['READ']))
+    return ('%s: %d files, read %.1fs, compute %.1fs, waited %.1fs, %.0f%% of the read '
+            'time overlapped' % (stats['STAGE'], stats['FILES'], stats['READ'],
+                                 stats['COMPUTE'], stats['WAIT'], 100 * hidden))
+
+
+def prefetch(paths, load, depth=None, stage='prefetch'):
+    """
+    Yield (path, load(path)) for every path, loading the next files on a
+    background thread. Errors of 'load' are raised in the loop.
+    """
+
+    if depth is None:
+        depth = PREFETCH_DEPTH
+    paths = list(paths)
+
+    stats = {'STAGE': stage, 'FILES': 0, 'READ': 0.0, 'COMPUTE': 0.0, 'WAIT': 0.0}
+    PREFETCH_STATS[stage] = stats
+
+    # Sequential reads
+    if depth == 0:
+        for path in paths:
+            start = time.perf_counter()
+            df = load(path)
+            stats['READ'] += time.perf_counter() - start
+            stats['WAIT'] += time.perf_counter() - start
+            stats['FILES'] += 1
+
+            start = time.perf_counter()
+            yield path, df
+            stats['COMPUTE'] += time.perf_counter() - start
+        print(prefetch_report(stats))
+        return
+
+    files = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def reader():
+        for path in paths:
+            if stop.is_set():
+                return
+            start = time.perf_counter()
+            try:
+                item = (path, load(path), None)
+            except BaseException as error:
+                item = (path, None, error)
+            stats['READ'] += time.perf_counter() - start
+            files.put(item)
+            if item[2] is not None:
+                return
+        files.put(_DONE)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            start = time.perf_counter()
+            item = files.get()
+            stats['WAIT'] += time.perf_counter() - start
+            if item is _DONE:
+                break
+
+            path, df, error = item
+            if error is not None:
+                raise error
+            stats['FILES'] += 1
+
+            start = time.perf_counter()
+            yield path, df
+            stats['COMPUTE'] += time.perf_counter() - start
+            del df
+    finally:
+        # Unblock the reader if the loop stopped early
+        stop.set()
+        while thread.is_alive():
+            try:
+                files.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        thread.join()
+
+    print(prefetch_report(stats))
@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Principal-security index of the entities
+
+'part_4_fetch_principal_security.py' used to pick the principal security
+of every company of the holdings and fetch its identifiers from the
+symbology tables on every run. The index is now a persistent table in the
+working folder, 'principal_security_index.parquet', keyed by COMPANY_ID:
+
+    COMPANY_ID | FSYM_ID | FSYM_PRIMARY_LISTING_ID | ISIN | CUSIP |
+    TICKER_REGION | SYMBOLOGY_HASH
+
+The principal security of an entity is its primary equity security
+(FSYM_ID = FSYM_PRIMARY_EQUITY_ID) or else its first SHARE or PREFEQ
+security by ACTIVE_FLAG and FREF_SECURITY_TYPE. The ISIN falls back to
+the cross-listing ISIN (sym_xc_isin) and the ticker is the one of the
+primary listing.
+
+SYMBOLOGY_HASH is an order-independent hash of the symbology rows the
+principal security of the entity depends on (own_sec_entity_eq,
+sym_coverage, sym_isin, sym_xc_isin, sym_cusip and sym_ticker_region
+rows of its securities and their listings). update_principal_index()
+only resolves again the entities whose hash changed since the last
+update and drops the entities that are no longer covered. With
+'companies' (e.g. the companies of the holdings) only those entities are
+hashed and resolved; the other entities of the index are kept as they
+are until they are requested again. Holdings look the index up with one
+join (lookup_principal_security()).
+"""
+
+
+import os
+import polars as pl
+
+from factset_ownership.schemas import read_table, scan_table
+
+
+PRINCIPAL_INDEX = 'principal_security_index.parquet'
+
+# Columns of the index
+PRINCIPAL_COLUMNS = ['COMPANY_ID', 'FSYM_ID', 'FSYM_PRIMARY_LISTING_ID', 'ISIN', 'CUSIP',
+                     'TICKER_REGION']
+
+# Seeds of the row hashes of each symbology table
+SYMBOLOGY_SEEDS = {'sym_coverage': 1, 'sym_isin': 2, 'sym_xc_isin': 3, 'sym_cusip': 4,
+                   'sym_ticker_region': 5}
+
+
+def principal_index_path(folder):
+    """ Path of the principal-security index in 'folder' """
+    return os.path.join(folder, PRINCIPAL_INDEX)
+
+
+def scan_symbology(factset_dir):
+    """ LazyFrames of the symbology tables the index is built from """
+
+    def scan(name, columns=None):
+        return scan_table(os.path.join(factset_dir, name + '.parquet'), columns=columns)
+
+    return {
+        'candidates': (
+            scan('sym_coverage', columns=['FSYM_ID',
+                                          'FSYM_PRIMARY_EQUITY_ID',
+                                          'FSYM_PRIMARY_LISTING_ID',
+                                          'FREF_SECURITY_TYPE',
+                                          'ACTIVE_FLAG'])
+            .join(scan('own_sec_entity_eq', columns=['FSYM_ID', 'FACTSET_ENTITY_ID']),
+                  how='inner',
+                  on='FSYM_ID')
+            .drop_nulls(['FACTSET_ENTITY_ID'])
+            ),
+        'sym_isin': scan('sym_isin', columns=['FSYM_ID', 'ISIN']),
+        'sym_xc_isin': scan('sym_xc_isin', columns=['FSYM_ID', 'ISIN']),
+        'sym_cusip': scan('sym_cusip', columns=['FSYM_ID', 'CUSIP']),
+        'sym_ticker_region': scan('sym_ticker_region', columns=['FSYM_ID', 'TICKER_REGION']),
+        }
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    FINGERPRINTS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def row_hash(lf, table):
+    """ 'FSYM_ID' + 'ROW_HASH' of every row of a symbology table """
+    return lf.select(['FSYM_ID',
+                      pl.struct(pl.all()).hash(seed=SYMBOLOGY_SEEDS[table]).alias('ROW_HASH')])
+
+
+def symbology_hashes(symbology, companies=None):
+    """
+    'COMPANY_ID' + 'SYMBOLOGY_HASH' of every covered entity (of the
+    entities of 'companies', LazyFrame with 'COMPANY_ID', if given)
+    """
+
+    candidates = symbology['candidates']
+    if companies is not None:
+        candidates = candidates.join(companies, how='semi',
+                                     left_on='FACTSET_ENTITY_ID', right_on='COMPANY_ID')
+
+    # Hash of the identifier rows of every FSYM_ID (security or listing)
+    # of the candidates
+    fsym_ids = pl.concat([candidates.select('FSYM_ID'),
+                          candidates.select(pl.col('FSYM_PRIMARY_LISTING_ID').alias('FSYM_ID'))])
+    identifiers = (
+        pl.concat([row_hash(symbology[table], table)
+                   for table in ['sym_isin', 'sym_xc_isin', 'sym_cusip', 'sym_ticker_region']])
+        .join(fsym_ids, how='semi', on='FSYM_ID')
+        .group_by('FSYM_ID')
+        .agg(pl.col('ROW_HASH').sum().alias('ID_HASH'))
+        )
+
+    return (
+        candidates
+        .with_columns(pl.struct(pl.all()).hash(seed=SYMBOLOGY_SEEDS['sym_coverage'])
+                      .alias('ROW_HASH'))
+        .join(identifiers, how='left', on='FSYM_ID')
+        .join(identifiers.rename({'FSYM_ID': 'FSYM_PRIMARY_LISTING_ID',
+                                  'ID_HASH': 'LISTING_HASH'}),
+              how='left',
+              on='FSYM_PRIMARY_LISTING_ID')
+        .group_by('FACTSET_ENTITY_ID')
+        .agg((pl.col('ROW_HASH') +
+              pl.col('ID_HASH').fill_null(0) +
+              pl.col('LISTING_HASH').fill_null(0)).sum().alias('SYMBOLOGY_HASH'))
+        .rename({'FACTSET_ENTITY_ID': 'COMPANY_ID'})
+        )
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    BUILD
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def resolve_principal_securities(symbology, companies):
+    """
+    Principal security and identifiers of the entities 'companies'
+    (LazyFrame with 'COMPANY_ID'). Entities without a principal security
+    get null identifiers.
+    """
+
+    companies = companies.select('COMPANY_ID')
+
+    # Primary equity security first, then SHARE/PREFEQ securities
+    principal = (
+        symbology['candidates']
+        .join(companies, how='semi', left_on='FACTSET_ENTITY_ID', right_on='COMPANY_ID')
+        .with_columns(
+            pl.when(pl.col('FSYM_ID') == pl.col('FSYM_PRIMARY_EQUITY_ID')).then(pl.lit(0))
+            .when(pl.col('FREF_SECURITY_TYPE').cast(pl.String).is_in(['SHARE', 'PREFEQ']))
+            .then(pl.lit(1))
+            .otherwise(None)
+            .alias('PRIORITY')
+            )
+        .drop_nulls(['PRIORITY'])
+        .sort(['FACTSET_ENTITY_ID', 'PRIORITY', 'ACTIVE_FLAG', 'FREF_SECURITY_TYPE', 'FSYM_ID'])
+        .unique(['FACTSET_ENTITY_ID'], keep='first', maintain_order=True)
+        .select([pl.col('FACTSET_ENTITY_ID').alias('COMPANY_ID'),
+                 'FSYM_ID',
+                 'FSYM_PRIMARY_LISTING_ID'])
+        )
+
+    return (
+        companies
+        .join(principal, how='left', on='COMPANY_ID')
+        .join(symbology['sym_isin'], how='left', on='FSYM_ID')
+        .join(symbology['sym_xc_isin'].rename({'ISIN': 'XC_ISIN'}), how='left', on='FSYM_ID')
+        .join(symbology['sym_cusip'], how='left', on='FSYM_ID')
+        .join(symbology['sym_ticker_region'].rename({'FSYM_ID': 'FSYM_PRIMARY_LISTING_ID'}),
+              how='left',
+              on='FSYM_PRIMARY_LISTING_ID')
+        .with_columns(pl.coalesce(['ISIN', 'XC_ISIN']).alias('ISIN'))
+        .select(PRINCIPAL_COLUMNS)
+        )
+
+
+def update_principal_index(folder, factset_dir, companies=None):
+    """
+    Bring the principal-security index in 'folder' up to date with the
+    symbology tables in 'factset_dir': resolve the new entities and the
+    entities whose SYMBOLOGY_HASH changed, keep the others as they are
+    and drop the entities that are no longer covered. 'companies'
+    (DataFrame or LazyFrame with 'COMPANY_ID') restricts the update to
+    these entities; the other entities of the index are left untouched.
+    """
+
+    if companies is not None:
+        companies = companies.lazy().select('COMPANY_ID').unique().collect()
+
+    symbology = scan_symbology(factset_dir)
+    hashes = symbology_hashes(symbology,
+                              None if companies is None else companies.lazy()).collect()
+
+    path = principal_index_path(folder)
+    others = None
+    if os.path.exists(path):
+        index = read_table(path)
+        if companies is not None:
+            others = index.join(companies, how='anti', on='COMPANY_ID')
+            index = index.join(companies, how='semi', on='COMPANY_ID')
+        kept = index.join(hashes, how='semi', on=['COMPANY_ID', 'SYMBOLOGY_HASH'])
+    else:
+        index = None
+        kept = None
+
+    changed = hashes if kept is None else hashes.join(kept, how='anti', on='COMPANY_ID')
+
+    resolved = (
+        resolve_principal_securities(symbology, changed.lazy())
+        .join(changed.lazy(), how='left', on='COMPANY_ID')
+        .collect()
+        )
+
+    updated = pl.concat([df for df in [others, kept, resolved] if df is not None],
+                        how='vertical_relaxed')
+    updated = updated.sort('COMPANY_ID')
+    updated.write_parquet(path)
+
+    removed = 0 if index is None else index.height - kept.height - \
+        index.join(changed, how='semi', on='COMPANY_ID').height
+    print('Principal-security index: %d entities, %d resolved, %d removed'
+          % (updated.height, resolved.height, removed))
+
+    return updated
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    LOOKUPS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def scan_principal_index(folder):
+    """ Lazily scan the principal-security index (without the hashes) """
+    return scan_table(principal_index_path(folder)).select(PRINCIPAL_COLUMNS)
+
+
+def read_principal_index(folder):
+    """ Eager version of scan_principal_index() """
+    return scan_principal_index(folder).collect()
+
+
+def lookup_principal_security(df, folder, on='COMPANY_ID'):
+    """
+    Add the principal security and its identifiers to the rows of 'df'
+    (DataFrame or LazyFrame) with the company in 'on'
+    """
+
+    index = scan_principal_index(folder)
+    if on != 'COMPANY_ID':
+        index = index.rename({'COMPANY_ID': on})
+    if isinstance(df, pl.DataFrame):
+        index = index.collect()
+
+    return df.join(index, how='left', on=on)
+
+
+
+if __name__ == '__main__':
+
+    import sys
+
+    update_principal_index(sys.argv[1], sys.argv[2])
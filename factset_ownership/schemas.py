@@ -0,0 +1,366 @@
+# -*- coding: utf-8 -*-
+"""
+Typed schema registry for the FactSet tables
+
+The tables used to be read with inferred schemas: low-cardinality codes
+such as 'ISO_COUNTRY', 'SOURCE_CODE', 'ISSUE_TYPE', 'FREF_SECURITY_TYPE'
+and 'REGION' were kept as full strings and the 'FDS_*_FLAG' columns as
+64-bit integers. The registry below describes every table the pipeline
+reads (FactSet tables and the intermediate tables of the scripts) and
+read_table()/scan_table() apply these dtypes at scan time.
+
+    Code columns      -> Categorical
+    Flag columns      -> Int8
+    'date_q'          -> Int32
+    Dates             -> Date
+
+Only the columns listed in the registry are cast. Any other column keeps
+the dtype stored in the file.
+"""
+
+
+import os
+import re
+import polars as pl
+
+
+# Categoricals of different files must share one string cache so that they
+# can be joined or concatenated. Recent polars versions have global
+# categories and no longer need it.
+if not hasattr(pl, 'Categories'):
+    pl.enable_string_cache()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    DTYPES
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+ID = pl.String
+CODE = pl.Categorical
+FLAG = pl.Int8
+DATE = pl.Date
+DATE_Q = pl.Int32
+AMOUNT = pl.Float64
+BOOL = pl.Boolean
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    SCHEMA REGISTRY
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+TABLE_SCHEMAS = {
+
+    # ---------------------
+    #   FactSet Ownership
+    # ---------------------
+    'own_ent_institutions': {
+        'FACTSET_ENTITY_ID': ID,
+        'ENTITY_TYPE': CODE,
+        'ISO_COUNTRY': CODE,
+        'FDS_13F_FLAG': FLAG,
+        'FDS_13F_CA_FLAG': FLAG,
+        },
+    'own_ent_funds': {
+        'FACTSET_FUND_ID': ID,
+        'FACTSET_INST_ENTITY_ID': ID,
+        'ISO_COUNTRY': CODE,
+        },
+    'own_ent_13f_combined_inst': {
+        'FACTSET_FILER_ENTITY_ID': ID,
+        'FACTSET_ROLLUP_ENTITY_ID': ID,
+        },
+    'own_sec_coverage_eq': {
+        'FSYM_ID': ID,
+        'ISSUE_TYPE': CODE,
+        'ISO_COUNTRY': CODE,
+        'FDS_13F_FLAG': FLAG,
+        'FDS_13F_CA_FLAG': FLAG,
+        'FDS_UKSR_FLAG': FLAG,
+        },
+    'own_sec_entity_eq': {
+        'FSYM_ID': ID,
+        'FACTSET_ENTITY_ID': ID,
+        },
+    'own_sec_prices_eq': {
+        'FSYM_ID': ID,
+        'PRICE_DATE': DATE,
+        'ADJ_PRICE': AMOUNT,
+        'UNADJ_PRICE': AMOUNT,
+        'ADJ_SHARES_OUTSTANDING': AMOUNT,
+        'UNADJ_SHARES_OUTSTANDING': AMOUNT,
+        },
+    'own_inst_13f_detail_eq': {
+        'FACTSET_ENTITY_ID': ID,
+        'FSYM_ID': ID,
+        'REPORT_DATE': DATE,
+        'ADJ_HOLDING': AMOUNT,
+        'ADJ_MV': AMOUNT,
+        'REPORTED_HOLDING': AMOUNT,
+        },
+    'own_inst_stakes_detail_eq': {
+        'FACTSET_ENTITY_ID': ID,
+        'FSYM_ID': ID,
+        'AS_OF_DATE': DATE,
+        'SOURCE_CODE': CODE,
+        'POSITION': AMOUNT,
+        },
+    'own_fund_detail_eq': {
+        'FACTSET_FUND_ID': ID,
+        'FSYM_ID': ID,
+        'REPORT_DATE': DATE,
+        'ADJ_HOLDING': AMOUNT,
+        'REPORTED_HOLDING': AMOUNT,
+        'ADJ_MV': AMOUNT,
+        'REPORTED_MV': AMOUNT,
+        },
+
+    # ---------------------
+    #   FactSet Symbology
+    # ---------------------
+    'sym_coverage': {
+        'FSYM_ID': ID,
+        'FSYM_PRIMARY_EQUITY_ID': ID,
+        'FSYM_PRIMARY_LISTING_ID': ID,
+        'FREF_SECURITY_TYPE': CODE,
+        'ACTIVE_FLAG': FLAG,
+        },
+    'sym_entity': {
+        'FACTSET_ENTITY_ID': ID,
+        'ISO_COUNTRY': CODE,
+        'ENTITY_TYPE': CODE,
+        },
+    'sym_isin': {'FSYM_ID': ID, 'ISIN': ID},
+    'sym_xc_isin': {'FSYM_ID': ID, 'ISIN': ID},
+    'sym_cusip': {'FSYM_ID': ID, 'CUSIP': ID},
+    'sym_ticker_region': {'FSYM_ID': ID, 'TICKER_REGION': ID},
+
+    # ---------------------
+    #   Other inputs
+    # ---------------------
+    'iso_region_match': {
+        'ISO_COUNTRY': CODE,
+        'REGION': CODE,
+        },
+
+    # -------------------------------
+    #   Intermediate tables
+    # -------------------------------
+    'own_basic': {
+        'FSYM_ID': ID,
+        'FACTSET_ENTITY_ID': ID,
+        'ISSUE_TYPE': CODE,
+        'ISO_COUNTRY': CODE,
+        'FREF_SECURITY_TYPE': CODE,
+        'TERMINATION_DATE': DATE_Q,
+        },
+    'hmktcap_prc': {
+        'COMPANY_ID': ID,
+        'FSYM_ID': ID,
+        'date_q': DATE_Q,
+        'ISO_COUNTRY': CODE,
+        },
+    'hmktcap': {
+        'FACTSET_ENTITY_ID': ID,
+        'date_q': DATE_Q,
+        },
+    'v2_holdings13f': {
+        'FACTSET_ENTITY_ID': ID,
+        'FSYM_ID': ID,
+        'date_q': DATE_Q,
+        'COMPANY_ID': ID,
+        'ISO_COUNTRY': CODE,
+        },
+    'v2_holdingsmf': {
+        'FACTSET_ENTITY_ID': ID,
+        'FSYM_ID': ID,
+        'date_q': DATE_Q,
+        'COMPANY_ID': ID,
+        'ISO_COUNTRY': CODE,
+        },
+    'holdingsall_company_level': {
+        'FACTSET_ENTITY_ID': ID,
+        'FSYM_ID': ID,
+        'date_q': DATE_Q,
+        'COMPANY_ID': ID,
+        'SEC_COUNTRY': CODE,
+        },
+    'scheme_mcap_held': {
+        'FSYM_ID': ID,
+        'FACTSET_ENTITY_ID': ID,
+        'date_q': DATE_Q,
+        'SCHEME': FLAG,
+        },
+    'scheme_adj_shares_held': {
+        'FSYM_ID': ID,
+        'FACTSET_ENTITY_ID': ID,
+        'date_q': DATE_Q,
+        'SCHEME': FLAG,
+        },
+    'positions_ledger': {
+        'FACTSET_ENTITY_ID': ID,
+        'FSYM_ID': ID,
+        'date_q': DATE_Q,
+        'FACTSET_FUND_ID': ID,
+        'SOURCE_CODE': CODE,
+        'AS_OF_DATE': DATE,
+        'ADJ_SHARES': AMOUNT,
+        'REPORTED_SHARES': AMOUNT,
+        'MARKET_VALUE': AMOUNT,
+        'LATEST': BOOL,
+        'POSITIVE_SHARES': BOOL,
+        'POSITIVE_VALUE': BOOL,
+        },
+    'position_flows': {
+        'FACTSET_ENTITY_ID': ID,
+        'FSYM_ID': ID,
+        'date_q': DATE_Q,
+        'FLOW_TYPE': CODE,
+        },
+    'scheme_securities': {
+        'FSYM_ID': ID,
+        'SECURITY_CLASS': FLAG,
+        },
+    'scheme_holders': {
+        'FACTSET_ENTITY_ID': ID,
+        'HOLDER_13F': FLAG,
+        },
+    'principal_security_index': {
+        'COMPANY_ID': ID,
+        'FSYM_ID': ID,
+        'FSYM_PRIMARY_LISTING_ID': ID,
+        'ISIN': ID,
+        'CUSIP': ID,
+        'TICKER_REGION': ID,
+        },
+    'market_portfolio_weights': {
+        'COMPANY_ID': ID,
+        'date_q': DATE_Q,
+        'COUNTRY': CODE,
+        'REGION': CODE,
+        },
+    'top_holders': {
+        'COMPANY_ID': ID,
+        'date_q': DATE_Q,
+        'FACTSET_ENTITY_ID': ID,
+        },
+    'ownership_concentration': {
+        'COMPANY_ID': ID,
+        'date_q': DATE_Q,
+        },
+    'investors_type': {
+        'FACTSET_ENTITY_ID': ID,
+        'date_q': DATE_Q,
+        'IS_LOCAL_INVESTOR': FLAG,
+        'IS_REGIONAL_INVESTOR': FLAG,
+        'IS_GLOBAL_INVESTOR': FLAG,
+        'IS_CLASSIFIED': FLAG,
+        'COUNTRY_MAX': CODE,
+        'REGION_MAX': CODE,
+        },
+    'active_share_bartram2015': {
+        'FACTSET_ENTITY_ID': ID,
+        'date_q': DATE_Q,
+        'IS_PASSIVE_INVESTOR': FLAG,
+        },
+    }
+
+
+# File names that map to the same table (split files, scheme outputs)
+TABLE_ALIASES = [
+    (r'own_inst_13f_detail_eq(_\d+)?', 'own_inst_13f_detail_eq'),
+    (r'own_fund_detail_eq(_\d+)?', 'own_fund_detail_eq'),
+    (r'funds_table_\d+', 'own_fund_detail_eq'),
+    (r'scheme_\d_mcap_held(_monthly)?(_shard_\d+)?', 'scheme_mcap_held'),
+    (r'scheme_\d_adj_shares_held(_monthly)?(_shard_\d+)?', 'scheme_adj_shares_held'),
+    (r'factset_mcap_holdings(_monthly)?', 'scheme_mcap_held'),
+    (r'factset_adj_shares_holdings(_monthly)?', 'scheme_adj_shares_held'),
+    ]
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    LOADERS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def table_name(path):
+    """
+    Name of the registry table of a file, e.g.
+    '...\\own_inst_eq_v5_full\\own_inst_13f_detail_eq_3.parquet'
+    -> 'own_inst_13f_detail_eq'
+    """
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for pattern, table in TABLE_ALIASES:
+        if re.fullmatch(pattern, stem):
+            return table
+    return stem
+
+
+def table_schema(table):
+    """ Registered dtypes of a table (empty dict if not registered) """
+    return TABLE_SCHEMAS.get(table, {})
+
+
+def apply_schema(df, table):
+    """
+    Cast the registered columns of 'table' that are present in 'df'.
+    Works with DataFrames and LazyFrames.
+    """
+
+    if isinstance(df, pl.LazyFrame):
+        present = df.collect_schema()
+    else:
+        present = df.schema
+
+    casts = [pl.col(col).cast(dtype)
+             for col, dtype in table_schema(table).items()
+             if col in present and present[col] != dtype]
+    if not casts:
+        return df
+    return df.with_columns(casts)
+
+
+def scan_table(path, columns=None, table=None):
+    """
+    Lazily scan a parquet (or csv) table with the registered dtypes.
+    The table is inferred from the file name unless 'table' is given.
+    """
+
+    if table is None:
+        table = table_name(path)
+
+    if path.lower().endswith('.csv'):
+        lf = pl.scan_csv(path)
+    else:
+        lf = pl.scan_parquet(path)
+
+    if columns is not None:
+        lf = lf.select(columns)
+
+    return apply_schema(lf, table)
+
+
+def read_table(path, columns=None, table=None):
+    """ Eager version of scan_table() """
+    return scan_table(path, columns=columns, table=table).collect()
+
+
+def memory_report(path, columns=None, table=None):
+    """
+    Compare the in-memory size of a table read with the inferred schema
+    against the registered schema. Sizes are in MB.
+    """
+
+    if path.lower().endswith('.csv'):
+        inferred = pl.read_csv(path, columns=columns)
+    else:
+        inferred = pl.read_parquet(path, columns=columns)
+    typed = read_table(path, columns=columns, table=table)
+
+    return pl.DataFrame({
+        'COLUMN': inferred.columns,
+        'DTYPE_INFERRED': [str(inferred[c].dtype) for c in inferred.columns],
+        'DTYPE_TYPED': [str(typed[c].dtype) for c in inferred.columns],
+        'MB_INFERRED': [inferred[c].estimated_size('mb') for c in inferred.columns],
+        'MB_TYPED': [typed[c].estimated_size('mb') for c in inferred.columns],
+        })
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Sharded execution of the scheme scripts
+
+The scheme logic (latest observation within a quarter, stakes windows,
+source precedence) never mixes two securities, so a scheme can be run on
+a subset of the securities and the outputs concatenated. With
+
+    set FACTSET_NUM_SHARDS=8
+    set FACTSET_SHARD=3
+
+a scheme script only keeps the securities with hash(FSYM_ID) % 8 == 3
+(shard_filter()) and writes 'scheme_1_mcap_held_shard_3.parquet'
+(shard_name()). The concatenate scripts run with FACTSET_NUM_SHARDS=8 and
+no FACTSET_SHARD read the 8 shard files of every scheme (read_shards()).
+Without the variables nothing changes.
+
+Run the shards of one or more scripts in parallel worker processes:
+
+    python -m factset_ownership.shards --shards 8 [--workers 4] [--only 0-3]
+           [--merge <concatenate script>] <script> [<script> ...]
+
+Every worker gets an equal share of the Polars threads. On several
+machines with a shared folder, give each machine its own --only range and
+run the concatenate script once all the shards are written.
+"""
+
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+
+from factset_ownership.schemas import read_table, scan_table
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    SHARD MODE
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+NUM_SHARDS = int(os.environ.get('FACTSET_NUM_SHARDS', '1'))
+SHARD = os.environ.get('FACTSET_SHARD')
+
+if NUM_SHARDS < 1:
+    raise ValueError('FACTSET_NUM_SHARDS must be at least 1, got %d' % NUM_SHARDS)
+
+if SHARD is not None:
+    SHARD = int(SHARD)
+    if not 0 <= SHARD < NUM_SHARDS:
+        raise ValueError('FACTSET_SHARD must be between 0 and %d, got %d' % (NUM_SHARDS - 1, SHARD))
+
+# Seed of the shard hash (the same in every worker)
+SHARD_SEED = 0
+
+
+def shard_of(col='FSYM_ID', num_shards=None):
+    """ Shard of every row by the hash of 'col' """
+
+    if num_shards is None:
+        num_shards = NUM_SHARDS
+    return (pl.col(col).cast(pl.String).hash(seed=SHARD_SEED) % num_shards).cast(pl.Int32)
+
+
+def shard_filter(col='FSYM_ID'):
+    """ Rows of the current shard (all rows if FACTSET_SHARD is not set) """
+
+    if SHARD is None:
+        return pl.lit(True)
+    return shard_of(col) == SHARD
+
+
+def shard_name(name):
+    """ File name of the current shard ('_shard_N' suffix) """
+
+    if SHARD is None:
+        return name
+    root, ext = os.path.splitext(name)
+    return '%s_shard_%d%s' % (root, SHARD, ext)
+
+
+def shard_files(path):
+    """
+    Files to read for the output 'path': the shard files when
+    FACTSET_NUM_SHARDS is more than 1, otherwise 'path' itself.
+    """
+
+    if NUM_SHARDS == 1:
+        return [path]
+
+    root, ext = os.path.splitext(path)
+    files = ['%s_shard_%d%s' % (root, k, ext) for k in range(NUM_SHARDS)]
+
+    missing = [f for f in files if not os.path.exists(f)]
+    if missing:
+        raise FileNotFoundError('%d of %d shards are missing, e.g. %s'
+                                % (len(missing), NUM_SHARDS, missing[0]))
+    return files
+
+
+def read_shards(path, columns=None):
+    """ Read the output 'path' (or its shards, see shard_files()) as one table """
+    return pl.concat([read_table(f, columns=columns) for f in shard_files(path)])
+
+
+def scan_shards(path, columns=None):
+    """ Lazy version of read_shards() """
+    return pl.concat([scan_table(f, columns=columns) for f in shard_files(path)])
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    RUNNER
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def parse_shards(text, num_shards):
+    """ Shards of an --only argument, e.g. '0-3,6' -> [0, 1, 2, 3, 6] """
+
+    if text is None:
+        return list(range(num_shards))
+
+    shards = []
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            shards.extend(range(int(first), int(last) + 1))
+        else:
+            shards.append(int(part))
+    return sorted(set(shards))
+
+
+def run_shard(script, shard, num_shards, threads):
+    """ Run 'script' for one shard in a new process, return (seconds, returncode) """
+
+    env = dict(os.environ,
+               FACTSET_SHARD=str(shard),
+               FACTSET_NUM_SHARDS=str(num_shards),
+               POLARS_MAX_THREADS=str(threads))
+
+    start = time.perf_counter()
+    returncode = subprocess.run([sys.executable, script], env=env).returncode
+    return time.perf_counter() - start, returncode
+
+
+def run_shards(scripts, num_shards, workers=None, shards=None, merge=None):
+    """
+    Run every script for every shard with 'workers' processes at a time,
+    then (optionally) the 'merge' script over all the shards. Raises if
+    a shard fails.
+    """
+
+    if workers is None:
+        workers = os.cpu_count()
+    if shards is None:
+        shards = list(range(num_shards))
+    threads = max(1, os.cpu_count() // workers)
+
+    tasks = [(script, shard) for script in scripts for shard in shards]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda task: run_shard(task[0], task[1], num_shards, threads),
+                                tasks))
+
+    failed = []
+    for (script, shard), (seconds, returncode) in zip(tasks, results):
+        print('%s shard %d: %.1fs%s' % (os.path.basename(script), shard, seconds,
+                                        '' if returncode == 0 else ' (failed)'))
+        if returncode != 0:
+            failed.append((script, shard))
+    if failed:
+        raise RuntimeError('%d shard runs failed, e.g. %s shard %d' % (len(failed), *failed[0]))
+
+    if merge is not None:
+        env = dict(os.environ, FACTSET_NUM_SHARDS=str(num_shards))
+        env.pop('FACTSET_SHARD', None)
+        subprocess.run([sys.executable, merge], env=env, check=True)
+
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Run scheme scripts by security shard')
+    parser.add_argument('scripts', nargs='+')
+    parser.add_argument('--shards', type=int, required=True)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--only', default=None, help="shards to run here, e.g. '0-3,6'")
+    parser.add_argument('--merge', default=None, help='concatenate script to run at the end')
+    args = parser.parse_args()
+
+    run_shards(args.scripts, args.shards,
+               workers=args.workers,
+               shards=parse_shards(args.only, args.shards),
+               merge=args.merge)
@@ -0,0 +1,486 @@
+# -*- coding: utf-8 -*-
+"""
+Holdings snapshots at arbitrary perspective dates
+
+The scheme scripts only produce positions at quarter-ends. A snapshot
+applies the same rules at any perspective date (e.g. a month-end or the
+day of an announcement):
+
+    Scheme 1  13F holder + 13F US security
+              latest 13F position unless there is a more recent stakes
+              position
+    Scheme 2  13F holder + 13F CA security
+              as scheme 1, then sum of funds
+    Scheme 3  non-13F holder + non-13F/CA/UKSR security
+              latest stakes position within 18 (US & Canada) or 21
+              months, then sum of funds
+    Scheme 4  UKSR security
+              latest UKSR stakes position (sources W, Q, H) within 18
+              months, then sum of funds
+
+13F reports, fund reports and the stakes positions of schemes 1 and 2
+are current if they are dated after the month-end three months before
+the perspective date, i.e. at a quarter-end only the reports of that
+quarter count, as in the scheme scripts.
+
+The snapshots are served from the unreduced observations of the 13F,
+stakes and funds detail tables (see scan_observations()), not from the
+positions ledger: the ledger keeps the latest observation of a quarter,
+so a snapshot taken between two observations of the same quarter could
+not see the earlier one. Every observation is paired with the
+perspective dates it can serve with two sorted as-of joins against the
+(sorted) dates: the first date on or after the observation and the last
+date within its window. A batch of dates is therefore computed in one
+pass, without a holder-security x date grid. The position is valued with
+the latest price of own_sec_prices_eq on or before the perspective date
+(as-of join by security) and not older than PRICE_WINDOW_MONTHS.
+
+    python -m factset_ownership.snapshots <folder> <factset_dir> <measure> <date> [<date> ...]
+
+writes the snapshot of the dates to 'holdings_snapshot.parquet' in
+'folder' (measure is MCAP_HELD or ADJ_SHARES_HELD).
+"""
+
+
+import os
+import sys
+import datetime
+import polars as pl
+
+from factset_ownership.schemas import read_table, scan_table
+from factset_ownership.precision import acc, to_storage
+from factset_ownership.ledger import ledger_rows
+from factset_ownership.precedence import (candidate_positions,
+                                          resolve_positions,
+                                          SOURCE_13F,
+                                          SOURCE_STAKES,
+                                          SOURCE_FUNDS,
+                                          POLICY_SCHEME_1,
+                                          POLICY_SCHEME_2,
+                                          POLICY_SCHEME_3,
+                                          POLICY_SCHEME_4)
+from factset_ownership.windows import (window_months,
+                                       WINDOW_MONTHS_UKSR,
+                                       WINDOW_MONTHS_GLOBAL)
+
+
+# Reports (13F, funds) are current for three months
+REPORT_WINDOW_MONTHS = 3
+
+# A price older than this is not used to value a position
+PRICE_WINDOW_MONTHS = 3
+
+# Stakes sources of scheme 4
+SOURCE_CODES_UKSR = ['W', 'Q', 'H']
+
+# Measures of a snapshot
+MEASURES = ['MCAP_HELD', 'ADJ_SHARES_HELD']
+
+# Keys of a snapshot position
+SNAPSHOT_KEYS = ['FSYM_ID', 'FACTSET_ENTITY_ID', 'PERSPECTIVE_DATE']
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    PERSPECTIVE DATES
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def perspective_dates(dates):
+    """
+    Sorted unique perspective dates ('PERSPECTIVE_DATE') with their
+    position 'DATE_IDX'. 'dates' is a date, a 'YYYY-MM-DD' string or a
+    list of them (or the output of perspective_dates()).
+    """
+
+    if isinstance(dates, pl.DataFrame):
+        return dates
+
+    if isinstance(dates, (str, datetime.date)):
+        dates = [dates]
+
+    dates = pl.Series('PERSPECTIVE_DATE', list(dates))
+    if dates.dtype == pl.String:
+        dates = dates.str.to_date('%Y-%m-%d')
+
+    return (
+        dates.cast(pl.Date)
+        .unique()
+        .sort()
+        .to_frame()
+        .with_row_index('DATE_IDX')
+        )
+
+
+def serve_observations(observations, dates, window, date_col='AS_OF_DATE', reports=False):
+    """
+    Pair every row of 'observations' with the perspective dates it can
+    serve: dates on or after 'date_col' and within 'window' months (int
+    or expression evaluated on 'observations'). With reports=True the
+    observation must be dated after the month-end 'window' months before
+    the perspective date, otherwise not before the perspective date minus
+    'window' months. Adds 'PERSPECTIVE_DATE'.
+    """
+
+    if isinstance(window, int):
+        window = pl.lit(window)
+
+    dates = perspective_dates(dates)
+
+    # First perspective date on or after the observation
+    first = dates.rename({'PERSPECTIVE_DATE': 'FIRST_DATE', 'DATE_IDX': 'FIRST_IDX'})
+    # Last perspective date the observation can reach (the exact window is
+    # applied below)
+    last = dates.rename({'PERSPECTIVE_DATE': 'LAST_DATE', 'DATE_IDX': 'LAST_IDX'})
+
+    served = (
+        observations
+        .with_columns(pl.format('{}mo', window).alias('WINDOW'))
+        .sort(date_col)
+        .join_asof(first, left_on=date_col, right_on='FIRST_DATE', strategy='forward')
+        .with_columns(pl.col(date_col).dt.offset_by(pl.col('WINDOW')).dt.month_end()
+                      .alias('REACH_DATE'))
+        .sort('REACH_DATE')
+        .join_asof(last, left_on='REACH_DATE', right_on='LAST_DATE', strategy='backward')
+        .drop_nulls(['FIRST_IDX', 'LAST_IDX'])
+        .filter(pl.col('FIRST_IDX') <= pl.col('LAST_IDX'))
+        .with_columns(pl.int_ranges('FIRST_IDX', pl.col('LAST_IDX') + 1,
+                                    dtype=pl.UInt32).alias('DATE_IDX'))
+        .explode('DATE_IDX')
+        .join(dates, on='DATE_IDX', how='left')
+        )
+
+    # Observation within the window of the perspective date
+    start = pl.col('PERSPECTIVE_DATE').dt.offset_by(pl.format('-{}', pl.col('WINDOW')))
+    if reports:
+        in_window = pl.col(date_col) > start.dt.month_end()
+    else:
+        in_window = pl.col(date_col) >= start
+
+    return (
+        served
+        .filter(in_window)
+        .drop(['WINDOW', 'FIRST_DATE', 'FIRST_IDX', 'REACH_DATE', 'LAST_DATE', 'LAST_IDX',
+               'DATE_IDX'])
+        )
+
+
+def prices_as_of(positions, own_sec_prices, date_col='PERSPECTIVE_DATE',
+                 window=PRICE_WINDOW_MONTHS):
+    """
+    Join to every row of 'positions' the latest 'ADJ_PRICE' and
+    'UNADJ_PRICE' of the security on or before 'date_col'. Only positive
+    unadjusted prices are used and an adjusted price of 0 is null. Prices
+    dated more than 'window' months before 'date_col' are stale and null.
+    """
+
+    prices = (
+        own_sec_prices
+        .select(['FSYM_ID', 'PRICE_DATE', 'ADJ_PRICE', 'UNADJ_PRICE'])
+        .filter(pl.col('UNADJ_PRICE') > 0)
+        .with_columns(pl.when(pl.col('ADJ_PRICE') == 0)
+                      .then(None)
+                      .otherwise(pl.col('ADJ_PRICE'))
+                      .alias('ADJ_PRICE'))
+        .sort('PRICE_DATE')
+        )
+
+    stale_before = pl.col(date_col).dt.offset_by('-%dmo' % window)
+
+    return (
+        positions
+        .sort(date_col)
+        .join_asof(prices,
+                   left_on=date_col,
+                   right_on='PRICE_DATE',
+                   by='FSYM_ID',
+                   strategy='backward',
+                   check_sortedness=False)
+        .with_columns([
+            pl.when(pl.col('PRICE_DATE') >= stale_before).then(pl.col(c)).alias(c)
+            for c in ['ADJ_PRICE', 'UNADJ_PRICE']
+            ])
+        .drop('PRICE_DATE')
+        )
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    OBSERVATIONS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def scan_observations(factset_dir, first, last):
+    """
+    Lazily scan every 13F, stakes and funds observation dated 'first' to
+    'last' from the FactSet detail tables in 'factset_dir', in the layout
+    of the positions ledger (see ledger_rows()) but without the reduction
+    to the latest observation of a quarter ('date_q' is null).
+    """
+
+    own_inst_13f_dir = os.path.join(factset_dir, 'own_inst_eq_v5_full')
+    own_funds_dir = os.path.join(factset_dir, 'own_fund_eq_v5_full')
+
+    # 13F reports
+    own_inst_13f = pl.concat([
+        scan_table(os.path.join(own_inst_13f_dir, dataset),
+                   columns=['FSYM_ID', 'FACTSET_ENTITY_ID', 'REPORT_DATE',
+                            'ADJ_HOLDING', 'REPORTED_HOLDING'])
+        for dataset in os.listdir(own_inst_13f_dir) if '13f' in dataset
+        ])
+    observations_13f = ledger_rows(
+        own_inst_13f.filter(pl.col('REPORT_DATE').is_between(first, last)),
+        SOURCE_13F,
+        AS_OF_DATE='REPORT_DATE',
+        ADJ_SHARES='ADJ_HOLDING',
+        REPORTED_SHARES='REPORTED_HOLDING'
+        )
+
+    # Stakes-based positions
+    own_inst_stakes = scan_table(os.path.join(own_inst_13f_dir, 'own_inst_stakes_detail_eq.parquet'),
+                                 columns=['FSYM_ID', 'FACTSET_ENTITY_ID', 'AS_OF_DATE',
+                                          'SOURCE_CODE', 'POSITION'])
+    observations_stakes = ledger_rows(
+        own_inst_stakes.filter(pl.col('AS_OF_DATE').is_between(first, last)),
+        SOURCE_STAKES,
+        ADJ_SHARES='POSITION'
+        )
+
+    # Funds reports with the institution that manages the fund
+    own_ent_funds = (
+        scan_table(os.path.join(factset_dir, 'own_ent_funds.parquet'),
+                   columns=['FACTSET_FUND_ID', 'FACTSET_INST_ENTITY_ID'])
+        .rename({'FACTSET_INST_ENTITY_ID': 'FACTSET_ENTITY_ID'})
+        )
+    own_fund = pl.concat([
+        scan_table(os.path.join(own_funds_dir, dataset),
+                   columns=['FACTSET_FUND_ID', 'FSYM_ID', 'REPORT_DATE', 'ADJ_HOLDING',
+                            'REPORTED_HOLDING', 'ADJ_MV', 'REPORTED_MV'])
+        for dataset in os.listdir(own_funds_dir)
+        ])
+    observations_funds = ledger_rows(
+        own_fund
+        .filter(pl.col('REPORT_DATE').is_between(first, last))
+        .join(own_ent_funds, how='inner', on='FACTSET_FUND_ID'),
+        SOURCE_FUNDS,
+        AS_OF_DATE='REPORT_DATE',
+        ADJ_SHARES='ADJ_HOLDING',
+        REPORTED_SHARES='REPORTED_HOLDING',
+        MARKET_VALUE=pl.when(pl.col('ADJ_MV') > 0)
+                     .then(pl.col('ADJ_MV'))
+                     .otherwise(pl.col('REPORTED_MV'))
+        )
+
+    return pl.concat([observations_13f, observations_stakes, observations_funds])
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    POSITIONS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def _position_value(source, measure):
+    # Position of a served observation in terms of 'measure'
+    adj_shares = pl.when(pl.col('ADJ_SHARES') != 0).then(pl.col('ADJ_SHARES'))
+
+    if measure == 'ADJ_SHARES_HELD':
+        return adj_shares
+
+    if source == SOURCE_13F:
+        return (
+            pl.when((pl.col('ADJ_SHARES') != 0) & pl.col('ADJ_PRICE').is_not_null())
+            .then(pl.col('ADJ_SHARES') * pl.col('ADJ_PRICE'))
+            .otherwise(pl.col('REPORTED_SHARES') * pl.col('UNADJ_PRICE'))
+            )
+    if source == SOURCE_STAKES:
+        return pl.col('ADJ_SHARES') * pl.col('ADJ_PRICE')
+
+    # Funds: market value of the report if the position cannot be priced
+    return (
+        pl.when((pl.col('ADJ_SHARES') != 0) & pl.col('ADJ_PRICE').is_not_null())
+        .then(pl.col('ADJ_SHARES') * pl.col('ADJ_PRICE'))
+        .otherwise(pl.col('MARKET_VALUE'))
+        )
+
+
+def _positive(source, measure):
+    # Positivity filter of the scheme scripts
+    if source == SOURCE_STAKES:
+        return pl.col('ADJ_SHARES') > 0
+    if source == SOURCE_FUNDS and measure == 'MCAP_HELD':
+        return pl.col('MARKET_VALUE') > 0
+    return pl.col('REPORTED_SHARES') > 0
+
+
+def _served_positions(observations, source, dates, window, reports, measure, own_sec_prices):
+    # Served observations of one source valued at the perspective date
+    served = serve_observations(observations.filter((pl.col('SOURCE') == source) &
+                                              _positive(source, measure)),
+                                dates, window, reports=reports)
+
+    if measure == 'MCAP_HELD':
+        served = prices_as_of(served, own_sec_prices)
+
+    return served.with_columns(_position_value(source, measure).alias(measure))
+
+
+def _funds_positions(observations, dates, measure, own_sec_prices):
+    # Sum of the latest report of every fund of the institution
+    funds = _served_positions(observations, SOURCE_FUNDS, dates, REPORT_WINDOW_MONTHS, True,
+                              measure, own_sec_prices)
+
+    funds = (
+        funds
+        .sort(SNAPSHOT_KEYS + ['FACTSET_FUND_ID', 'AS_OF_DATE'])
+        .unique(SNAPSHOT_KEYS + ['FACTSET_FUND_ID'], keep='last', maintain_order=True)
+        .group_by(SNAPSHOT_KEYS)
+        .agg(acc(measure).sum().alias(measure))
+        )
+
+    if measure == 'ADJ_SHARES_HELD':
+        funds = funds.filter(pl.col(measure) != 0)
+
+    return candidate_positions(funds, SOURCE_FUNDS, measure, keys=SNAPSHOT_KEYS)
+
+
+def _resolve(candidates, policy, scheme, measure):
+    # Winning position of every holder-security-date
+    return (
+        resolve_positions(pl.concat(candidates), policy, keys=SNAPSHOT_KEYS)
+        .select(SNAPSHOT_KEYS + [measure])
+        .with_columns(pl.lit(scheme).alias('SCHEME'))
+        )
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    SNAPSHOT
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def holdings_snapshot(factset_dir, dates, own_ent_inst, own_sec_cov, own_sec_prices=None,
+                      measure='MCAP_HELD'):
+    """
+    Positions of every holder-security at each of 'dates' (see
+    perspective_dates()) under schemes 1-4:
+
+        FSYM_ID | FACTSET_ENTITY_ID | PERSPECTIVE_DATE | <measure> | SCHEME
+
+    'factset_dir' holds the FactSet detail tables (see
+    scan_observations()). 'own_ent_inst' and 'own_sec_cov' are the
+    own_ent_institutions and own_sec_coverage_eq tables and
+    'own_sec_prices' the own_sec_prices_eq table (only needed for
+    measure='MCAP_HELD').
+    """
+
+    if measure not in MEASURES:
+        raise ValueError('measure must be one of %s, got %r' % (MEASURES, measure))
+    if measure == 'MCAP_HELD' and own_sec_prices is None:
+        raise ValueError('own_sec_prices is needed for MCAP_HELD')
+
+    dates = perspective_dates(dates)
+
+    # Dates an observation within the longest window can have
+    first = dates['PERSPECTIVE_DATE'].min()
+    first = (
+        pl.select(pl.lit(first).dt.offset_by('-%dmo' % WINDOW_MONTHS_GLOBAL)).item()
+        )
+    last = dates['PERSPECTIVE_DATE'].max()
+
+    # Holders and securities of each scheme
+    holder_13f = own_ent_inst.filter(pl.col('FDS_13F_FLAG') == 1)['FACTSET_ENTITY_ID']
+    non_holder_13f = own_ent_inst.filter(pl.col('FDS_13F_FLAG') == 0)['FACTSET_ENTITY_ID']
+    security_13f = own_sec_cov.filter(pl.col('FDS_13F_FLAG') == 1)['FSYM_ID']
+    security_ca_13f = own_sec_cov.filter(pl.col('FDS_13F_CA_FLAG') == 1)['FSYM_ID']
+    security_uksr = own_sec_cov.filter(pl.col('FDS_UKSR_FLAG') == 1)['FSYM_ID']
+    security_non_13f = (
+        own_sec_cov
+        .filter((pl.col('FDS_13F_FLAG') + pl.col('FDS_13F_CA_FLAG') + pl.col('FDS_UKSR_FLAG')) == 0)
+        ['FSYM_ID']
+        )
+    iso_country = own_sec_cov.select(['FSYM_ID', 'ISO_COUNTRY'])
+
+    observations = (
+        scan_observations(factset_dir, first, last)
+        .drop('date_q')
+        .collect()
+        )
+
+    snapshot = []
+
+    # Schemes 1 and 2: 13F or more recent stakes position, then (scheme 2)
+    # sum of funds
+    for scheme, securities, policy in [(1, security_13f, POLICY_SCHEME_1),
+                                       (2, security_ca_13f, POLICY_SCHEME_2)]:
+
+        positions = observations.filter(pl.col('FSYM_ID').is_in(securities) &
+                                  pl.col('FACTSET_ENTITY_ID').is_in(holder_13f))
+
+        candidates = [
+            candidate_positions(_served_positions(positions, source, dates, REPORT_WINDOW_MONTHS,
+                                                  True, measure, own_sec_prices),
+                                source, measure, date_col='AS_OF_DATE', keys=SNAPSHOT_KEYS)
+            for source in [SOURCE_13F, SOURCE_STAKES]
+            ]
+        if scheme == 2:
+            candidates.append(_funds_positions(positions, dates, measure, own_sec_prices))
+
+        snapshot.append(_resolve(candidates, policy, scheme, measure))
+
+    # Scheme 3: stakes position within the window of the country of the
+    # security, then sum of funds
+    positions = (
+        observations
+        .filter(pl.col('FSYM_ID').is_in(security_non_13f) &
+                pl.col('FACTSET_ENTITY_ID').is_in(non_holder_13f))
+        .join(iso_country, on='FSYM_ID', how='left')
+        )
+    candidates = [
+        candidate_positions(_served_positions(positions, SOURCE_STAKES, dates,
+                                              window_months('ISO_COUNTRY'), False,
+                                              measure, own_sec_prices),
+                            SOURCE_STAKES, measure, date_col='AS_OF_DATE', keys=SNAPSHOT_KEYS),
+        _funds_positions(positions, dates, measure, own_sec_prices)
+        ]
+    snapshot.append(_resolve(candidates, POLICY_SCHEME_3, 3, measure))
+
+    # Scheme 4: UKSR stakes position within 18 months, then sum of funds
+    positions = observations.filter(pl.col('FSYM_ID').is_in(security_uksr))
+    candidates = [
+        candidate_positions(_served_positions(positions.filter(pl.col('SOURCE_CODE')
+                                                               .is_in(SOURCE_CODES_UKSR)),
+                                              SOURCE_STAKES, dates, WINDOW_MONTHS_UKSR, False,
+                                              measure, own_sec_prices),
+                            SOURCE_STAKES, measure, date_col='AS_OF_DATE', keys=SNAPSHOT_KEYS),
+        _funds_positions(positions, dates, measure, own_sec_prices)
+        ]
+    snapshot.append(_resolve(candidates, POLICY_SCHEME_4, 4, measure))
+
+    return (
+        pl.concat(snapshot)
+        .sort(SNAPSHOT_KEYS)
+        )
+
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 5:
+        print('usage: python -m factset_ownership.snapshots <folder> <factset_dir> <measure> '
+              '<date> [<date> ...]')
+        sys.exit(1)
+
+    folder, factset_dir, measure = sys.argv[1:4]
+
+    own_ent_inst = read_table(os.path.join(factset_dir, 'own_ent_institutions.parquet'),
+                              columns=['FACTSET_ENTITY_ID', 'FDS_13F_FLAG'])
+    own_sec_cov = read_table(os.path.join(factset_dir, 'own_sec_coverage_eq.parquet'),
+                             columns=['FSYM_ID', 'ISO_COUNTRY', 'FDS_13F_FLAG',
+                                      'FDS_13F_CA_FLAG', 'FDS_UKSR_FLAG'])
+    own_sec_prices = None
+    if measure == 'MCAP_HELD':
+        own_sec_prices = read_table(os.path.join(factset_dir, 'own_sec_prices_eq.parquet'),
+                                    columns=['FSYM_ID', 'PRICE_DATE', 'ADJ_PRICE', 'UNADJ_PRICE'])
+
+    snapshot = holdings_snapshot(factset_dir, sys.argv[4:], own_ent_inst, own_sec_cov,
+                                 own_sec_prices, measure=measure)
+
+    to_storage(snapshot).write_parquet(os.path.join(folder, 'holdings_snapshot.parquet'))
+    print(snapshot.group_by(['PERSPECTIVE_DATE', 'SCHEME']).len().sort(['PERSPECTIVE_DATE',
+                                                                         'SCHEME']))
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Clustered copies of the final holdings for point queries
+
+The final holdings ('holdingsall_company_level', 'factset_mcap_holdings')
+are sorted by security or not sorted at all, so the portfolio history of
+one institution needs a scan of the whole table. write_store() writes a
+copy clustered by the institution
+
+    holdingsall_company_level_by_holder.parquet
+    holdingsall_company_level_by_holder_index.parquet
+
+The rows are sorted by FACTSET_ENTITY_ID, date_q and FSYM_ID and written
+in row groups of STORE_ROW_GROUP_SIZE rows. The index holds, for every
+FACTSET_ENTITY_ID, its first row and number of rows (and the range of row
+groups they span). get_portfolio() looks the institution up in the index
+and only reads its slice of the file, i.e. its row groups.
+
+The reverse query (who owns company X in quarter Q) uses a copy of
+'holdingsall_company_level' clustered by company
+
+    holdingsall_company_level_by_company.parquet
+    holdingsall_company_level_by_company_index.parquet
+
+sorted by COMPANY_ID, date_q and FACTSET_ENTITY_ID and indexed by
+(COMPANY_ID, date_q). get_holders() reads the rows of a batch of
+companies and quarters (contiguous ranges are read as one slice) and
+ownership_breakdown() sums their IO by company-quarter.
+"""
+
+
+import os
+import polars as pl
+
+from factset_ownership.frequency import frequency_name
+from factset_ownership.schemas import apply_schema, read_table, table_name
+from factset_ownership.decomposition import decompose
+
+
+# Rows per row group of the stores
+STORE_ROW_GROUP_SIZE = 100_000
+
+# Cluster key and order within the key of each store
+STORE_CLUSTERS = {
+    'holder': (['FACTSET_ENTITY_ID'], ['date_q', 'FSYM_ID']),
+    'company': (['COMPANY_ID', 'date_q'], ['FACTSET_ENTITY_ID', 'FSYM_ID']),
+    }
+
+# Indexes already read, by path (with the modification time of the file)
+_INDEXES = {}
+
+
+def store_path(folder, name, cluster):
+    """ Path of the store of 'name' clustered by 'cluster' """
+    return os.path.join(folder, frequency_name('%s_by_%s.parquet' % (name, cluster)))
+
+
+def store_index_path(folder, name, cluster):
+    """ Path of the index of the store """
+    return os.path.join(folder, frequency_name('%s_by_%s_index.parquet' % (name, cluster)))
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    BUILD
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def cluster_index(df, key, row_group_size=STORE_ROW_GROUP_SIZE):
+    """
+    'key' + FIRST_ROW, ROWS, FIRST_ROW_GROUP and LAST_ROW_GROUP of every
+    key of 'df' (sorted by 'key')
+    """
+
+    return (
+        df
+        .select(key)
+        .with_row_index('ROW')
+        .group_by(key, maintain_order=True)
+        .agg(pl.col('ROW').first().alias('FIRST_ROW'),
+             pl.len().alias('ROWS'))
+        .with_columns(
+            (pl.col('FIRST_ROW') // row_group_size).alias('FIRST_ROW_GROUP'),
+            ((pl.col('FIRST_ROW') + pl.col('ROWS') - 1) // row_group_size).alias('LAST_ROW_GROUP')
+            )
+        )
+
+
+def write_store(df, folder, name, cluster, table=None, row_group_size=STORE_ROW_GROUP_SIZE):
+    """
+    Write the holdings 'df' (DataFrame or LazyFrame) as the store of 'name'
+    clustered by 'cluster' and its index (replaces them). 'table' is the
+    registry table of the holdings (default: 'name').
+    """
+
+    key, order = STORE_CLUSTERS[cluster]
+    if isinstance(df, pl.LazyFrame):
+        df = df.collect()
+
+    order = [c for c in order if c in df.columns]
+    df = apply_schema(df, table or table_name(name)).sort(key + order).rechunk()
+
+    df.write_parquet(store_path(folder, name, cluster), row_group_size=row_group_size)
+    index = cluster_index(df, key, row_group_size)
+    index.write_parquet(store_index_path(folder, name, cluster))
+
+    print('%s by %s: %d rows, %d keys, %d row groups'
+          % (name, cluster, df.height, index.height, index['LAST_ROW_GROUP'].max() + 1))
+    return index
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    LOOKUPS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def store_index(folder, name, cluster):
+    """ Index of the store (read once per modification of the file) """
+
+    path = store_index_path(folder, name, cluster)
+    mtime = os.path.getmtime(path)
+    if path not in _INDEXES or _INDEXES[path][0] != mtime:
+        _INDEXES[path] = (mtime, read_table(path))
+    return _INDEXES[path][1]
+
+
+def row_ranges(matches):
+    """ (first row, rows) of the index rows 'matches', contiguous ranges merged """
+
+    ranges = []
+    for first, rows in matches.sort('FIRST_ROW').select(['FIRST_ROW', 'ROWS']).iter_rows():
+        if ranges and ranges[-1][0] + ranges[-1][1] == first:
+            ranges[-1][1] += rows
+        else:
+            ranges.append([first, rows])
+    return ranges
+
+
+def read_store_rows(folder, name, cluster, matches, table=None):
+    """ Rows of the store for the index rows 'matches' """
+
+    lf = apply_schema(pl.scan_parquet(store_path(folder, name, cluster)),
+                      table or table_name(name))
+    ranges = row_ranges(matches)
+    if not ranges:
+        return lf.head(0).collect()
+    return pl.concat([lf.slice(first, rows) for first, rows in ranges]).collect()
+
+
+def filter_quarters(df, quarters):
+    """ Rows of 'df' in 'quarters' (list of 'date_q' or (first, last) tuple) """
+
+    if quarters is None:
+        return df
+    if isinstance(quarters, tuple):
+        return df.filter(pl.col('date_q').is_between(quarters[0], quarters[1]))
+    return df.filter(pl.col('date_q').is_in(list(quarters)))
+
+
+def get_portfolio(folder, entity_id, quarters=None, name='holdingsall_company_level'):
+    """
+    Holdings of the institution 'entity_id' (FACTSET_ENTITY_ID) in the
+    store of 'name' clustered by holder, in 'quarters' (list of 'date_q'
+    or (first, last) tuple, default all), sorted by date_q and FSYM_ID
+    """
+
+    matches = store_index(folder, name, 'holder').filter(pl.col('FACTSET_ENTITY_ID') == entity_id)
+    return filter_quarters(read_store_rows(folder, name, 'holder', matches), quarters)
+
+
+def get_holders(folder, companies, quarters=None, name='holdingsall_company_level'):
+    """
+    Holdings of the companies 'companies' (COMPANY_ID or list of them) in
+    the store of 'name' clustered by company, in 'quarters' (list of
+    'date_q' or (first, last) tuple, default all), sorted by COMPANY_ID,
+    date_q and FACTSET_ENTITY_ID
+    """
+
+    if isinstance(companies, str):
+        companies = [companies]
+
+    matches = filter_quarters(store_index(folder, name, 'company')
+                              .filter(pl.col('COMPANY_ID').is_in(list(companies))),
+                              quarters)
+    return read_store_rows(folder, name, 'company', matches)
+
+
+def ownership_breakdown(holders, splits=None):
+    """
+    IO, MKTCAP_HELD and number of institutions (N_HOLDERS) of every
+    company-quarter of the holdings 'holders', plus the IO and MKTCAP_HELD
+    of every category of 'splits' ({split: {label: condition}}, see decompose())
+    """
+
+    return decompose(holders,
+                     splits or {},
+                     ['IO', 'MKTCAP_HELD'],
+                     aggs=[pl.col('FACTSET_ENTITY_ID').n_unique().alias('N_HOLDERS')]
+                     ).sort(['COMPANY_ID', 'date_q'])
+
+
+
+if __name__ == '__main__':
+
+    import sys
+
+    # python -m factset_ownership.stores <folder> <name> holder <FACTSET_ENTITY_ID>
+    # python -m factset_ownership.stores <folder> <name> company <COMPANY_ID> ...
+    if sys.argv[3] == 'holder':
+        print(get_portfolio(sys.argv[1], sys.argv[4], name=sys.argv[2]))
+    else:
+        holders = get_holders(sys.argv[1], sys.argv[4:], name=sys.argv[2])
+        print(holders)
+        print(ownership_breakdown(holders))
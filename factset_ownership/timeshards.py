@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Period-range sharding with a halo
+
+The imputation of parts 1 and 2 only looks back a bounded number of
+quarters (7 quarters of reports to fill a missing one), so the panel can
+be processed by contiguous ranges of 'date_q'. Each range gets a halo: the
+periods of lookback before its first period. With
+
+    set FACTSET_PERIOD_SHARDS=8
+    set FACTSET_PERIOD_WORKERS=2
+
+run_period_shards() splits the periods into 8 ranges, runs the stage on
+each range plus its halo (2 ranges at a time, in threads: Polars releases
+the GIL) and keeps only the rows of the range itself when it concatenates
+the outputs. The memory of a worker is bounded by the size of its range
+and not by the length of the history.
+
+Anything that needs the whole history (e.g. the last report of an
+institution, see imputation_fills(entity_max=...)) must be computed
+before the split and passed to the stage.
+
+The defaults (1 range, 1 worker) run the stage once on all the periods.
+"""
+
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import polars as pl
+
+from factset_ownership.frequency import periods, shift_period
+
+
+PERIOD_SHARDS = int(os.environ.get('FACTSET_PERIOD_SHARDS', '1'))
+PERIOD_WORKERS = int(os.environ.get('FACTSET_PERIOD_WORKERS', '1'))
+
+if PERIOD_SHARDS < 1 or PERIOD_WORKERS < 1:
+    raise ValueError('FACTSET_PERIOD_SHARDS and FACTSET_PERIOD_WORKERS must be at least 1')
+
+
+def period_shards(periods_pl, num_shards=None):
+    """
+    Split the periods of 'periods_pl' ('date_q') into 'num_shards'
+    contiguous ranges with about the same number of periods. Returns a
+    list of (first, last).
+    """
+
+    if num_shards is None:
+        num_shards = PERIOD_SHARDS
+
+    dates = periods_pl['date_q'].unique().sort().to_list()
+    num_shards = max(1, min(num_shards, len(dates)))
+
+    size, extra = divmod(len(dates), num_shards)
+    shards = []
+    start = 0
+    for k in range(num_shards):
+        end = start + size + (1 if k < extra else 0)
+        shards.append((dates[start], dates[end - 1]))
+        start = end
+    return shards
+
+
+def halo_start(first, halo_months):
+    """ First period of the halo of a range starting at 'first' """
+    return shift_period(first, -periods(halo_months))
+
+
+def run_period_shards(func, periods_pl, halo_months, num_shards=None, workers=None,
+                      date_col='date_q'):
+    """
+    Run func(first_halo, first, last) on every range of periods (see
+    period_shards()) and concatenate the rows of the outputs with
+    'date_col' within their range (the halo rows are dropped). 'func'
+    returns a DataFrame or a LazyFrame.
+
+    The ranges run in threads and not in processes: 'func' only builds a
+    Polars query and the query runs in the Rust thread pool of Polars,
+    which releases the GIL while it collects, reads or writes. The ranges
+    share that thread pool (POLARS_MAX_THREADS) and the inputs already in
+    memory, so 'workers' bounds how many ranges are in memory at the same
+    time rather than the number of cores used. A stage with Python
+    callbacks (map_elements, map_batches with a Python function) holds the
+    GIL and its ranges effectively run one at a time.
+    """
+
+    if workers is None:
+        workers = PERIOD_WORKERS
+
+    def run(shard):
+        first, last = shard
+        out = func(halo_start(first, halo_months), first, last)
+        if isinstance(out, pl.LazyFrame):
+            out = out.collect()
+        return out.filter(pl.col(date_col).is_between(first, last))
+
+    shards = period_shards(periods_pl, num_shards)
+    if len(shards) == 1 or workers == 1:
+        outputs = [run(shard) for shard in shards]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            outputs = list(pool.map(run, shards))
+
+    return pl.concat(outputs)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Largest holders of every company-quarter
+
+Reports that need the K largest institutional holders of a company used
+to sort the whole 'holdingsall_company_level' panel. top_holders() sums
+the positions of every institution in the company (the holdings are at
+the security level) and keeps the K largest institutions of every
+company-quarter with top_k_by() in the same group_by that computes the IO
+of the company, so nothing is sorted but the K rows of each company.
+
+    COMPANY_ID | date_q | RANK | FACTSET_ENTITY_ID | IO | MKTCAP_HELD |
+    IO_TOTAL | TOP_K_IO_SHARE
+
+TOP_K_IO_SHARE is the share of the IO of the company held by its K
+largest holders.
+"""
+
+
+import polars as pl
+
+from factset_ownership.precision import acc
+
+
+# Default number of holders and ranking measure
+TOP_K = 10
+TOP_K_BY = 'IO'
+
+
+def holder_positions(holdings, keys=None):
+    """ IO and MKTCAP_HELD of every institution in every 'keys' group (company-quarter) """
+
+    if keys is None:
+        keys = ['COMPANY_ID', 'date_q']
+
+    return (
+        holdings
+        .group_by(keys + ['FACTSET_ENTITY_ID'])
+        .agg(acc('IO').sum(), acc('MKTCAP_HELD').sum())
+        )
+
+
+def top_holders(holdings, k=TOP_K, by=TOP_K_BY, keys=None):
+    """
+    The 'k' largest institutions by 'by' ('IO' or 'MKTCAP_HELD') of every
+    'keys' group (company-quarter) of the security-level 'holdings', with
+    their RANK (1 = largest) and the share of the IO of the group they
+    hold. Works with DataFrames and LazyFrames.
+    """
+
+    if keys is None:
+        keys = ['COMPANY_ID', 'date_q']
+    if by not in ('IO', 'MKTCAP_HELD'):
+        raise ValueError("by must be 'IO' or 'MKTCAP_HELD', got %r" % by)
+
+    values = ['FACTSET_ENTITY_ID', 'IO', 'MKTCAP_HELD']
+
+    return (
+        holder_positions(holdings, keys)
+        .group_by(keys)
+        .agg(pl.col(values).top_k_by(by, k),
+             pl.col('IO').sum().alias('IO_TOTAL'))
+        .explode(values)
+        .sort(keys + [by], descending=[False] * len(keys) + [True])
+        .with_columns(
+            (pl.int_range(pl.len()).over(keys) + 1).cast(pl.Int16).alias('RANK'),
+            (pl.col('IO').sum().over(keys) / pl.col('IO_TOTAL')).alias('TOP_K_IO_SHARE')
+            )
+        .select(keys + ['RANK'] + values + ['IO_TOTAL', 'TOP_K_IO_SHARE'])
+        )
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming union of the scheme outputs
+
+The concatenate scripts read the four scheme outputs in full, concatenated
+them in memory and wrote one file. The duplicate checks were commented
+out because a unique() over all the rows was too expensive. write_union()
+scans the scheme outputs (or their shards), casts them to the registered
+dtypes of the table and streams them into a Parquet dataset partitioned by
+'date_q'
+
+    factset_mcap_holdings/date_q=200203/00000000.parquet
+    ...
+
+and into the single file the concatenate scripts always wrote
+(factset_mcap_holdings.parquet), which the existing readers expect.
+
+In the same pass it hashes the key (FSYM_ID, FACTSET_ENTITY_ID, date_q)
+of every row and counts the keys that are in more than one scheme (the
+schemes should not overlap) and the keys that are repeated within a
+scheme. Only the 64-bit hashes are grouped, not the keys themselves. The
+counts are saved next to the union (factset_mcap_holdings_overlap.csv).
+"""
+
+
+import os
+import shutil
+import polars as pl
+
+from factset_ownership.precision import to_storage
+from factset_ownership.frequency import frequency_name
+from factset_ownership.schemas import apply_schema
+from factset_ownership.shards import scan_shards
+
+
+# Key of a position in the scheme outputs
+UNION_KEY = ['FSYM_ID', 'FACTSET_ENTITY_ID', 'date_q']
+
+# Seed of the key hash
+UNION_SEED = 0
+
+
+def union_path(folder, name):
+    """ Directory of the union 'name' in 'folder' ('_monthly' suffix in monthly mode) """
+    return os.path.join(folder, frequency_name(name))
+
+
+def scan_outputs(paths, table):
+    """
+    Lazily stack the outputs 'paths' (or their shards) with the registered
+    dtypes of 'table'. Columns missing from an output are null.
+    """
+
+    lfs = [apply_schema(scan_shards(path), table) for path in paths]
+    return apply_schema(pl.concat(lfs, how='diagonal_relaxed'), table)
+
+
+def overlap_report(lf, key=None, by='SCHEME'):
+    """
+    One-row LazyFrame with the number of rows and keys of 'lf', the keys
+    in more than one 'by' group (OVERLAP_KEYS) and the keys repeated within
+    a group (DUPLICATE_KEYS). Keys are compared by their hash.
+    """
+
+    if key is None:
+        key = UNION_KEY
+
+    return (
+        lf
+        .select([pl.struct(key).hash(seed=UNION_SEED).alias('KEY_HASH'), by])
+        .group_by('KEY_HASH')
+        .agg([pl.len().alias('ROWS'),
+              pl.col(by).n_unique().alias('GROUPS')])
+        .select([pl.col('ROWS').sum().alias('ROWS'),
+                 pl.len().alias('KEYS'),
+                 (pl.col('GROUPS') > 1).sum().alias('OVERLAP_KEYS'),
+                 (pl.col('ROWS') > pl.col('GROUPS')).sum().alias('DUPLICATE_KEYS')])
+        )
+
+
+def write_union(paths, folder, name, table, key=None, partition_by='date_q',
+                export_parquet=True, strict=False):
+    """
+    Stream the union of the outputs 'paths' into the dataset 'name' in
+    'folder' partitioned by 'partition_by' (replaces it) and, with
+    'export_parquet', into the single file '<name>.parquet'. Return the
+    overlap_report() of the union, computed in the same pass and saved to
+    '<name>_overlap.csv'. With 'strict' overlapping or repeated keys raise
+    a ValueError (after the union is written).
+    """
+
+    path = union_path(folder, name)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+
+    lf = to_storage(scan_outputs(paths, table))
+
+    sinks = [lf.sink_parquet(pl.PartitionBy(path, key=partition_by), mkdir=True, lazy=True)]
+    if export_parquet:
+        sinks.append(lf.sink_parquet(union_path(folder, name + '.parquet'), lazy=True))
+    report = pl.collect_all(sinks + [overlap_report(lf, key)])[-1]
+
+    report.write_csv(union_path(folder, name + '_overlap.csv'))
+
+    row = report.row(0, named=True)
+    print('%s: %d rows, %d keys, %d keys in more than one scheme, %d keys repeated '
+          'within a scheme' % (name, row['ROWS'], row['KEYS'], row['OVERLAP_KEYS'],
+                               row['DUPLICATE_KEYS']))
+
+    if strict and (row['OVERLAP_KEYS'] > 0 or row['DUPLICATE_KEYS'] > 0):
+        raise ValueError('%s: %d keys in more than one scheme and %d keys repeated within '
+                         'a scheme' % (name, row['OVERLAP_KEYS'], row['DUPLICATE_KEYS']))
+
+    return report
+
+
+def scan_union(folder, name, table):
+    """ Lazily scan the dataset 'name' written by write_union() """
+    return apply_schema(pl.scan_parquet(union_path(folder, name), hive_partitioning=True),
+                        table)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Reference-universe artifacts
+
+'part_00_reference_universe.py' builds the universe of stocks and the
+company market cap once:
+
+    own_basic      universe of stocks (EQ/AD plus PF/PREFEQ) with the
+                   company and the termination quarter of each security
+    hmktcap        market cap at the company level in millions of USD
+    hmktcap_prc    hmktcap at the security level with the quarter-end
+                   adjusted price of the security
+
+The parts of the Ferreira & Matos methodology load these artifacts with
+load_artifact() instead of rebuilding them from prices and coverage.
+
+Every build writes 'universe_manifest.json' next to the artifacts with
+the UNIVERSE_VERSION, a fingerprint of the FactSet input files (name,
+size, modification time) and a content hash and row count of each
+artifact. load_artifact() refuses artifacts built from other inputs or
+with another version of the build, and artifacts whose row count (read
+from the file metadata) differs from the manifest. The content hash is
+only checked with verify_hash=True, as it reads the whole artifact.
+"""
+
+
+import os
+import json
+import hashlib
+import datetime
+import polars as pl
+
+from factset_ownership.frequency import FREQUENCY, frequency_name
+from factset_ownership.handoff import (handoff_path,
+                                       write_handoff,
+                                       read_handoff,
+                                       scan_handoff)
+
+
+# Bump when the definition of the universe changes
+UNIVERSE_VERSION = 1
+
+# Artifacts of the build
+UNIVERSE_ARTIFACTS = ['own_basic', 'hmktcap', 'hmktcap_prc']
+
+# FactSet tables the universe is built from
+UNIVERSE_INPUTS = [
+    'own_sec_coverage_eq.parquet',
+    'sym_coverage.parquet',
+    'own_sec_entity_eq.parquet',
+    'own_sec_prices_eq.parquet',
+    ]
+
+MANIFEST = 'universe_manifest.json'
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    FINGERPRINTS
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def inputs_fingerprint(factset_dir, inputs=None):
+    """ Fingerprint of the input files (name, size, modification time) """
+
+    if inputs is None:
+        inputs = UNIVERSE_INPUTS
+
+    h = hashlib.sha256(('version=%d' % UNIVERSE_VERSION).encode())
+    for name in sorted(inputs):
+        st = os.stat(os.path.join(factset_dir, name))
+        h.update(('%s|%d|%d' % (name, st.st_size, int(st.st_mtime))).encode())
+    return h.hexdigest()
+
+
+def content_hash(df):
+    """ Order-independent hash of the rows of a DataFrame """
+    return '%016x' % (df.hash_rows(seed=0).sum() & 0xFFFFFFFFFFFFFFFF)
+
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+#    WRITE / LOAD
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def write_artifacts(artifacts, folder, factset_dir, export_parquet=('hmktcap',)):
+    """
+    Write the artifacts (dict name -> DataFrame) as hand-off files in
+    'folder' and record them in the manifest. The artifacts named in
+    'export_parquet' are also exported as Parquet when the intermediate
+    format is IPC.
+    """
+
+    manifest = {
+        'UNIVERSE_VERSION': UNIVERSE_VERSION,
+        'INPUTS_FINGERPRINT': inputs_fingerprint(factset_dir),
+        'FREQUENCY': FREQUENCY,
+        'CREATED': datetime.datetime.now().isoformat(timespec='seconds'),
+        'ARTIFACTS': {},
+        }
+
+    for name, df in artifacts.items():
+        write_handoff(df, folder, name, export_parquet=name in export_parquet)
+        # Hash of the artifact as load_artifact() reads it (registered dtypes)
+        manifest['ARTIFACTS'][name] = {
+            'FILE': os.path.basename(handoff_path(folder, name)),
+            'ROWS': df.height,
+            'CONTENT_HASH': content_hash(read_handoff(folder, name)),
+            }
+
+    with open(os.path.join(folder, frequency_name(MANIFEST)), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    return manifest
+
+
+def read_manifest(folder):
+    """ Manifest of the last universe build in 'folder' """
+
+    path = os.path.join(folder, frequency_name(MANIFEST))
+    if not os.path.exists(path):
+        raise FileNotFoundError('%s not found, run part_00_reference_universe.py first' % path)
+    with open(path) as f:
+        return json.load(f)
+
+
+def check_artifact(folder, name, factset_dir=None, verify_hash=False):
+    """
+    Raise if the artifact 'name' is missing from the manifest, was built
+    by another UNIVERSE_VERSION or (if 'factset_dir' is given) from other
+    FactSet input files, or if its file does not have the ROWS of the
+    manifest. With 'verify_hash' the CONTENT_HASH of the file is also
+    checked (reads the whole artifact).
+    """
+
+    manifest = read_manifest(folder)
+
+    if name not in manifest['ARTIFACTS']:
+        raise ValueError('%s is not a universe artifact of %s' % (name, folder))
+
+    if manifest['UNIVERSE_VERSION'] != UNIVERSE_VERSION:
+        raise ValueError('%s was built with universe version %d (current %d), '
+                         'run part_00_reference_universe.py again'
+                         % (name, manifest['UNIVERSE_VERSION'], UNIVERSE_VERSION))
+
+    if factset_dir is not None and manifest['INPUTS_FINGERPRINT'] != inputs_fingerprint(factset_dir):
+        raise ValueError('%s was built from other FactSet files, '
+                         'run part_00_reference_universe.py again' % name)
+
+    entry = manifest['ARTIFACTS'][name]
+
+    # Row count from the file metadata (nothing is read)
+    rows = scan_handoff(folder, name).select(pl.len()).collect().item()
+    if rows != entry['ROWS']:
+        raise ValueError('%s has %d rows (%d in the manifest), '
+                         'run part_00_reference_universe.py again'
+                         % (name, rows, entry['ROWS']))
+
+    if verify_hash and content_hash(read_handoff(folder, name)) != entry['CONTENT_HASH']:
+        raise ValueError('%s does not match its content hash, '
+                         'run part_00_reference_universe.py again' % name)
+
+    return entry
+
+
+def load_artifact(folder, name, factset_dir=None, columns=None, verify_hash=False):
+    """ Check (see check_artifact()) and read a universe artifact """
+
+    check_artifact(folder, name, factset_dir=factset_dir, verify_hash=verify_hash)
+    return read_handoff(folder, name, columns=columns)
+
+
+def scan_artifact(folder, name, factset_dir=None, columns=None, verify_hash=False):
+    """ Lazy version of load_artifact() """
+
+    check_artifact(folder, name, factset_dir=factset_dir, verify_hash=verify_hash)
+    return scan_handoff(folder, name, columns=columns)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Staleness windows of the stakes-based positions
+
+The FactSet methodology compares the perspective date to the
+'AS_OF_DATE' of a stakes-based position and keeps the position if it is
+not older than
+
+    North-American traded securities (US & Canada)    18 months
+    UKSR securities                                   18 months
+    Global securities                                 21 months
+
+Schemes 3 and 4 used to approximate the window with forward_fill(limit=6
+or 7) over a dense holder-security-quarter grid, one pass for the North
+American securities and one for the global ones. Here
+
+    * window_quarters() lists, for every stakes observation, the
+      perspective quarters (months with FACTSET_FREQUENCY=monthly) it can
+      still cover, so the grid grows with the observations and not with
+      pairs x quarters;
+    * latest_within_window() picks, for every perspective quarter-end,
+      the latest observation with an 'AS_OF_DATE' on or before the
+      quarter-end (as-of join) and drops it if it is outside the window
+      of the row. The window is an expression, e.g. window_months() of
+      the 'ISO_COUNTRY' of the security.
+"""
+
+
+import polars as pl
+
+from factset_ownership.frequency import PERIOD_MONTHS, index_period
+
+
+# Windows in months
+WINDOW_MONTHS_NA = 18
+WINDOW_MONTHS_UKSR = 18
+WINDOW_MONTHS_GLOBAL = 21
+
+# North-American countries
+NA_COUNTRIES = ['US', 'CA']
+
+
+def quarter_end(date_q='date_q'):
+    """ Period-end date of an integer period 'date_q' (e.g. 200203) """
+
+    date_q = pl.col(date_q)
+    return pl.date(date_q // 100, date_q % 100, 1).dt.month_end()
+
+
+def window_start(period_end, offset):
+    """
+    First date of the window ending at the period-end date 'period_end'
+    ('offset' is e.g. '-18mo'). offset_by() keeps the day of the month
+    when it can (2021-06-30 - 18mo is 2019-12-30), so the result is moved
+    to the end of its month (2019-12-31).
+    """
+    return period_end.dt.offset_by(offset).dt.month_end()
+
+
+def window_months(iso_country='ISO_COUNTRY'):
+    """ Window in months of a security by its 'ISO_COUNTRY' """
+
+    return (
+        pl.when(pl.col(iso_country).cast(pl.String).is_in(NA_COUNTRIES))
+        .then(pl.lit(WINDOW_MONTHS_NA))
+        .otherwise(pl.lit(WINDOW_MONTHS_GLOBAL))
+        )
+
+
+def window_quarters(observations, max_months=WINDOW_MONTHS_GLOBAL,
+                    keys=['FSYM_ID', 'FACTSET_ENTITY_ID'], date_col='AS_OF_DATE'):
+    """
+    Perspective periods ('keys' + 'date_q') that an observation can
+    cover: from the period of 'date_col' to the last period-end within
+    'max_months'.
+    """
+
+    # Period index of the observation
+    pidx = (pl.col(date_col).dt.year() * 12 + pl.col(date_col).dt.month() - 1) // PERIOD_MONTHS
+
+    return (
+        observations
+        .select(list(keys) + [pl.col(date_col),
+                              pl.int_ranges(pidx, pidx + max_months // PERIOD_MONTHS + 2)
+                              .alias('PERIOD_IDX')])
+        .explode('PERIOD_IDX')
+        .with_columns(index_period().alias('date_q'))
+        .filter(window_start(quarter_end(), '-%dmo' % max_months) <= pl.col(date_col))
+        .select(list(keys) + ['date_q'])
+        .unique()
+        )
+
+
+def latest_within_window(perspective, observations, window,
+                         keys=['FSYM_ID', 'FACTSET_ENTITY_ID'], date_col='AS_OF_DATE'):
+    """
+    Join to every row of 'perspective' ('keys' + 'date_q') the latest
+    row of 'observations' ('keys' + 'date_col' + values) with 'date_col'
+    on or before the period-end of 'date_q' and not older than 'window'
+    months (int or expression evaluated on 'perspective'). The values of
+    the observation are null if there is none within the window.
+    """
+
+    if isinstance(window, int):
+        window = pl.lit(window)
+
+    value_cols = [c for c in observations.columns if c not in list(keys) + [date_col, 'date_q']]
+
+    joined = (
+        perspective
+        .with_columns(quarter_end().alias('PERSPECTIVE_DATE'),
+                      pl.format('-{}mo', window).alias('WINDOW'))
+        .sort('PERSPECTIVE_DATE')
+        .join_asof(observations.select(list(keys) + [date_col] + value_cols).sort(date_col),
+                   left_on='PERSPECTIVE_DATE',
+                   right_on=date_col,
+                   by=list(keys),
+                   strategy='backward',
+                   check_sortedness=False)
+        )
+
+    # Observation within the window of the row
+    in_window = pl.col(date_col) >= window_start(pl.col('PERSPECTIVE_DATE'), pl.col('WINDOW'))
+
+    return (
+        joined
+        .with_columns([pl.when(in_window).then(pl.col(c)).otherwise(None).alias(c)
+                       for c in value_cols + [date_col]])
+        .drop(['PERSPECTIVE_DATE', 'WINDOW'])
+        )